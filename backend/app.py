@@ -1,3 +1,4 @@
+import click
 from flask import Flask
 from flask_cors import CORS
 from pymongo import MongoClient
@@ -10,6 +11,11 @@ def create_app():
     app.config.from_object(Config)
     app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
 
+    from utils.json_provider import FastJSONProvider
+    from utils.compression import init_compression
+    app.json = FastJSONProvider(app)
+    init_compression(app)
+
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     # MongoDB connection
@@ -17,8 +23,9 @@ def create_app():
     app.db = client[Config.DB_NAME]
 
     # Create upload directories
-    for folder in ['videos', 'thumbnails', 'frames', 'masks']:
+    for folder in ['videos', 'thumbnails', 'frames', 'masks', 'incoming', 'renditions']:
         os.makedirs(os.path.join(Config.UPLOAD_FOLDER, folder), exist_ok=True)
+    os.makedirs(Config.EXPORT_FOLDER, exist_ok=True)
 
     # Register blueprints
     from routes.auth import auth_bp
@@ -30,6 +37,7 @@ def create_app():
     from routes.settings import settings_bp
     from routes.categories import categories_bp
     from routes.knowledge_base import knowledge_base_bp
+    from routes.jobs import jobs_bp
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(projects_bp, url_prefix='/api/projects')
@@ -40,12 +48,109 @@ def create_app():
     app.register_blueprint(settings_bp, url_prefix='/api/settings')
     app.register_blueprint(categories_bp, url_prefix='/api/categories')
     app.register_blueprint(knowledge_base_bp, url_prefix='/api/knowledge-base')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
 
     # Serve uploaded files
     @app.route('/uploads/<path:filename>')
     def serve_upload(filename):
-        from flask import send_from_directory
-        return send_from_directory(Config.UPLOAD_FOLDER, filename)
+        from utils.static_uploads import send_upload
+        return send_upload(filename)
+
+    @app.cli.command('migrate-masks')
+    def migrate_masks():
+        """Move inline region masks to uploads/masks."""
+        from utils.mask_store import migrate_inline_masks
+        count = migrate_inline_masks(app.db)
+        print(f'Migrated masks for {count} regions')
+
+    @app.cli.command('rebuild-kb-paths')
+    def rebuild_kb_paths_command():
+        """Recompute ancestor_ids for every knowledge-base node."""
+        from utils.kb_tree import rebuild_kb_paths
+        count = rebuild_kb_paths(app.db)
+        print(f'Updated ancestor paths for {count} KB nodes')
+
+    @app.cli.command('ingest-videos')
+    @click.option('--all', 'all_videos', is_flag=True, help='Re-ingest every video, not only pending or failed ones')
+    def ingest_videos_command(all_videos):
+        """Probe, index and thumbnail videos that were never ingested."""
+        from utils.ingest import start_ingest
+        from utils.purge import live
+        query = {} if all_videos else {'status': {'$nin': ['ready']}}
+        futures = [start_ingest(app.db, video) for video in app.db.videos.find(live(query))]
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                failed += 1
+        print(f'Ingested {len(futures) - failed} videos, {failed} failed')
+
+    @app.cli.command('dedupe-videos')
+    def dedupe_videos_command():
+        """Hash stored videos and merge identical files into shared blobs."""
+        from utils.video_blobs import dedupe_videos
+        attached, merged = dedupe_videos(app.db)
+        print(f'Attached {attached} videos to blobs, removed {merged} duplicate files')
+
+    @app.cli.command('purge-deleted')
+    def purge_deleted_command():
+        """Remove soft-deleted projects and videos with their data and files now."""
+        from utils.purge import purge_deleted
+        counts = purge_deleted(app.db)
+        print(', '.join(f'{n} {name}' for name, n in counts.items()) + ' purged')
+
+    @app.cli.command('build-renditions')
+    @click.option('--edit', is_flag=True, help='Also build the all-intra edit proxy')
+    @click.option('--force', is_flag=True, help='Re-encode renditions that already exist')
+    def build_renditions_command(edit, force):
+        """Encode playback renditions for ingested videos that lack them."""
+        from utils.purge import live
+        from utils.renditions import default_renditions, encode_renditions
+        names = ['proxy', 'edit'] if edit else default_renditions()
+        count = 0
+        for video in app.db.videos.find(live({'status': 'ready'})):
+            missing = [n for n in names if force or n not in (video.get('renditions') or {})]
+            if not missing:
+                continue
+            try:
+                encode_renditions(app.db, video, missing)
+                count += 1
+            except Exception as e:
+                print(f"  {video['_id']}: {e}")
+        print(f'Encoded renditions for {count} videos')
+
+    @app.cli.command('kb-import')
+    @click.argument('path')
+    @click.option('--mode', type=click.Choice(['merge', 'copy']), default='merge',
+                  help='merge: update nodes with the same kb_id; copy: always create new nodes')
+    def kb_import_command(path, mode):
+        """Import a KB JSON document (or .jsonl entries) into the knowledge base."""
+        import json
+        from utils.kb_io import KBImportError, import_entries, parse_document, parse_ndjson
+        from utils.versions import bump_kb_version
+        with open(path, 'rb') as f:
+            try:
+                entries = parse_ndjson(f) if path.endswith(('.jsonl', '.ndjson')) else parse_document(json.load(f))
+                result = import_entries(app.db, entries, mode)
+            except KBImportError as e:
+                for error in e.errors:
+                    print(f"  {error.get('key') or error.get('line')}: {error['error']}")
+                raise click.ClickException(str(e))
+        bump_kb_version(app.db, result.pop('node_ids'))
+        print(f"Created {result['created']}, updated {result['updated']} KB nodes")
+        for ref in result['unresolved']:
+            print(f"  unresolved {ref['field']} '{ref['ref']}' in {ref['key']}")
+
+    @app.cli.command('kb-export')
+    @click.argument('path')
+    def kb_export_command(path):
+        """Export the knowledge base as a KB JSON document (.jsonl for NDJSON)."""
+        from utils.kb_io import export_document, export_ndjson
+        chunks = export_ndjson if path.endswith(('.jsonl', '.ndjson')) else export_document
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(chunks(app.db))
+        print(f'Exported knowledge base to {path}')
 
     # Create indexes
     app.db.users.create_index('username', unique=True)
@@ -55,7 +160,40 @@ def create_app():
     app.db.video_segments.create_index('video_id')
     app.db.object_regions.create_index('segment_id')
     app.db.captions.create_index('segment_id')
+    app.db.captions.create_index('region_id')
     app.db.tags.create_index([('project_id', 1), ('name', 1)], unique=True)
+    # updated_at indexes back delta exports
+    app.db.videos.create_index([('project_id', 1), ('updated_at', 1)])
+    app.db.video_segments.create_index([('video_id', 1), ('updated_at', 1)])
+    app.db.object_regions.create_index([('video_id', 1), ('updated_at', 1)])
+    app.db.captions.create_index([('video_id', 1), ('updated_at', 1)])
+    from utils.jobs import ensure_job_indexes, start_job_runner
+    from utils.tombstones import ensure_tombstone_indexes
+    ensure_job_indexes(app.db)
+    start_job_runner(app)
+    ensure_tombstone_indexes(app.db)
+    from utils.upload_sessions import ensure_upload_indexes
+    ensure_upload_indexes(app.db)
+    from utils.ingest import ensure_ingest_indexes
+    ensure_ingest_indexes(app.db)
+    from utils.video_blobs import ensure_blob_indexes
+    ensure_blob_indexes(app.db)
+    from utils.mask_store import ensure_mask_indexes
+    from utils.purge import ensure_purge_indexes, purge_pending, queue_purge
+    ensure_mask_indexes(app.db)
+    ensure_purge_indexes(app.db)
+    from utils.kb_tree import ensure_kb_indexes, rebuild_kb_paths
+    ensure_kb_indexes(app.db)
+    # Backfill paths for nodes created before ancestor_ids existed
+    if app.db.knowledge_base.find_one({'ancestor_ids': {'$exists': False}}, {'_id': 1}):
+        rebuild_kb_paths(app.db)
+    from utils.export_jobs import prune_exports
+    prune_exports(app.db)
+    # Resume purging deletes left over from before a restart (a purge the
+    # previous process was running is replaced once its lease lapses)
+    if purge_pending(app.db):
+        with app.app_context():
+            queue_purge()
 
     return app
 
@@ -11,6 +11,34 @@ class Config:
     DB_NAME = os.environ.get('DB_NAME', 'annotator_tool')
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB
+    UPLOAD_CHUNK_MAX_MB = int(os.environ.get('UPLOAD_CHUNK_MAX_MB', 64))  # largest PATCH chunk of a resumable upload
+    UPLOAD_MAX_SIZE_GB = int(os.environ.get('UPLOAD_MAX_SIZE_GB', 20))  # largest video via resumable upload
+    UPLOADS_OFFLOAD = os.environ.get('UPLOADS_OFFLOAD', '')  # '', 'nginx' (X-Accel-Redirect) or 'sendfile' (X-Sendfile)
+    UPLOADS_ACCEL_PREFIX = os.environ.get('UPLOADS_ACCEL_PREFIX', '/_uploads/')  # internal nginx location
+    UPLOAD_SESSION_HOURS = int(os.environ.get('UPLOAD_SESSION_HOURS', 24))  # idle resumable uploads expire
     ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
     JWT_EXPIRATION_HOURS = 24
     DAM_SERVER_URL = os.environ.get('DAM_SERVER_URL', 'http://192.168.88.31:8688')
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 50))  # videos per export query batch
+    EXPORT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports')
+    EXPORT_ZSTD_LEVEL = int(os.environ.get('EXPORT_ZSTD_LEVEL', 10))
+    EXPORT_RETENTION_HOURS = int(os.environ.get('EXPORT_RETENTION_HOURS', 72))  # export archives and datasets are deleted after this long
+    PARQUET_ROW_GROUP_SIZE = int(os.environ.get('PARQUET_ROW_GROUP_SIZE', 50000))  # rows per row group
+    DATASET_SHARD_MB = int(os.environ.get('DATASET_SHARD_MB', 256))  # target tar shard size
+    DATASET_WORKERS = int(os.environ.get('DATASET_WORKERS', os.cpu_count() or 2))  # frame decoding processes
+    FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+    FFPROBE_BIN = os.environ.get('FFPROBE_BIN', 'ffprobe')
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))  # processes probing/thumbnailing uploads
+    SPRITE_INTERVAL = float(os.environ.get('SPRITE_INTERVAL', 2))  # seconds between timeline sprite tiles
+    FRAME_CACHE_MB = int(os.environ.get('FRAME_CACHE_MB', 256))  # decoded frames kept in memory per process
+    SHOT_CHUNK_SECONDS = int(os.environ.get('SHOT_CHUNK_SECONDS', 120))  # shot detection work unit
+    SHOT_DETECT_WORKERS = int(os.environ.get('SHOT_DETECT_WORKERS', os.cpu_count() or 2))  # decoding processes
+    PROXY_HEIGHT = int(os.environ.get('PROXY_HEIGHT', 720))  # playback proxy resolution (lines)
+    EDIT_PROXY = os.environ.get('EDIT_PROXY', '').lower() in ('1', 'true', 'yes')  # also build the all-intra edit proxy
+    EDIT_PROXY_HEIGHT = int(os.environ.get('EDIT_PROXY_HEIGHT', 540))
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # bytes; smaller responses are sent as-is
+    KB_SUGGEST_DIM = int(os.environ.get('KB_SUGGEST_DIM', 256))  # hashed TF-IDF vector size for KB suggestions
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # background job threads
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))  # jobs not heartbeated for this long count as abandoned
+    PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 500))  # documents removed per purge batch
+    PURGE_PAUSE_MS = int(os.environ.get('PURGE_PAUSE_MS', 100))  # pause between purge batches
@@ -1,30 +1,38 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, send_from_directory, stream_with_context
 from datetime import datetime, timezone
 from bson import ObjectId
 from config import Config
 from utils.auth_middleware import token_required
 from routes.settings import get_dam_url
+from utils.mask_store import read_mask_bytes
+from utils.exporter import (
+    iter_video_exports, iter_project_records, video_totals, dataset_info, json_chunks, jsonl_chunks,
+    build_project_delta, decode_cursor, parse_timestamp
+)
+from utils.fieldsets import Fieldset
+from utils.frame_cache import video_frames
+from utils.frames import FRAMES_PER_SEGMENT, pad_or_trim_frames, segment_frame_times
+from utils.jobs import enqueue_job, get_job, serialize_job
+from utils.purge import live
+from utils.dataset_shards import build_project_dataset
+from utils.export_cache import ExportCacheEntry
+from utils.export_jobs import (
+    ARCHIVE_FORMATS, DATA_FORMATS, MASK_FORMATS, archive_path, build_project_archive
+)
+from utils.segments import mark_video_modified
+from utils.tombstones import project_id_for_video, record_deletes
+from utils.versions import bump_video_version, project_version, video_version
 import base64
 import io
+import os
 import requests as http_requests
 import traceback
 
 annotations_bp = Blueprint('annotations', __name__)
 
-
-def _reset_video_approval_if_needed(video_id):
-    """Reset video review status if it was approved (content changed)."""
-    video = current_app.db.videos.find_one({'_id': video_id})
-    if video and video.get('review_status') == 'approved':
-        current_app.db.videos.update_one(
-            {'_id': video_id},
-            {'$set': {
-                'review_status': 'not_submitted',
-                'reviews': [],
-                'review_comment': 'Auto-reset: Content modified after approval',
-                'updated_at': datetime.now(timezone.utc)
-            }}
-        )
+# Sparse fieldset maps: response key -> document fields it is built from
+CAPTION_ALWAYS = ('_id', 'segment_id', 'video_id', 'region_id', 'created_by', 'created_at', 'updated_at')
+CAPTION_FIELDS = {'id': (), 'region_label': (), 'region_color': ()}
 
 
 # ============ CAPTIONS (Step 3) ============
@@ -33,18 +41,23 @@ def _reset_video_approval_if_needed(video_id):
 @token_required
 def get_segment_captions(segment_id):
     """Get all captions for a segment"""
+    fieldset = Fieldset.from_request()
     try:
-        captions = list(current_app.db.captions.find({'segment_id': ObjectId(segment_id)}))
+        captions = list(current_app.db.captions.find(
+            {'segment_id': ObjectId(segment_id)},
+            fieldset.projection(CAPTION_FIELDS, always=CAPTION_ALWAYS)
+        ))
     except Exception:
         return jsonify({'error': 'Invalid segment ID'}), 400
 
+    wants_region = fieldset.wants('region_label') or fieldset.wants('region_color')
     result = []
     for c in captions:
         region = None
-        if c.get('region_id'):
-            region = current_app.db.object_regions.find_one({'_id': c['region_id']})
+        if c.get('region_id') and wants_region:
+            region = current_app.db.object_regions.find_one({'_id': c['region_id']}, {'label': 1, 'color': 1})
 
-        result.append({
+        result.append(fieldset.apply({
             'id': str(c['_id']),
             'segment_id': str(c['segment_id']),
             'video_id': str(c['video_id']),
@@ -62,7 +75,7 @@ def get_segment_captions(segment_id):
             'created_by': str(c['created_by']),
             'created_at': c['created_at'].isoformat(),
             'updated_at': c.get('updated_at', c['created_at']).isoformat()
-        })
+        }))
 
     return jsonify(result)
 
@@ -71,18 +84,19 @@ def get_segment_captions(segment_id):
 @token_required
 def get_segment_caption(segment_id):
     """Get segment-level caption (region_id is None)"""
+    fieldset = Fieldset.from_request()
     try:
         caption = current_app.db.captions.find_one({
             'segment_id': ObjectId(segment_id),
             'region_id': None
-        })
+        }, fieldset.projection(CAPTION_FIELDS, always=CAPTION_ALWAYS))
     except Exception:
         return jsonify({'error': 'Invalid segment ID'}), 400
 
     if not caption:
         return jsonify(None)
 
-    return jsonify({
+    return jsonify(fieldset.apply({
         'id': str(caption['_id']),
         'segment_id': str(caption['segment_id']),
         'video_id': str(caption['video_id']),
@@ -95,22 +109,26 @@ def get_segment_caption(segment_id):
         'combined_caption_vi': caption.get('combined_caption_vi', ''),
         'created_at': caption['created_at'].isoformat(),
         'updated_at': caption.get('updated_at', caption['created_at']).isoformat()
-    })
+    }))
 
 
 @annotations_bp.route('/region/<region_id>', methods=['GET'])
 @token_required
 def get_region_caption(region_id):
     """Get caption for a specific region"""
+    fieldset = Fieldset.from_request()
     try:
-        caption = current_app.db.captions.find_one({'region_id': ObjectId(region_id)})
+        caption = current_app.db.captions.find_one(
+            {'region_id': ObjectId(region_id)},
+            fieldset.projection(CAPTION_FIELDS, always=CAPTION_ALWAYS)
+        )
     except Exception:
         return jsonify({'error': 'Invalid region ID'}), 400
 
     if not caption:
         return jsonify(None)
 
-    return jsonify({
+    return jsonify(fieldset.apply({
         'id': str(caption['_id']),
         'segment_id': str(caption['segment_id']),
         'video_id': str(caption['video_id']),
@@ -125,7 +143,7 @@ def get_region_caption(region_id):
         'combined_caption_vi': caption.get('combined_caption_vi', ''),
         'created_at': caption['created_at'].isoformat(),
         'updated_at': caption.get('updated_at', caption['created_at']).isoformat()
-    })
+    }))
 
 
 @annotations_bp.route('', methods=['POST'])
@@ -167,7 +185,7 @@ def create_caption():
         )
         
         # Reset video approval if was approved
-        _reset_video_approval_if_needed(ObjectId(data['video_id']))
+        mark_video_modified(current_app.db, ObjectId(data['video_id']))
         
         updated = current_app.db.captions.find_one({'_id': existing['_id']})
         return jsonify({
@@ -207,7 +225,7 @@ def create_caption():
     result = current_app.db.captions.insert_one(caption)
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(ObjectId(data['video_id']))
+    mark_video_modified(current_app.db, ObjectId(data['video_id']))
 
     return jsonify({
         'id': str(result.inserted_id),
@@ -264,7 +282,7 @@ def update_caption(caption_id):
     )
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(caption['video_id'])
+    mark_video_modified(current_app.db, caption['video_id'])
 
     updated = current_app.db.captions.find_one({'_id': ObjectId(caption_id)})
     return jsonify({
@@ -289,13 +307,18 @@ def update_caption(caption_id):
 @token_required
 def delete_caption(caption_id):
     try:
-        result = current_app.db.captions.delete_one({'_id': ObjectId(caption_id)})
+        caption = current_app.db.captions.find_one({'_id': ObjectId(caption_id)}, {'video_id': 1})
     except Exception:
         return jsonify({'error': 'Invalid caption ID'}), 400
 
-    if result.deleted_count == 0:
+    if not caption:
         return jsonify({'error': 'Caption not found'}), 404
 
+    record_deletes(current_app.db, 'captions', {'_id': caption['_id']},
+                   project_id_for_video(current_app.db, caption['video_id']))
+    current_app.db.captions.delete_one({'_id': caption['_id']})
+    bump_video_version(current_app.db, caption['video_id'])
+
     return jsonify({'message': 'Caption deleted successfully'})
 
 
@@ -357,9 +380,8 @@ def _make_rgba_image(frame_b64: str, mask_b64: str) -> str:
     )
     frame_img = Image.open(io.BytesIO(frame_data)).convert('RGB')
 
-    mask_data = base64.b64decode(
-        mask_b64.split(',')[-1] if ',' in mask_b64 else mask_b64
-    )
+    # Masks may be inline base64 or a /uploads/masks/ URL from the mask store
+    mask_data = read_mask_bytes(mask_b64)
     mask_img = Image.open(io.BytesIO(mask_data)).convert('L')
 
     # Safety: resize mask if still mismatched (frontend should handle this)
@@ -391,21 +413,20 @@ def _make_full_mask_rgba(frame_b64: str) -> str:
     return f"data:image/png;base64,{img_b64}"
 
 
-def _pad_or_trim_frames(frames: list, target: int = 8) -> list:
-    """
-    Ensure exactly `target` frames by duplicating the last frame or trimming.
-    This handles segments with < 8 or > 8 provided frames.
-    """
-    if len(frames) == 0:
+def _segment_frames(segment_id):
+    """The segment's caption frames decoded server-side, as data URLs ([] if unavailable)."""
+    try:
+        segment = current_app.db.video_segments.find_one({'_id': ObjectId(segment_id)})
+    except Exception:
         return []
-    if len(frames) >= target:
-        # Evenly sample target frames
-        step = len(frames) / target
-        return [frames[int(i * step)] for i in range(target)]
-    # Pad by repeating last frame
-    while len(frames) < target:
-        frames.append(frames[-1])
-    return frames
+    video = segment and current_app.db.videos.find_one(live({'_id': segment['video_id']}), {'filename': 1, 'fps': 1, 'duration': 1})
+    if not video:
+        return []
+    times = segment_frame_times(segment['start_time'], segment['end_time'])
+    return [
+        'data:image/jpeg;base64,' + base64.b64encode(data).decode('ascii')
+        for _, data in video_frames(current_app.db, video, times) if data
+    ]
 
 
 @annotations_bp.route('/generate-caption', methods=['POST'])
@@ -416,6 +437,7 @@ def generate_caption():
     Only 1 of the 8 frames carries the mask; the other 7 have zero-alpha.
     Accepts:
       - frames: list of 8 base64 frame images (evenly sampled from segment)
+      - segment_id: instead of frames, sample them on the server (frame cache)
       - mask_image: base64 of the object mask (for visual caption)
       - mask_frame_index: which frame (0-7) gets the mask (default 0)
       - caption_type: 'visual' | 'contextual'
@@ -424,14 +446,14 @@ def generate_caption():
     """
     data = request.get_json()
     caption_type = data.get('caption_type', 'visual')
-    frames = data.get('frames', [])
+    frames = data.get('frames') or (_segment_frames(data['segment_id']) if data.get('segment_id') else [])
     mask_image = data.get('mask_image', '')
 
     if not frames or len(frames) == 0:
         return jsonify({'error': 'frames (list of base64 images) is required'}), 400
 
     # Ensure exactly 8 frames
-    frames = _pad_or_trim_frames(frames, 8)
+    frames = pad_or_trim_frames(frames, FRAMES_PER_SEGMENT)
 
     try:
         if caption_type == 'visual':
@@ -478,19 +500,20 @@ def generate_caption_batch():
     Only 1 of the 8 frames carries the mask; the other 7 have zero-alpha.
     Accepts:
       - frames: list of 8 base64 frame images (evenly sampled from segment)
+      - segment_id: instead of frames, sample them on the server (frame cache)
       - mask_image: base64 of the object's segmented mask
       - mask_frame_index: which frame (0-7) gets the mask (default 0)
     Returns:
       - visual_caption, contextual_caption
     """
     data = request.get_json()
-    frames = data.get('frames', [])
+    frames = data.get('frames') or (_segment_frames(data['segment_id']) if data.get('segment_id') else [])
     mask_image = data.get('mask_image', '')
 
     if not frames or not mask_image:
         return jsonify({'error': 'frames and mask_image are required'}), 400
 
-    frames = _pad_or_trim_frames(frames, 8)
+    frames = pad_or_trim_frames(frames, FRAMES_PER_SEGMENT)
     results = {}
     errors = []
 
@@ -520,184 +543,259 @@ def generate_caption_batch():
 
 # ============ EXPORT ============
 
+EXPORT_MASK_MODES = ('inline', 'url', 'none')
+
+
 @annotations_bp.route('/export/video/<video_id>', methods=['GET'])
 @token_required
 def export_video_annotations(video_id):
     """Export all annotations for a single video in standard dataset format"""
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
     if not video:
         return jsonify({'error': 'Video not found'}), 404
 
-    video_data = _build_video_export(video)
-    
+    masks = request.args.get('masks', 'inline')
+    if masks not in EXPORT_MASK_MODES:
+        return jsonify({'error': f'masks must be one of: {", ".join(EXPORT_MASK_MODES)}'}), 400
+
     # Get project info
     project = None
     if video.get('project_id'):
-        project = current_app.db.projects.find_one({'_id': ObjectId(video['project_id'])})
-
-    export_data = {
-        'dataset_info': {
-            'name': project.get('name', 'Video Annotation Dataset') if project else 'Video Annotation Dataset',
-            'description': project.get('description', '') if project else '',
-            'version': '1.0',
-            'format': 'video_annotation_v1',
-            'export_date': datetime.utcnow().isoformat() + 'Z',
-            'total_videos': 1,
-            'total_segments': len(video_data['segments']),
-            'total_regions': sum(len(s['regions']) for s in video_data['segments']),
-            'languages': ['en', 'vi']
-        },
-        'videos': [video_data]
-    }
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(video['project_id'])}))
+
+    # The project name is part of dataset_info, so its version is part of the key
+    version = f'{video_version(video)}.{project_version(project) if project else 0}'
+    cache = ExportCacheEntry('video', video_id, masks, version)
+    not_modified = cache.not_modified()
+    if not_modified:
+        return not_modified
+    if cache.exists():
+        return cache.send('application/json')
+
+    video_data = next(iter_video_exports(current_app.db, [video], masks))
+
+    segments, regions, _ = video_totals(video_data)
+    info = dataset_info(
+        project or {'name': 'Video Annotation Dataset'}, 1, segments, regions
+    )
 
-    return jsonify(export_data)
+    cache.store(current_app.json.dumps({'dataset_info': info, 'videos': [video_data]}))
+    return cache.send('application/json')
 
 
 @annotations_bp.route('/export/project/<project_id>', methods=['GET'])
 @token_required
 def export_project_annotations(project_id):
-    """Export all annotations for an entire project in standard dataset format"""
+    """
+    Export all annotations for an entire project in standard dataset format.
+    Query params:
+      - stream: 'jsonl' (one record per line) or 'json' (chunked JSON document);
+        omit to build the whole document in one response
+      - masks: 'inline' (base64, default) | 'url' | 'none'
+    """
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
     if not project:
         return jsonify({'error': 'Project not found'}), 404
 
-    videos = list(current_app.db.videos.find({'project_id': ObjectId(project_id)}))
-
-    videos_data = []
-    total_segments = 0
-    total_regions = 0
-    total_captions = 0
-
-    for video in videos:
-        v = _build_video_export(video)
-        videos_data.append(v)
-        total_segments += len(v['segments'])
-        for seg in v['segments']:
-            total_regions += len(seg['regions'])
-            total_captions += sum(1 for r in seg['regions'] if r.get('captions', {}).get('en', {}).get('visual'))
-            if seg.get('segment_captions'):
-                total_captions += len(seg['segment_captions'])
-
-    # Subparts
-    subparts = list(current_app.db.subparts.find({'project_id': ObjectId(project_id)}).sort('order', 1))
-    subparts_data = []
-    for sp in subparts:
-        sp_videos = [str(v['_id']) for v in videos if str(v.get('subpart_id', '')) == str(sp['_id'])]
-        subparts_data.append({
-            'id': str(sp['_id']),
-            'name': sp.get('name', ''),
-            'description': sp.get('description', ''),
-            'order': sp.get('order', 0),
-            'video_ids': sp_videos
-        })
+    stream = request.args.get('stream', '').lower()
+    masks = request.args.get('masks', 'inline')
+    if masks not in EXPORT_MASK_MODES:
+        return jsonify({'error': f'masks must be one of: {", ".join(EXPORT_MASK_MODES)}'}), 400
+
+    # Both JSON forms share one cache file; JSONL has its own
+    variant = 'jsonl' if stream == 'jsonl' else 'json'
+    cache = ExportCacheEntry('project', project_id, f'{masks}-{variant}', project_version(project), variant)
+    not_modified = cache.not_modified()
+    if not_modified:
+        return not_modified
+
+    mimetype = 'application/x-ndjson' if stream == 'jsonl' else 'application/json'
+    filename = f'{project_id}.{stream}' if stream in ('json', 'jsonl') else None
+    if cache.exists():
+        return cache.send(mimetype, filename)
+
+    records = iter_project_records(current_app.db, project, masks)
+
+    if stream in ('json', 'jsonl'):
+        chunks = jsonl_chunks if stream == 'jsonl' else json_chunks
+        generator = cache.tee(chunks(records, current_app.json.dumps))
+        response = Response(
+            stream_with_context(generator),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        response.set_etag(cache.etag)
+        return response
 
-    export_data = {
-        'dataset_info': {
-            'name': project.get('name', ''),
-            'description': project.get('description', ''),
-            'version': '1.0',
-            'format': 'video_annotation_v1',
-            'export_date': datetime.utcnow().isoformat() + 'Z',
-            'total_videos': len(videos_data),
-            'total_segments': total_segments,
-            'total_regions': total_regions,
-            'total_captions': total_captions,
-            'languages': ['en', 'vi']
-        },
-        'project': {
-            'id': str(project['_id']),
-            'name': project.get('name', ''),
-            'description': project.get('description', ''),
-            'status': project.get('status', ''),
-            'subparts': subparts_data
-        },
-        'videos': videos_data
-    }
+    export_data = {'videos': []}
+    for kind, data in records:
+        if kind == 'video':
+            export_data['videos'].append(data)
+        else:
+            export_data[kind] = data
 
-    return jsonify(export_data)
-
-
-def _build_video_export(video):
-    """Build export data for a single video with all segments, regions, masks, captions."""
-    video_id = video['_id']
-
-    segments = list(current_app.db.video_segments.find(
-        {'video_id': video_id}
-    ).sort('order', 1))
-
-    segments_data = []
-    for seg in segments:
-        regions = list(current_app.db.object_regions.find({'segment_id': seg['_id']}))
-        regions_data = []
-
-        for r in regions:
-            caption = current_app.db.captions.find_one({'region_id': r['_id']})
-
-            region_data = {
-                'id': str(r['_id']),
-                'label': r.get('label', ''),
-                'color': r.get('color', ''),
-                'category': r.get('category_name', ''),
-                'frame_time': r['frame_time'],
-                'segmented_mask': r.get('segmented_mask', ''),
-                'captions': {
-                    'en': {
-                        'visual': caption.get('visual_caption', '') if caption else '',
-                        'knowledge': caption.get('knowledge_caption', '') if caption else '',
-                        'combined': caption.get('combined_caption', '') if caption else ''
-                    },
-                    'vi': {
-                        'visual': caption.get('visual_caption_vi', '') if caption else '',
-                        'knowledge': caption.get('knowledge_caption_vi', '') if caption else '',
-                        'combined': caption.get('combined_caption_vi', '') if caption else ''
-                    }
-                }
-            }
-            regions_data.append(region_data)
+    cache.store(current_app.json.dumps({
+        'dataset_info': export_data['dataset_info'],
+        'project': export_data['project'],
+        'videos': export_data['videos']
+    }))
+    return cache.send(mimetype)
 
-        # Segment-level captions
-        seg_captions = list(current_app.db.captions.find({
-            'segment_id': seg['_id'],
-            'region_id': None
-        }))
-        seg_captions_data = [{
-            'en': {
-                'contextual': c.get('contextual_caption', ''),
-                'knowledge': c.get('knowledge_caption', ''),
-                'combined': c.get('combined_caption', '')
-            },
-            'vi': {
-                'contextual': c.get('contextual_caption_vi', ''),
-                'knowledge': c.get('knowledge_caption_vi', ''),
-                'combined': c.get('combined_caption_vi', '')
-            }
-        } for c in seg_captions]
-
-        seg_data = {
-            'id': str(seg['_id']),
-            'name': seg.get('name', ''),
-            'start_time': seg['start_time'],
-            'end_time': seg['end_time'],
-            'duration': round(seg['end_time'] - seg['start_time'], 3),
-            'regions': regions_data,
-            'segment_captions': seg_captions_data
-        }
-        segments_data.append(seg_data)
-
-    return {
-        'id': str(video['_id']),
-        'filename': video.get('original_name', ''),
-        'duration': video.get('duration', 0),
-        'width': video.get('width', 0),
-        'height': video.get('height', 0),
-        'fps': video.get('fps', 0),
-        'segments': segments_data
-    }
+
+@annotations_bp.route('/export/project/<project_id>/delta', methods=['GET'])
+@token_required
+def export_project_delta(project_id):
+    """
+    Export only what changed in a project since a point in time.
+    Query params:
+      - cursor: dataset_info.cursor from a previous full or delta export
+      - since: ISO-8601 timestamp (used when no cursor is given)
+      - masks: 'inline' (default) | 'url' | 'none'
+    The response carries a new cursor for the next call.
+    """
+    try:
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
+    except Exception:
+        return jsonify({'error': 'Invalid project ID'}), 400
+
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+
+    masks = request.args.get('masks', 'inline')
+    if masks not in EXPORT_MASK_MODES:
+        return jsonify({'error': f'masks must be one of: {", ".join(EXPORT_MASK_MODES)}'}), 400
+
+    try:
+        if request.args.get('cursor'):
+            since = decode_cursor(request.args['cursor'])
+        elif request.args.get('since'):
+            since = parse_timestamp(request.args['since'])
+        else:
+            return jsonify({'error': 'cursor or since is required'}), 400
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or since timestamp'}), 400
+
+    return jsonify(build_project_delta(current_app.db, project, since, masks))
+
+
+@annotations_bp.route('/export/project/<project_id>', methods=['POST'])
+@token_required
+def enqueue_project_export(project_id):
+    """
+    Start a background export of a project into a compressed archive.
+    Body (optional): {"archive": "zip" | "tar.zst" | "none", "mask_format": "png" | "rle",
+                      "format": "json" | "parquet"}
+    "archive": "none" (parquet only) keeps the dataset as plain files,
+    listed in the job result and served by /export/jobs/<id>/files/<name>.
+    Returns the job; an identical export already in progress is reused.
+    """
+    try:
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}), {'_id': 1})
+    except Exception:
+        return jsonify({'error': 'Invalid project ID'}), 400
+
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    archive_format = data.get('archive', 'zip')
+    mask_format = data.get('mask_format', 'png')
+    data_format = data.get('format', 'json')
+    if archive_format not in ARCHIVE_FORMATS:
+        return jsonify({'error': f'archive must be one of: {", ".join(ARCHIVE_FORMATS)}'}), 400
+    if mask_format not in MASK_FORMATS:
+        return jsonify({'error': f'mask_format must be one of: {", ".join(MASK_FORMATS)}'}), 400
+    if data_format not in DATA_FORMATS:
+        return jsonify({'error': f'format must be one of: {", ".join(DATA_FORMATS)}'}), 400
+    if archive_format == 'none' and data_format != 'parquet':
+        return jsonify({'error': 'archive "none" is only available for the parquet format'}), 400
+    if data_format == 'parquet':
+        mask_format = 'rle'
+
+    job, created = enqueue_job(
+        'export_archive', f'{project_id}:{data_format}:{archive_format}:{mask_format}',
+        build_project_archive, project_id, archive_format, mask_format, data_format,
+        params={'project_id': project_id, 'format': data_format,
+                'archive': archive_format, 'mask_format': mask_format}
+    )
+    return jsonify(serialize_job(job)), 202 if created else 200
+
+
+@annotations_bp.route('/export/jobs/<job_id>/download', methods=['GET'])
+@token_required
+def download_export_archive(job_id):
+    """Download a finished export archive (supports HTTP Range for resuming)."""
+    job = get_job(job_id)
+    if not job or job['type'] != 'export_archive':
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f'Export is {job["status"]}', 'job': serialize_job(job)}), 409
+
+    if 'directory' in job['result']:
+        return jsonify({'error': 'Export is a directory; download its files from /files/<name>',
+                        'files': job['result']['files']}), 400
+
+    path = archive_path(job['result']['filename'])
+    if not os.path.exists(path):
+        return jsonify({'error': 'Export archive no longer available'}), 410
+
+    # conditional=True answers Range / If-Range / If-None-Match from the file
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=job['result']['filename'],
+        conditional=True,
+        etag=True
+    )
+
+
+
+@annotations_bp.route('/export/project/<project_id>/dataset', methods=['POST'])
+@token_required
+def enqueue_project_dataset(project_id):
+    """
+    Start (or resume) a training dataset export: WebDataset tar shards with
+    the 8 caption frames per segment, region masks and captions.
+    Shards finished by an earlier run with unchanged annotations are reused.
+    """
+    try:
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}), {'_id': 1})
+    except Exception:
+        return jsonify({'error': 'Invalid project ID'}), 400
+
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+
+    job, created = enqueue_job(
+        'export_dataset', project_id, build_project_dataset, project_id,
+        params={'project_id': project_id}
+    )
+    return jsonify(serialize_job(job)), 202 if created else 200
+
+
+@annotations_bp.route('/export/jobs/<job_id>/files/<path:name>', methods=['GET'])
+@token_required
+def download_dataset_file(job_id, name):
+    """Download a file of a finished dataset or uncompressed Parquet export."""
+    job = get_job(job_id)
+    if not job or job['type'] not in ('export_dataset', 'export_archive'):
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f'Export is {job["status"]}', 'job': serialize_job(job)}), 409
+
+    if 'directory' not in job['result']:
+        return jsonify({'error': 'Export job not found'}), 404
+
+    directory = os.path.join(Config.EXPORT_FOLDER, job['result']['directory'])
+    return send_from_directory(directory, name, as_attachment=True, conditional=True, etag=True)
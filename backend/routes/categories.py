@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timezone
 from bson import ObjectId
 from utils.auth_middleware import token_required
+from utils.purge import live
+from utils.versions import bump_video_versions
 
 categories_bp = Blueprint('categories', __name__)
 
@@ -40,7 +42,7 @@ def create_category(project_id):
         return jsonify({'error': 'Category name is required'}), 400
 
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
@@ -121,9 +123,11 @@ def delete_category(category_id):
         return jsonify({'error': 'Category not found'}), 404
 
     # Clear category from regions that reference it
+    video_ids = current_app.db.object_regions.distinct('video_id', {'category_id': ObjectId(category_id)})
     current_app.db.object_regions.update_many(
         {'category_id': ObjectId(category_id)},
-        {'$set': {'category_id': None, 'category_name': ''}}
+        {'$set': {'category_id': None, 'category_name': '', 'updated_at': datetime.now(timezone.utc)}}
     )
+    bump_video_versions(current_app.db, video_ids)
 
     return jsonify({'message': 'Category deleted successfully'})
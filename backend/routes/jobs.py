@@ -0,0 +1,15 @@
+from flask import Blueprint, jsonify
+from utils.auth_middleware import token_required
+from utils.jobs import get_job, serialize_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@token_required
+def get_job_status(job_id):
+    """Get status and progress of a background job."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_job(job))
@@ -1,17 +1,34 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from bson import ObjectId
 from datetime import datetime, timezone
-import re
+import threading
 from utils.auth_middleware import token_required
+from utils.conditional import conditional_get
+from utils.versions import bump_kb_version, kb_version
+from utils.kb_io import (
+    IMPORT_MODES, KBImportError, export_document, export_ndjson, generate_kb_id,
+    import_entries, parse_document, parse_ndjson
+)
+from utils.kb_search import search_kb
+from utils.kb_vectors import suggest_kb_nodes
+from utils.kb_tree import (
+    ancestor_path, copy_subtree, delete_node, delete_subtree, descendant_ids, move_node
+)
+from utils.fieldsets import Fieldset
 
 knowledge_base_bp = Blueprint('knowledge_base', __name__)
 
+# Sparse fieldset maps: response key -> document fields it is built from
+KB_NODE_ALWAYS = ('_id', 'kb_id', 'name', 'parent_id')
+KB_NODE_FIELDS = {'id': (), 'children': ('children_ids',)}
 
-def generate_kb_id(name):
-    """Generate a unique kb_id from name"""
-    # Convert to lowercase, replace spaces with underscores, remove special chars
-    kb_id = re.sub(r'[^a-z0-9_]', '', name.lower().replace(' ', '_'))
-    return kb_id
+# Serialized full tree, rebuilt when the KB version changes
+_tree_snapshot = None
+_tree_lock = threading.Lock()
+
+# Composed context per node, valid for one KB version
+CONTEXT_CACHE_SIZE = 10000
+_context_cache = {'version': None, 'entries': {}}
 
 
 def serialize_kb_node(node):
@@ -30,73 +47,281 @@ def serialize_kb_node(node):
         'visual_cues_vi': node.get('visual_cues_vi', ''),
         'related_kb_ids': [str(rid) for rid in node.get('related_kb_ids', [])],
         'tags': node.get('tags', []),
+        'attributes': node.get('attributes', {}),
         'created_at': node['created_at'].isoformat() if node.get('created_at') else None,
         'updated_at': node['updated_at'].isoformat() if node.get('updated_at') else None
     }
 
 
 def get_ancestors(node_id, db):
-    """Get all ancestors of a node from root to parent"""
-    ancestors = []
-    current_id = node_id
-    visited = set()
-    
-    while current_id and str(current_id) not in visited:
-        visited.add(str(current_id))
-        node = db.knowledge_base.find_one({'_id': ObjectId(current_id) if isinstance(current_id, str) else current_id})
-        if not node:
-            break
-        if node.get('parent_id'):
-            parent = db.knowledge_base.find_one({'_id': node['parent_id']})
-            if parent:
-                ancestors.insert(0, serialize_kb_node(parent))
-            current_id = node.get('parent_id')
-        else:
-            break
-    
-    return ancestors
+    """Get all ancestors of a node from root to parent (one query via ancestor_ids)"""
+    node = db.knowledge_base.find_one(
+        {'_id': ObjectId(node_id) if isinstance(node_id, str) else node_id}, {'ancestor_ids': 1}
+    )
+    if not node or not node.get('ancestor_ids'):
+        return []
+    by_id = {a['_id']: a for a in db.knowledge_base.find({'_id': {'$in': node['ancestor_ids']}})}
+    return [serialize_kb_node(by_id[aid]) for aid in node['ancestor_ids'] if aid in by_id]
+
+
+def _build_node_context(node, ancestors):
+    """Node data with ancestors/full paths plus its (context_en, context_vi) lines."""
+    node_data = serialize_kb_node(node)
+    node_data['ancestors'] = ancestors
+
+    # Build full path name
+    path_names_en = [a['name'] for a in ancestors] + [node['name']]
+    path_names_vi = [a.get('name_vi') or a['name'] for a in ancestors] + [node.get('name_vi') or node['name']]
+    node_data['full_path'] = ' > '.join(path_names_en)
+    node_data['full_path_vi'] = ' > '.join(path_names_vi)
+
+    # Build context text for caption generation
+    # Collect descriptions from ancestors down to current node
+    context_en = []
+    context_vi = []
+
+    for ancestor in ancestors:
+        if ancestor.get('description'):
+            context_en.append(f"{ancestor['name']}: {ancestor['description']}")
+        if ancestor.get('description_vi') or ancestor.get('description'):
+            vi_desc = ancestor.get('description_vi') or ancestor.get('description', '')
+            vi_name = ancestor.get('name_vi') or ancestor['name']
+            context_vi.append(f"{vi_name}: {vi_desc}")
+
+    # Add current node's full info
+    node_context_en = node['name']
+    if node.get('description'):
+        node_context_en += f": {node['description']}"
+    if node.get('visual_cues'):
+        node_context_en += f" (Visual cues: {node['visual_cues']})"
+    context_en.append(node_context_en)
+
+    node_context_vi = node.get('name_vi') or node['name']
+    if node.get('description_vi') or node.get('description'):
+        node_context_vi += f": {node.get('description_vi') or node.get('description', '')}"
+    if node.get('visual_cues_vi') or node.get('visual_cues'):
+        node_context_vi += f" (Đặc điểm nhận dạng: {node.get('visual_cues_vi') or node.get('visual_cues', '')})"
+    context_vi.append(node_context_vi)
+
+    return node_data, ' → '.join(context_en), ' → '.join(context_vi)
+
+
+def _resolve_contexts(db, node_ids):
+    """Context entries for ``node_ids`` (ObjectIds), cached per KB version.
+
+    Cache misses are resolved with a single aggregation that joins each
+    node's ``ancestor_ids``.
+    """
+    global _context_cache
+    version = kb_version(db)
+    cache = _context_cache
+    if cache['version'] != version or len(cache['entries']) > CONTEXT_CACHE_SIZE:
+        cache = _context_cache = {'version': version, 'entries': {}}
+    entries = cache['entries']
+
+    missing = list({nid for nid in node_ids if nid not in entries})
+    if missing:
+        for node in db.knowledge_base.aggregate([
+            {'$match': {'_id': {'$in': missing}}},
+            {'$lookup': {
+                'from': 'knowledge_base', 'localField': 'ancestor_ids',
+                'foreignField': '_id', 'as': 'ancestor_docs'
+            }}
+        ]):
+            by_id = {a['_id']: a for a in node.pop('ancestor_docs')}
+            ancestors = [serialize_kb_node(by_id[aid]) for aid in node.get('ancestor_ids', []) if aid in by_id]
+            entries[node['_id']] = _build_node_context(node, ancestors)
+    return [entries[nid] for nid in node_ids if nid in entries]
 
 
 def build_tree(nodes, parent_id=None):
-    """Build hierarchical tree from flat list of nodes"""
-    tree = []
+    """Build hierarchical tree from flat list of nodes.
+
+    One pass builds a parent -> children index, so this is O(n); children
+    keep the order of ``nodes``. Nodes whose parent is missing are left out.
+    """
+    serialized = {}
+    children_of = {}
     for node in nodes:
-        node_parent = str(node['parent_id']) if node.get('parent_id') else None
-        if node_parent == parent_id:
-            children = build_tree(nodes, str(node['_id']))
-            node_data = serialize_kb_node(node)
-            node_data['children'] = children
-            tree.append(node_data)
-    return tree
+        node_data = serialize_kb_node(node)
+        node_data['children'] = []
+        serialized[node_data['id']] = node_data
+        children_of.setdefault(node_data['parent_id'], []).append(node_data)
+
+    for node_id, node_data in serialized.items():
+        node_data['children'] = children_of.get(node_id, [])
+    return children_of.get(parent_id, [])
+
+
+def _cached_tree():
+    """Full tree for the current KB version, built at most once per version."""
+    global _tree_snapshot
+    version = kb_version(current_app.db)
+    snapshot = _tree_snapshot
+    if snapshot and snapshot['version'] == version:
+        return snapshot
+    with _tree_lock:
+        if _tree_snapshot and _tree_snapshot['version'] == version:
+            return _tree_snapshot
+        nodes = list(current_app.db.knowledge_base.find({}).sort('name', 1))
+        tree = build_tree(nodes, None)
+        # Replaced as a whole so readers never see a half-built snapshot
+        _tree_snapshot = {
+            'version': version,
+            'tree': tree,
+            'body': current_app.json.response(tree).get_data()
+        }
+        return _tree_snapshot
+
+
+def _kb_version():
+    return kb_version(current_app.db)
+
+
+def _apply_tree(fieldset, tree):
+    """Apply a sparse fieldset to every level of a KB tree."""
+    if fieldset.is_full:
+        return tree
+    result = []
+    for node in tree:
+        children = node.get('children', [])
+        node_data = fieldset.apply(node)
+        node_data['children'] = _apply_tree(fieldset, children)
+        result.append(node_data)
+    return result
 
 
 # ==================== GET ALL KB NODES ====================
 @knowledge_base_bp.route('', methods=['GET'])
 @token_required
+@conditional_get(_kb_version)
 def get_all_kb_nodes():
-    """Get all KB nodes, optionally as tree structure"""
+    """
+    Get all KB nodes, optionally as tree structure.
+    Query params:
+      - tree: 'true' for the hierarchy (ignored when searching)
+      - search: ranked search over names, kb_id, tags and descriptions;
+        ``offset``/``limit`` page the results, X-Total-Count has the total
+      - type: only nodes of this type
+    """
     as_tree = request.args.get('tree', 'false').lower() == 'true'
     search = request.args.get('search', '').strip()
     node_type = request.args.get('type', '').strip()
+    fieldset = Fieldset.from_request()
     
-    query = {}
     if search:
-        query['$or'] = [
-            {'name': {'$regex': search, '$options': 'i'}},
-            {'kb_id': {'$regex': search, '$options': 'i'}},
-            {'tags': {'$regex': search, '$options': 'i'}}
-        ]
+        # Ranked, diacritic-insensitive search from the in-process index
+        offset, limit = _page_args()
+        nodes, total = search_kb(current_app.db, search, node_type, offset, limit)
+        response = jsonify([fieldset.apply(serialize_kb_node(n)) for n in nodes])
+        response.headers['X-Total-Count'] = str(total)
+        return response
+
+    query = {}
     if node_type:
         query['type'] = node_type
+
+    if as_tree and not node_type:
+        tree = _cached_tree()
+        if fieldset.is_full:
+            return current_app.response_class(tree['body'], mimetype='application/json')
+        return jsonify(_apply_tree(fieldset, tree['tree']))
     
-    nodes = list(current_app.db.knowledge_base.find(query).sort('name', 1))
+    nodes = list(current_app.db.knowledge_base.find(
+        query, fieldset.projection(KB_NODE_FIELDS, always=KB_NODE_ALWAYS)
+    ).sort('name', 1))
     
-    if as_tree and not search:
+    if as_tree:
         # Return hierarchical structure
-        return jsonify(build_tree(nodes, None))
+        return jsonify(_apply_tree(fieldset, build_tree(nodes, None)))
     else:
         # Return flat list
-        return jsonify([serialize_kb_node(n) for n in nodes])
+        return jsonify([fieldset.apply(serialize_kb_node(n)) for n in nodes])
+
+
+def _page_args(default_limit=None, max_limit=200):
+    """(offset, limit) from the query string; limit None means all."""
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = request.args.get('limit')
+        limit = min(max(int(limit), 1), max_limit) if limit else default_limit
+    except ValueError:
+        return 0, default_limit
+    return offset, limit
+
+
+# ==================== AUTOCOMPLETE ====================
+@knowledge_base_bp.route('/autocomplete', methods=['GET'])
+@token_required
+def autocomplete_kb_nodes():
+    """Typeahead suggestions: ?q=<text>&type=&limit=10"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify([])
+    offset, limit = _page_args(default_limit=10, max_limit=50)
+    nodes, _ = search_kb(current_app.db, q, request.args.get('type', '').strip(), offset, limit)
+    return jsonify([{
+        'id': str(n['_id']),
+        'kb_id': n['kb_id'],
+        'name': n['name'],
+        'name_vi': n.get('name_vi', ''),
+        'type': n.get('type', 'concept'),
+        'parent_id': str(n['parent_id']) if n.get('parent_id') else None
+    } for n in nodes])
+
+
+# ==================== SUGGEST FROM CAPTIONS ====================
+SUGGEST_CAPTION_FIELDS = (
+    'visual_caption', 'contextual_caption', 'visual_caption_vi', 'contextual_caption_vi'
+)
+
+
+@knowledge_base_bp.route('/suggest', methods=['POST'])
+@token_required
+def suggest_kb_for_caption():
+    """
+    Rank KB nodes for caption text.
+    Body: text and/or region_id / segment_id (their visual and contextual
+    captions are used), optional type and k (default 10).
+    """
+    data = request.get_json(silent=True) or {}
+    texts = [data.get('text') or '']
+    
+    caption_query = None
+    try:
+        if data.get('region_id'):
+            caption_query = {'region_id': ObjectId(data['region_id'])}
+        elif data.get('segment_id'):
+            caption_query = {'segment_id': ObjectId(data['segment_id']), 'region_id': None}
+    except Exception:
+        return jsonify({'error': 'Invalid region_id or segment_id'}), 400
+    if caption_query:
+        caption = current_app.db.captions.find_one(caption_query) or {}
+        texts += [caption.get(field) or '' for field in SUGGEST_CAPTION_FIELDS]
+    
+    text = ' '.join(t for t in texts if t)
+    if not text.strip():
+        return jsonify([])
+    
+    try:
+        k = min(max(int(data.get('k', 10)), 1), 50)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'k must be an integer'}), 400
+    
+    ranked = suggest_kb_nodes(current_app.db, text, k, data.get('type') or None)
+    nodes = {n['_id']: n for n in current_app.db.knowledge_base.find(
+        {'_id': {'$in': [node_id for node_id, _ in ranked]}},
+        {'kb_id': 1, 'name': 1, 'name_vi': 1, 'type': 1, 'parent_id': 1}
+    )}
+    return jsonify([{
+        'id': str(node_id),
+        'kb_id': nodes[node_id]['kb_id'],
+        'name': nodes[node_id]['name'],
+        'name_vi': nodes[node_id].get('name_vi', ''),
+        'type': nodes[node_id].get('type', 'concept'),
+        'parent_id': str(nodes[node_id]['parent_id']) if nodes[node_id].get('parent_id') else None,
+        'score': round(score, 4)
+    } for node_id, score in ranked if node_id in nodes])
 
 
 # ==================== GET SINGLE KB NODE ====================
@@ -104,16 +329,18 @@ def get_all_kb_nodes():
 @token_required
 def get_kb_node(node_id):
     """Get a single KB node by ID"""
+    fieldset = Fieldset.from_request()
+    projection = fieldset.projection(KB_NODE_FIELDS, always=KB_NODE_ALWAYS)
     try:
-        node = current_app.db.knowledge_base.find_one({'_id': ObjectId(node_id)})
+        node = current_app.db.knowledge_base.find_one({'_id': ObjectId(node_id)}, projection)
     except Exception:
         # Try to find by kb_id
-        node = current_app.db.knowledge_base.find_one({'kb_id': node_id})
+        node = current_app.db.knowledge_base.find_one({'kb_id': node_id}, projection)
     
     if not node:
         return jsonify({'error': 'KB node not found'}), 404
     
-    return jsonify(serialize_kb_node(node))
+    return jsonify(fieldset.apply(serialize_kb_node(node)))
 
 
 # ==================== CREATE KB NODE ====================
@@ -157,6 +384,7 @@ def create_kb_node():
         'name': data['name'],
         'type': data.get('type', 'concept'),
         'parent_id': parent_id,
+        'ancestor_ids': ancestor_path(current_app.db, parent_id),
         'children_ids': [],
         'description': data.get('description', ''),
         'visual_cues': data.get('visual_cues', ''),
@@ -175,6 +403,7 @@ def create_kb_node():
             {'_id': parent_id},
             {'$push': {'children_ids': result.inserted_id}}
         )
+    bump_kb_version(current_app.db, [result.inserted_id])
     
     return jsonify(serialize_kb_node(node)), 201
 
@@ -225,29 +454,22 @@ def update_kb_node(node_id):
     # Handle parent change
     if 'parent_id' in data:
         old_parent_id = node.get('parent_id')
-        new_parent_id = ObjectId(data['parent_id']) if data['parent_id'] else None
+        try:
+            new_parent_id = ObjectId(data['parent_id']) if data['parent_id'] else None
+        except Exception:
+            return jsonify({'error': 'Invalid parent_id'}), 400
+
+        if new_parent_id and (new_parent_id == node['_id'] or new_parent_id in descendant_ids(current_app.db, node['_id'])):
+            return jsonify({'error': 'Cannot move a node under itself or its descendants'}), 400
         
         if old_parent_id != new_parent_id:
-            # Remove from old parent's children
-            if old_parent_id:
-                current_app.db.knowledge_base.update_one(
-                    {'_id': old_parent_id},
-                    {'$pull': {'children_ids': node['_id']}}
-                )
-            
-            # Add to new parent's children
-            if new_parent_id:
-                current_app.db.knowledge_base.update_one(
-                    {'_id': new_parent_id},
-                    {'$push': {'children_ids': node['_id']}}
-                )
-            
-            update_data['parent_id'] = new_parent_id
+            move_node(current_app.db, node, new_parent_id)
     
     current_app.db.knowledge_base.update_one(
         {'_id': ObjectId(node_id)},
         {'$set': update_data}
     )
+    bump_kb_version(current_app.db, [node['_id']])
     
     updated_node = current_app.db.knowledge_base.find_one({'_id': ObjectId(node_id)})
     return jsonify(serialize_kb_node(updated_node))
@@ -268,46 +490,98 @@ def delete_kb_node(node_id):
     
     recursive = request.args.get('recursive', 'false').lower() == 'true'
     
-    def delete_node_and_children(nid):
-        """Recursively delete node and its children"""
-        n = current_app.db.knowledge_base.find_one({'_id': nid})
-        if n:
-            for child_id in n.get('children_ids', []):
-                delete_node_and_children(child_id)
-            current_app.db.knowledge_base.delete_one({'_id': nid})
-    
     if recursive:
-        delete_node_and_children(ObjectId(node_id))
+        deleted_ids = delete_subtree(current_app.db, node)
     else:
-        # Move children to parent
-        parent_id = node.get('parent_id')
-        for child_id in node.get('children_ids', []):
-            current_app.db.knowledge_base.update_one(
-                {'_id': child_id},
-                {'$set': {'parent_id': parent_id}}
-            )
-            if parent_id:
-                current_app.db.knowledge_base.update_one(
-                    {'_id': parent_id},
-                    {'$push': {'children_ids': child_id}}
-                )
-        
-        current_app.db.knowledge_base.delete_one({'_id': ObjectId(node_id)})
+        # Children move up to the deleted node's parent
+        delete_node(current_app.db, node)
+        deleted_ids = [node['_id']]
+    bump_kb_version(current_app.db, deleted_ids)
     
-    # Remove from parent's children_ids
-    if node.get('parent_id'):
-        current_app.db.knowledge_base.update_one(
-            {'_id': node['parent_id']},
-            {'$pull': {'children_ids': ObjectId(node_id)}}
-        )
+    return jsonify({'message': 'KB node deleted successfully'})
+
+
+# ==================== COPY KB SUBTREE ====================
+@knowledge_base_bp.route('/<node_id>/copy', methods=['POST'])
+@token_required
+def copy_kb_node(node_id):
+    """Copy a KB node with its whole subtree (body: parent_id, defaults to the same parent)"""
+    try:
+        node = current_app.db.knowledge_base.find_one({'_id': ObjectId(node_id)})
+    except Exception:
+        return jsonify({'error': 'Invalid node ID'}), 400
     
-    # Remove from any related_kb_ids
-    current_app.db.knowledge_base.update_many(
-        {'related_kb_ids': ObjectId(node_id)},
-        {'$pull': {'related_kb_ids': ObjectId(node_id)}}
-    )
+    if not node:
+        return jsonify({'error': 'KB node not found'}), 404
     
-    return jsonify({'message': 'KB node deleted successfully'})
+    data = request.get_json(silent=True) or {}
+    parent_id = node.get('parent_id')
+    if 'parent_id' in data:
+        try:
+            parent_id = ObjectId(data['parent_id']) if data['parent_id'] else None
+        except Exception:
+            return jsonify({'error': 'Invalid parent_id'}), 400
+        if parent_id and not current_app.db.knowledge_base.find_one({'_id': parent_id}, {'_id': 1}):
+            return jsonify({'error': 'Parent node not found'}), 404
+    
+    copy = copy_subtree(current_app.db, node, parent_id)
+    bump_kb_version(current_app.db, [copy['_id']] + descendant_ids(current_app.db, copy['_id']))
+    
+    return jsonify(serialize_kb_node(copy)), 201
+
+
+# ==================== BULK IMPORT / EXPORT ====================
+@knowledge_base_bp.route('/import', methods=['POST'])
+@token_required
+def import_kb():
+    """
+    Bulk import KB entries.
+    Body: a KB JSON document ({"objects": {...}, "people": {...}, ...}) or,
+    with Content-Type application/x-ndjson, one {"section", "key", ...} per line.
+    Query params:
+      - mode: 'merge' (default) updates nodes with the same kb_id,
+              'copy' always creates nodes with fresh kb_ids
+    """
+    mode = request.args.get('mode', 'merge')
+    if mode not in IMPORT_MODES:
+        return jsonify({'error': f'mode must be one of: {", ".join(IMPORT_MODES)}'}), 400
+    
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            entries = parse_ndjson(iter(request.stream.readline, b''))
+        else:
+            doc = request.get_json(silent=True)
+            if doc is None:
+                return jsonify({'error': 'Request body must be a KB JSON document'}), 400
+            entries = parse_document(doc)
+        result = import_entries(current_app.db, entries, mode)
+    except KBImportError as e:
+        return jsonify({'error': 'Invalid KB import', 'details': e.errors}), 400
+    
+    node_ids = result.pop('node_ids')
+    if node_ids:
+        bump_kb_version(current_app.db, node_ids)
+    return jsonify(result)
+
+
+@knowledge_base_bp.route('/export', methods=['GET'])
+@token_required
+@conditional_get(_kb_version)
+def export_kb():
+    """Stream the whole KB as a KB JSON document (?format=jsonl for NDJSON)"""
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'jsonl'):
+        return jsonify({'error': 'format must be one of: json, jsonl'}), 400
+    
+    chunks = export_ndjson if fmt == 'jsonl' else export_document
+    return Response(
+        stream_with_context(chunks(current_app.db)),
+        mimetype='application/x-ndjson' if fmt == 'jsonl' else 'application/json',
+        headers={
+            'Content-Disposition': f'attachment; filename="knowledge_base.{fmt}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 
 # ==================== GET KB TYPES ====================
@@ -347,6 +621,7 @@ def quick_create_kb_node():
         'name': data['name'],
         'type': data.get('type', 'concept'),
         'parent_id': None,
+        'ancestor_ids': [],
         'children_ids': [],
         'description': data.get('description', ''),
         'visual_cues': data.get('visual_cues', ''),
@@ -358,6 +633,7 @@ def quick_create_kb_node():
     
     result = current_app.db.knowledge_base.insert_one(node)
     node['_id'] = result.inserted_id
+    bump_kb_version(current_app.db, [result.inserted_id])
     
     return jsonify(serialize_kb_node(node)), 201
 
@@ -378,63 +654,20 @@ def get_kb_context():
     if not node_ids:
         return jsonify({'nodes': [], 'context_text': '', 'context_text_vi': ''})
     
-    results = []
-    context_parts_en = []
-    context_parts_vi = []
-    
+    ids = []
     for node_id in node_ids:
         try:
-            node = current_app.db.knowledge_base.find_one({'_id': ObjectId(node_id)})
+            ids.append(ObjectId(node_id))
         except Exception:
             continue
-            
-        if not node:
-            continue
-        
-        node_data = serialize_kb_node(node)
-        
-        # Get ancestors (from root to parent)
-        ancestors = get_ancestors(node_id, current_app.db)
-        node_data['ancestors'] = ancestors
-        
-        # Build full path name
-        path_names_en = [a['name'] for a in ancestors] + [node['name']]
-        path_names_vi = [a.get('name_vi') or a['name'] for a in ancestors] + [node.get('name_vi') or node['name']]
-        node_data['full_path'] = ' > '.join(path_names_en)
-        node_data['full_path_vi'] = ' > '.join(path_names_vi)
-        
+
+    results = []
+    context_parts_en = []
+    context_parts_vi = []
+    for node_data, context_en, context_vi in _resolve_contexts(current_app.db, ids):
         results.append(node_data)
-        
-        # Build context text for caption generation
-        # Collect descriptions from ancestors down to current node
-        context_en = []
-        context_vi = []
-        
-        for ancestor in ancestors:
-            if ancestor.get('description'):
-                context_en.append(f"{ancestor['name']}: {ancestor['description']}")
-            if ancestor.get('description_vi') or ancestor.get('description'):
-                vi_desc = ancestor.get('description_vi') or ancestor.get('description', '')
-                vi_name = ancestor.get('name_vi') or ancestor['name']
-                context_vi.append(f"{vi_name}: {vi_desc}")
-        
-        # Add current node's full info
-        node_context_en = node['name']
-        if node.get('description'):
-            node_context_en += f": {node['description']}"
-        if node.get('visual_cues'):
-            node_context_en += f" (Visual cues: {node['visual_cues']})"
-        context_en.append(node_context_en)
-        
-        node_context_vi = node.get('name_vi') or node['name']
-        if node.get('description_vi') or node.get('description'):
-            node_context_vi += f": {node.get('description_vi') or node.get('description', '')}"
-        if node.get('visual_cues_vi') or node.get('visual_cues'):
-            node_context_vi += f" (Đặc điểm nhận dạng: {node.get('visual_cues_vi') or node.get('visual_cues', '')})"
-        context_vi.append(node_context_vi)
-        
-        context_parts_en.append(' → '.join(context_en))
-        context_parts_vi.append(' → '.join(context_vi))
+        context_parts_en.append(context_en)
+        context_parts_vi.append(context_vi)
     
     return jsonify({
         'nodes': results,
@@ -2,9 +2,24 @@ from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timezone
 from bson import ObjectId
 from utils.auth_middleware import token_required
+from utils.conditional import conditional_get, document_version
+from utils.fieldsets import Fieldset
+from utils.purge import live, queue_purge, soft_delete_project
+from utils.versions import bump_project_version
 
 projects_bp = Blueprint('projects', __name__)
 
+# Sparse fieldset maps: response key -> document fields it is built from
+PROJECT_ALWAYS = ('_id', 'name', 'created_by', 'created_at')
+PROJECT_FIELDS = {
+    'id': (),
+    'subpart_count': (),
+    'video_count': (),
+    'creator_name': (),
+    'subparts': (),
+    'videos': (),
+}
+
 
 def serialize_project(project):
     return {
@@ -62,9 +77,11 @@ def create_project():
 def get_projects():
     user_id = request.current_user['_id']
     role = request.current_user.get('role', 'annotator')
+    fieldset = Fieldset.from_request()
+    projection = fieldset.projection(PROJECT_FIELDS, always=PROJECT_ALWAYS)
 
     if role == 'admin':
-        projects = list(current_app.db.projects.find())
+        projects = list(current_app.db.projects.find(live(), projection))
     else:
         # Get projects where user is creator, assigned to a subpart, or reviewer
         assigned_subparts = current_app.db.subparts.find({
@@ -75,33 +92,41 @@ def get_projects():
         })
         assigned_project_ids = list(set(s['project_id'] for s in assigned_subparts))
 
-        projects = list(current_app.db.projects.find({
+        projects = list(current_app.db.projects.find(live({
             '$or': [
                 {'created_by': user_id},
                 {'_id': {'$in': assigned_project_ids}}
             ]
-        }))
+        }), projection))
 
     result = []
     for p in projects:
         proj_data = serialize_project(p)
         # Count subparts and videos
-        proj_data['subpart_count'] = current_app.db.subparts.count_documents({'project_id': p['_id']})
-        proj_data['video_count'] = current_app.db.videos.count_documents({'project_id': p['_id']})
+        if fieldset.wants('subpart_count'):
+            proj_data['subpart_count'] = current_app.db.subparts.count_documents({'project_id': p['_id']})
+        if fieldset.wants('video_count'):
+            proj_data['video_count'] = current_app.db.videos.count_documents(live({'project_id': p['_id']}))
         # Get creator info
-        creator = current_app.db.users.find_one({'_id': p['created_by']}, {'password_hash': 0})
-        if creator:
-            proj_data['creator_name'] = creator.get('full_name') or creator['username']
-        result.append(proj_data)
+        if fieldset.wants('creator_name'):
+            creator = current_app.db.users.find_one({'_id': p['created_by']}, {'full_name': 1, 'username': 1})
+            if creator:
+                proj_data['creator_name'] = creator.get('full_name') or creator['username']
+        result.append(fieldset.apply(proj_data))
 
     return jsonify(result)
 
 
 @projects_bp.route('/<project_id>', methods=['GET'])
 @token_required
+@conditional_get(lambda project_id: document_version('projects', project_id))
 def get_project(project_id):
+    fieldset = Fieldset.from_request()
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(
+            live({'_id': ObjectId(project_id)}),
+            fieldset.projection(PROJECT_FIELDS, always=PROJECT_ALWAYS)
+        )
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
@@ -111,7 +136,9 @@ def get_project(project_id):
     proj_data = serialize_project(project)
 
     # Get subparts with user details (sorted by created_at descending - newest first)
-    subparts = list(current_app.db.subparts.find({'project_id': ObjectId(project_id)}).sort('created_at', -1))
+    subparts = []
+    if fieldset.wants('subparts'):
+        subparts = list(current_app.db.subparts.find({'project_id': ObjectId(project_id)}).sort('created_at', -1))
     proj_data['subparts'] = []
     for sp in subparts:
         sp_data = serialize_subpart(sp)
@@ -126,7 +153,7 @@ def get_project(project_id):
                     'full_name': user.get('full_name', ''),
                     'avatar_color': user.get('avatar_color', '#4A90D9')
                 })
-        sp_data['video_count'] = current_app.db.videos.count_documents({'subpart_id': ObjectId(sp['_id'])})
+        sp_data['video_count'] = current_app.db.videos.count_documents(live({'subpart_id': ObjectId(sp['_id'])}))
         # Get reviewer details (legacy single reviewer)
         if sp.get('reviewer'):
             reviewer = current_app.db.users.find_one({'_id': sp['reviewer']}, {'password_hash': 0})
@@ -152,7 +179,12 @@ def get_project(project_id):
         proj_data['subparts'].append(sp_data)
 
     # Get videos
-    videos = list(current_app.db.videos.find({'project_id': ObjectId(project_id)}))
+    videos = []
+    if fieldset.wants('videos'):
+        videos = current_app.db.videos.find(live({'project_id': ObjectId(project_id)}), {
+            'filename': 1, 'original_name': 1, 'duration': 1, 'status': 1,
+            'subpart_id': 1, 'uploaded_by': 1, 'created_at': 1
+        })
     proj_data['videos'] = []
     for v in videos:
         proj_data['videos'].append({
@@ -166,7 +198,7 @@ def get_project(project_id):
             'created_at': v['created_at'].isoformat()
         })
 
-    return jsonify(proj_data)
+    return jsonify(fieldset.apply(proj_data))
 
 
 @projects_bp.route('/<project_id>', methods=['PUT'])
@@ -174,7 +206,7 @@ def get_project(project_id):
 def update_project(project_id):
     data = request.get_json()
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
@@ -192,7 +224,7 @@ def update_project(project_id):
 
     current_app.db.projects.update_one(
         {'_id': ObjectId(project_id)},
-        {'$set': update_fields}
+        {'$set': update_fields, '$inc': {'content_version': 1}}
     )
 
     updated = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
@@ -203,23 +235,16 @@ def update_project(project_id):
 @token_required
 def delete_project(project_id):
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
     if not project:
         return jsonify({'error': 'Project not found'}), 404
 
-    # Delete all related data
-    video_ids = [v['_id'] for v in current_app.db.videos.find({'project_id': ObjectId(project_id)})]
-    segment_ids = [s['_id'] for s in current_app.db.video_segments.find({'video_id': {'$in': video_ids}})]
-
-    current_app.db.captions.delete_many({'segment_id': {'$in': segment_ids}})
-    current_app.db.object_regions.delete_many({'segment_id': {'$in': segment_ids}})
-    current_app.db.video_segments.delete_many({'video_id': {'$in': video_ids}})
-    current_app.db.videos.delete_many({'project_id': ObjectId(project_id)})
-    current_app.db.subparts.delete_many({'project_id': ObjectId(project_id)})
-    current_app.db.projects.delete_one({'_id': ObjectId(project_id)})
+    # Hidden now with its videos; related data and files are removed in the background
+    soft_delete_project(current_app.db, project)
+    queue_purge()
 
     return jsonify({'message': 'Project deleted successfully'})
 
@@ -234,7 +259,7 @@ def create_subpart(project_id):
         return jsonify({'error': 'Subpart name is required'}), 400
 
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
@@ -278,6 +303,7 @@ def create_subpart(project_id):
 
     result = current_app.db.subparts.insert_one(subpart)
     subpart['_id'] = result.inserted_id
+    bump_project_version(current_app.db, ObjectId(project_id))
 
     return jsonify(serialize_subpart(subpart)), 201
 
@@ -319,6 +345,12 @@ def update_subpart(project_id, subpart_id):
         {'_id': ObjectId(subpart_id)},
         {'$set': update_fields}
     )
+    # Video responses embed the subpart's reviewers: change their ETags too
+    current_app.db.videos.update_many(
+        {'subpart_id': ObjectId(subpart_id)},
+        {'$inc': {'content_version': 1}}
+    )
+    bump_project_version(current_app.db, ObjectId(project_id))
 
     updated = current_app.db.subparts.find_one({'_id': ObjectId(subpart_id)})
     return jsonify(serialize_subpart(updated))
@@ -341,7 +373,9 @@ def delete_subpart(project_id, subpart_id):
     # Update videos that belonged to this subpart
     current_app.db.videos.update_many(
         {'subpart_id': ObjectId(subpart_id)},
-        {'$unset': {'subpart_id': ''}}
+        {'$unset': {'subpart_id': ''}, '$set': {'updated_at': datetime.now(timezone.utc)},
+         '$inc': {'content_version': 1}}
     )
+    bump_project_version(current_app.db, ObjectId(project_id))
 
     return jsonify({'message': 'Subpart deleted successfully'})
@@ -1,3 +1,4 @@
+import math
 import os
 import uuid
 import base64
@@ -10,53 +11,85 @@ from datetime import datetime, timezone
 from bson import ObjectId
 from config import Config
 from utils.auth_middleware import token_required
+from utils.conditional import conditional_get, document_version
 from routes.settings import get_dam_url
+from utils.mask_store import (
+    MASK_FIELDS, externalize_fields, region_mask_refs, region_mask_url, remove_unreferenced_masks,
+    restore_masks
+)
+from utils.fieldsets import Fieldset
+from utils.frame_cache import video_frames
+from utils.jobs import enqueue_job, serialize_job
+from utils.purge import live
+from utils.segments import mark_video_modified, write_segments_batch
+from utils.shot_detection import DEFAULT_MIN_SHOT, DEFAULT_THRESHOLD, build_shot_segments
+from utils.tombstones import project_id_for_video, record_deletes
 
 segments_bp = Blueprint('segments', __name__)
 
+# Sparse fieldset maps: response key -> document fields it is built from.
+# *_ALWAYS fields are cheap and read unconditionally by the serializers.
+SEGMENT_ALWAYS = ('_id', 'video_id', 'start_time', 'end_time', 'created_at')
+SEGMENT_FIELDS = {'id': (), 'regions': ()}
 
-def _reset_video_approval_if_needed(video_id):
-    """Reset video review status if it was approved (content changed)."""
-    video = current_app.db.videos.find_one({'_id': video_id})
-    if video and video.get('review_status') == 'approved':
-        current_app.db.videos.update_one(
-            {'_id': video_id},
-            {'$set': {
-                'review_status': 'not_submitted',
-                'reviews': [],
-                'review_comment': 'Auto-reset: Content modified after approval',
-                'updated_at': datetime.now(timezone.utc)
-            }}
-        )
+SEGMENT_REGION_ALWAYS = ('_id', 'frame_time')
+SEGMENT_REGION_FIELDS = {
+    'id': (),
+    'segmented_mask_url': ('segmented_mask_ref',),
+    'has_caption': (),
+}
+
+REGION_ALWAYS = ('_id', 'segment_id', 'video_id', 'frame_time', 'created_at')
+REGION_FIELDS = {
+    'id': (),
+    'segmented_mask': ('segmented_mask', 'segmented_mask_ref'),
+    'caption': (),
+}
+
+CAPTION_FIELDS = (
+    'visual_caption', 'contextual_caption', 'knowledge_caption', 'combined_caption',
+    'visual_caption_vi', 'contextual_caption_vi', 'knowledge_caption_vi', 'combined_caption_vi'
+)
 
 
 # ============ VIDEO SEGMENTS (Step 1: Cut & Split) ============
 
 @segments_bp.route('/video/<video_id>', methods=['GET'])
 @token_required
+@conditional_get(lambda video_id: document_version('videos', video_id))
 def get_video_segments(video_id):
+    fieldset = Fieldset.from_request()
     try:
         segments = list(current_app.db.video_segments.find(
-            {'video_id': ObjectId(video_id)}
+            {'video_id': ObjectId(video_id)},
+            fieldset.projection(SEGMENT_FIELDS, always=SEGMENT_ALWAYS)
         ).sort('order', 1))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
+    region_fieldset = fieldset.sub('regions')
     result = []
     for seg in segments:
-        regions = list(current_app.db.object_regions.find({'segment_id': seg['_id']}))
         regions_data = []
-        for r in regions:
-            captions = current_app.db.captions.find_one({'region_id': r['_id']})
-            regions_data.append({
-                'id': str(r['_id']),
-                'frame_time': r['frame_time'],
-                'label': r.get('label', ''),
-                'color': r.get('color', '#FF0000'),
-                'has_caption': captions is not None
-            })
-
-        result.append({
+        if fieldset.wants('regions'):
+            regions = current_app.db.object_regions.find(
+                {'segment_id': seg['_id']},
+                region_fieldset.projection(SEGMENT_REGION_FIELDS, always=SEGMENT_REGION_ALWAYS)
+            )
+            for r in regions:
+                captions = None
+                if region_fieldset.wants('has_caption'):
+                    captions = current_app.db.captions.find_one({'region_id': r['_id']}, {'_id': 1})
+                regions_data.append({
+                    'id': str(r['_id']),
+                    'frame_time': r['frame_time'],
+                    'label': r.get('label', ''),
+                    'color': r.get('color', '#FF0000'),
+                    'segmented_mask_url': region_mask_url(r),
+                    'has_caption': captions is not None
+                })
+
+        result.append(fieldset.apply({
             'id': str(seg['_id']),
             'video_id': str(seg['video_id']),
             'name': seg.get('name', ''),
@@ -65,7 +98,7 @@ def get_video_segments(video_id):
             'order': seg.get('order', 0),
             'regions': regions_data,
             'created_at': seg['created_at'].isoformat()
-        })
+        }))
 
     return jsonify(result)
 
@@ -79,7 +112,7 @@ def create_segment(video_id):
         return jsonify({'error': 'start_time and end_time are required'}), 400
 
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
@@ -107,7 +140,7 @@ def create_segment(video_id):
     result = current_app.db.video_segments.insert_one(segment)
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(ObjectId(video_id))
+    mark_video_modified(current_app.db, ObjectId(video_id))
 
     return jsonify({
         'id': str(result.inserted_id),
@@ -151,7 +184,7 @@ def update_segment(segment_id):
     )
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(segment['video_id'])
+    mark_video_modified(current_app.db, segment['video_id'])
 
     updated = current_app.db.video_segments.find_one({'_id': ObjectId(segment_id)})
     return jsonify({
@@ -179,12 +212,18 @@ def delete_segment(segment_id):
     video_id = segment['video_id']
     
     # Delete related data
+    project_id = project_id_for_video(current_app.db, video_id)
+    record_deletes(current_app.db, 'captions', {'segment_id': ObjectId(segment_id)}, project_id)
+    record_deletes(current_app.db, 'object_regions', {'segment_id': ObjectId(segment_id)}, project_id)
+    record_deletes(current_app.db, 'video_segments', {'_id': ObjectId(segment_id)}, project_id)
+    mask_refs = region_mask_refs(current_app.db, {'segment_id': ObjectId(segment_id)})
     current_app.db.captions.delete_many({'segment_id': ObjectId(segment_id)})
     current_app.db.object_regions.delete_many({'segment_id': ObjectId(segment_id)})
     current_app.db.video_segments.delete_one({'_id': ObjectId(segment_id)})
+    remove_unreferenced_masks(current_app.db, mask_refs)
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(video_id)
+    mark_video_modified(current_app.db, video_id)
 
     return jsonify({'message': 'Segment deleted successfully'})
 
@@ -202,85 +241,112 @@ def create_segments_batch(video_id):
         return jsonify({'error': 'No segments provided'}), 400
 
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
     if not video:
         return jsonify({'error': 'Video not found'}), 404
 
-    # Delete existing segments for this video
-    if data.get('replace', False):
-        existing_segments = [s['_id'] for s in current_app.db.video_segments.find({'video_id': ObjectId(video_id)})]
-        current_app.db.captions.delete_many({'segment_id': {'$in': existing_segments}})
-        current_app.db.object_regions.delete_many({'segment_id': {'$in': existing_segments}})
-        current_app.db.video_segments.delete_many({'video_id': ObjectId(video_id)})
-
-    created = []
-    for i, seg_data in enumerate(segments_data):
-        segment = {
-            'video_id': ObjectId(video_id),
-            'name': seg_data.get('name', f'Segment {i + 1}'),
-            'start_time': float(seg_data['start_time']),
-            'end_time': float(seg_data['end_time']),
-            'order': i,
-            'created_by': request.current_user['_id'],
-            'created_at': datetime.now(timezone.utc),
-            'updated_at': datetime.now(timezone.utc)
-        }
-        result = current_app.db.video_segments.insert_one(segment)
-        created.append({
-            'id': str(result.inserted_id),
-            'name': segment['name'],
-            'start_time': segment['start_time'],
-            'end_time': segment['end_time'],
-            'order': segment['order'],
-            'regions': [],
-            'created_at': segment['created_at'].isoformat()
-        })
-
-    # Reset video approval if was approved
-    _reset_video_approval_if_needed(ObjectId(video_id))
+    segments = write_segments_batch(
+        current_app.db, video, segments_data, request.current_user['_id'], replace=data.get('replace', False)
+    )
+    created = [{
+        'id': str(segment['_id']),
+        'name': segment['name'],
+        'start_time': segment['start_time'],
+        'end_time': segment['end_time'],
+        'order': segment['order'],
+        'regions': [],
+        'created_at': segment['created_at'].isoformat()
+    } for segment in segments]
 
     return jsonify(created), 201
 
 
+@segments_bp.route('/video/<video_id>/detect-shots', methods=['POST'])
+@token_required
+def detect_shots(video_id):
+    """Queue shot-boundary detection; the job result lists the proposed segments.
+
+    Body: ``threshold`` (0-1), ``min_shot`` (seconds), ``apply`` to write the
+    segments as the batch endpoint does, ``replace`` to drop existing ones.
+    A running detection is returned for the same options, 409 for others.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}), {'_id': 1})
+    except Exception:
+        return jsonify({'error': 'Invalid video ID'}), 400
+
+    if not video:
+        return jsonify({'error': 'Video not found'}), 404
+
+    try:
+        threshold = float(data.get('threshold', DEFAULT_THRESHOLD))
+        min_shot = float(data.get('min_shot', DEFAULT_MIN_SHOT))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'threshold and min_shot must be numbers'}), 400
+    if not 0 < threshold <= 1 or min_shot < 0:
+        return jsonify({'error': 'threshold must be in (0, 1] and min_shot >= 0'}), 400
+
+    options = {
+        'threshold': threshold,
+        'min_shot': min_shot,
+        'apply': bool(data.get('apply', False)),
+        'replace': bool(data.get('replace', False)),
+    }
+    job, created = enqueue_job(
+        'shot_detection', video_id, build_shot_segments, video_id, options, request.current_user['_id'],
+        params={'video_id': video_id, **options}
+    )
+    # One detection per video at a time; a different request must wait for it
+    if not created and any(job['params'].get(k) != v for k, v in options.items()):
+        return jsonify({'error': 'Shot detection with other options is already running for this video',
+                        'job': serialize_job(job)}), 409
+    return jsonify(serialize_job(job)), 202 if created else 200
+
+
 # ============ OBJECT REGIONS (Step 2: Segmentation) ============
 
 @segments_bp.route('/<segment_id>/regions', methods=['GET'])
 @token_required
 def get_segment_regions(segment_id):
+    fieldset = Fieldset.from_request()
     try:
-        regions = list(current_app.db.object_regions.find({'segment_id': ObjectId(segment_id)}))
+        regions = list(current_app.db.object_regions.find(
+            {'segment_id': ObjectId(segment_id)},
+            fieldset.projection(REGION_FIELDS, always=REGION_ALWAYS)
+        ))
     except Exception:
         return jsonify({'error': 'Invalid segment ID'}), 400
 
+    caption_fieldset = fieldset.sub('caption')
+    caption_projection = caption_fieldset.projection(
+        {'id': ()}, always=('_id',)
+    ) if not caption_fieldset.is_full else None
+
     result = []
     for r in regions:
-        caption = current_app.db.captions.find_one({'region_id': r['_id']})
-        result.append({
+        caption = None
+        if fieldset.wants('caption'):
+            caption = current_app.db.captions.find_one({'region_id': r['_id']}, caption_projection)
+        result.append(fieldset.apply({
             'id': str(r['_id']),
             'segment_id': str(r['segment_id']),
             'video_id': str(r['video_id']),
             'frame_time': r['frame_time'],
-            'segmented_mask': r.get('segmented_mask', ''),
+            'segmented_mask': region_mask_url(r),
             'label': r.get('label', ''),
             'color': r.get('color', '#FF0000'),
             'category_id': str(r['category_id']) if r.get('category_id') else None,
             'category_name': r.get('category_name', ''),
             'caption': {
                 'id': str(caption['_id']),
-                'visual_caption': caption.get('visual_caption', ''),
-                'contextual_caption': caption.get('contextual_caption', ''),
-                'knowledge_caption': caption.get('knowledge_caption', ''),
-                'combined_caption': caption.get('combined_caption', ''),
-                'visual_caption_vi': caption.get('visual_caption_vi', ''),
-                'contextual_caption_vi': caption.get('contextual_caption_vi', ''),
-                'knowledge_caption_vi': caption.get('knowledge_caption_vi', ''),
-                'combined_caption_vi': caption.get('combined_caption_vi', '')
+                **{field: caption.get(field, '') for field in CAPTION_FIELDS}
             } if caption else None,
             'created_at': r['created_at'].isoformat()
-        })
+        }))
 
     return jsonify(result)
 
@@ -298,12 +364,19 @@ def create_region(segment_id):
     if not segment:
         return jsonify({'error': 'Segment not found'}), 404
 
+    try:
+        mask_refs, _ = externalize_fields({
+            'brush_mask': data.get('brush_mask', ''),
+            'segmented_mask': data.get('segmented_mask', '')
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     region = {
         'segment_id': ObjectId(segment_id),
         'video_id': segment['video_id'],
         'frame_time': float(data.get('frame_time', 0)),
-        'brush_mask': data.get('brush_mask', ''),
-        'segmented_mask': data.get('segmented_mask', ''),
+        **mask_refs,
         'label': data.get('label', 'Object'),
         'color': data.get('color', '#FF0000'),
         'category_id': ObjectId(data['category_id']) if data.get('category_id') else None,
@@ -314,17 +387,18 @@ def create_region(segment_id):
     }
 
     result = current_app.db.object_regions.insert_one(region)
+    restore_masks(data)
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(segment['video_id'])
+    mark_video_modified(current_app.db, segment['video_id'])
 
     return jsonify({
         'id': str(result.inserted_id),
         'segment_id': segment_id,
         'video_id': str(segment['video_id']),
         'frame_time': region['frame_time'],
-        'brush_mask': region['brush_mask'],
-        'segmented_mask': region['segmented_mask'],
+        'brush_mask': region_mask_url(region, 'brush_mask'),
+        'segmented_mask': region_mask_url(region),
         'label': region['label'],
         'color': region['color'],
         'category_id': str(region['category_id']) if region.get('category_id') else None,
@@ -351,10 +425,12 @@ def update_region(region_id):
         update_fields['label'] = data['label']
     if 'color' in data:
         update_fields['color'] = data['color']
-    if 'brush_mask' in data:
-        update_fields['brush_mask'] = data['brush_mask']
-    if 'segmented_mask' in data:
-        update_fields['segmented_mask'] = data['segmented_mask']
+    # Masks go to the content-addressed store; drop any legacy inline copy
+    try:
+        mask_refs, unset_fields = externalize_fields(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    update_fields.update(mask_refs)
     if 'frame_time' in data:
         update_fields['frame_time'] = float(data['frame_time'])
     if 'category_id' in data:
@@ -363,13 +439,21 @@ def update_region(region_id):
         update_fields['category_name'] = data['category_name']
     update_fields['updated_at'] = datetime.now(timezone.utc)
 
+    update_ops = {'$set': update_fields}
+    if unset_fields:
+        update_ops['$unset'] = unset_fields
     current_app.db.object_regions.update_one(
         {'_id': ObjectId(region_id)},
-        {'$set': update_fields}
+        update_ops
+    )
+    restore_masks(data)
+    # Masks this region no longer uses
+    remove_unreferenced_masks(
+        current_app.db, [region.get(f) for f, ref in mask_refs.items() if region.get(f) != ref]
     )
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(region['video_id'])
+    mark_video_modified(current_app.db, region['video_id'])
 
     return jsonify({'message': 'Region updated successfully'})
 
@@ -387,11 +471,15 @@ def delete_region(region_id):
 
     video_id = region['video_id']
     
+    project_id = project_id_for_video(current_app.db, video_id)
+    record_deletes(current_app.db, 'captions', {'region_id': ObjectId(region_id)}, project_id)
+    record_deletes(current_app.db, 'object_regions', {'_id': ObjectId(region_id)}, project_id)
     current_app.db.captions.delete_many({'region_id': ObjectId(region_id)})
     current_app.db.object_regions.delete_one({'_id': ObjectId(region_id)})
+    remove_unreferenced_masks(current_app.db, [region.get(f) for f in MASK_FIELDS.values()])
     
     # Reset video approval if was approved
-    _reset_video_approval_if_needed(video_id)
+    mark_video_modified(current_app.db, video_id)
 
     return jsonify({'message': 'Region deleted successfully'})
 
@@ -430,18 +518,34 @@ def _fallback_segmentation(brush_mask_b64):
     }
 
 
+def _cached_frame(video_id, t):
+    """Frame at ``t`` from the frame cache as a data URL ('' if unavailable)."""
+    try:
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}), {'filename': 1, 'fps': 1, 'duration': 1})
+        t = float(t)
+    except Exception:
+        return ''
+    if not video or not math.isfinite(t):
+        return ''
+    [(_, data)] = video_frames(current_app.db, video, [max(t, 0.0)])
+    return 'data:image/jpeg;base64,' + base64.b64encode(data).decode('ascii') if data else ''
+
+
 @segments_bp.route('/segment-object', methods=['POST'])
 @token_required
 def segment_object():
     """
     Object segmentation API - proxies to DAM server's /segment endpoint.
-    Receives brush_mask (user-drawn region) + frame_image (video frame).
+    Receives brush_mask (user-drawn region) + frame_image (video frame), or
+    video_id + time to take the frame from the frame cache instead.
     DAM server uses SAM2 to produce a precise segmentation mask.
     Falls back to PIL-based processing if DAM server is not available.
     """
     data = request.get_json()
     brush_mask_b64 = data.get('brush_mask', '')
     frame_image_b64 = data.get('frame_image', '')
+    if not frame_image_b64 and data.get('video_id') and data.get('time') is not None:
+        frame_image_b64 = _cached_frame(data['video_id'], data['time'])
 
     if not brush_mask_b64:
         return jsonify({'error': 'brush_mask is required'}), 400
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timezone
 from bson import ObjectId
 from utils.auth_middleware import token_required
+from utils.purge import live
 
 tags_bp = Blueprint('tags', __name__)
 
@@ -37,7 +38,7 @@ def create_tag(project_id):
         return jsonify({'error': 'Tag name is required'}), 400
 
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
@@ -1,3 +1,4 @@
+import math
 import os
 import uuid
 from flask import Blueprint, request, jsonify, current_app
@@ -6,11 +7,44 @@ from bson import ObjectId
 from werkzeug.utils import secure_filename
 from config import Config
 from utils.auth_middleware import token_required
+from utils.conditional import conditional_get, document_version
+from utils.fieldsets import Fieldset
+from utils.frame_cache import FRAME_FORMATS, FRAME_WIDTHS, MAX_BATCH_FRAMES, video_frames
+from utils.frames import FRAMES_PER_SEGMENT, segment_frame_times
+from utils.ingest import serialize_media, start_ingest
+from utils.jobs import serialize_job
+from utils.purge import live, queue_purge, soft_delete_video
+from utils.renditions import RENDITIONS, queue_renditions, renditions_after_ingest, serialize_renditions
+from utils.upload_sessions import (
+    UploadError, committed_offset, create_session, delete_session, finalize_session,
+    merge_ranges, purge_expired_sessions, write_chunk
+)
+from utils.versions import bump_project_version, bump_video_version
+from utils.video_blobs import attach_blob, save_hashed, start_video_ingest
 
 videos_bp = Blueprint('videos', __name__)
 
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
 
+# Sparse fieldset maps: response key -> document fields it is built from
+VIDEO_ALWAYS = ('_id', 'project_id', 'filename', 'original_name', 'uploaded_by', 'created_at')
+VIDEO_FIELDS = {
+    'id': (),
+    'url': ('renditions',),
+    'original_url': (),
+    'rendition': ('renditions',),
+    'thumbnail_url': ('thumbnail',),
+    'annotator_details': ('annotators',),
+    'subpart_reviewers': ('subpart_id',),
+    'reviewer_details_list': ('subpart_id',),
+    'reviewer_id': ('subpart_id',),
+    'reviewer_details': ('subpart_id',),
+    'segments': (),
+    'segments_count': (),
+    'objects_count': (),
+    'captions_count': (),
+}
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -37,7 +71,7 @@ def upload_video():
 
     # Verify project exists
     try:
-        project = current_app.db.projects.find_one({'_id': ObjectId(project_id)})
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
@@ -49,19 +83,39 @@ def upload_video():
     ext = original_name.rsplit('.', 1)[1].lower()
     unique_filename = f"{uuid.uuid4().hex}.{ext}"
 
-    # Save file
+    # Save file, hashing it for deduplication
     filepath = os.path.join(Config.UPLOAD_FOLDER, 'videos', unique_filename)
-    file.save(filepath)
-
-    # Handle thumbnail
-    thumbnail_filename = ''
-    if 'thumbnail' in request.files:
-        thumb_file = request.files['thumbnail']
-        thumb_name = f"{uuid.uuid4().hex}.jpg"
-        thumb_dir = os.path.join(Config.UPLOAD_FOLDER, 'thumbnails')
-        os.makedirs(thumb_dir, exist_ok=True)
-        thumb_file.save(os.path.join(thumb_dir, thumb_name))
-        thumbnail_filename = thumb_name
+    content_hash = save_hashed(file, filepath)
+
+    return _create_video(
+        project_id, subpart_id, unique_filename, original_name, filepath, request.form, content_hash
+    )
+
+
+def _save_thumbnail():
+    """Save the request's ``thumbnail`` file, if any; returns its filename or ''."""
+    if 'thumbnail' not in request.files:
+        return ''
+    thumb_file = request.files['thumbnail']
+    thumb_name = f"{uuid.uuid4().hex}.jpg"
+    thumb_dir = os.path.join(Config.UPLOAD_FOLDER, 'thumbnails')
+    os.makedirs(thumb_dir, exist_ok=True)
+    thumb_file.save(os.path.join(thumb_dir, thumb_name))
+    return thumb_name
+
+
+def _create_video(project_id, subpart_id, unique_filename, original_name, filepath, form, content_hash=None):
+    """Insert the videos document for a stored upload and build the upload response.
+
+    Content that is already stored is shared through ``video_blobs``: the
+    new file is dropped and the video reuses the stored one and its ingest.
+    """
+    reused = False
+    if content_hash:
+        blob, reused = attach_blob(current_app.db, content_hash, unique_filename)
+        unique_filename = blob['filename']
+        filepath = os.path.join(Config.UPLOAD_FOLDER, 'videos', unique_filename)
+    thumbnail_filename = _save_thumbnail()
 
     # Get file size
     file_size = os.path.getsize(filepath)
@@ -74,9 +128,9 @@ def upload_video():
         'file_path': filepath,
         'file_size': file_size,
         'thumbnail': thumbnail_filename,
-        'duration': float(request.form.get('duration', 0)),
-        'width': int(request.form.get('width', 0)),
-        'height': int(request.form.get('height', 0)),
+        'duration': float(form.get('duration') or 0),
+        'width': int(form.get('width') or 0),
+        'height': int(form.get('height') or 0),
         'status': 'uploaded',
         'current_step': 1,
         'annotators': [],
@@ -84,8 +138,14 @@ def upload_video():
         'created_at': datetime.now(timezone.utc),
         'updated_at': datetime.now(timezone.utc)
     }
+    if content_hash:
+        video_doc['content_hash'] = content_hash
+        video_doc['blob_id'] = content_hash
 
     result = current_app.db.videos.insert_one(video_doc)
+    bump_project_version(current_app.db, video_doc['project_id'])
+    # Probe metadata, keyframes and thumbnails in the background, then encode renditions
+    status = start_video_ingest(current_app.db, video_doc, on_ready=renditions_after_ingest())
 
     return jsonify({
         'id': str(result.inserted_id),
@@ -93,21 +153,172 @@ def upload_video():
         'original_name': original_name,
         'file_size': file_size,
         'url': f'/uploads/videos/{unique_filename}',
+        'original_url': f'/uploads/videos/{unique_filename}',
         'thumbnail_url': f'/uploads/thumbnails/{thumbnail_filename}' if thumbnail_filename else '',
-        'status': 'uploaded',
+        'status': status,
+        'deduplicated': reused,
         'message': 'Video uploaded successfully'
     }), 201
 
 
-def _build_video_stats(db, video):
+# ============ RESUMABLE UPLOADS ============
+
+def _upload_session(upload_id):
+    """The current user's upload session, or an error response."""
+    session = current_app.db.upload_sessions.find_one({'_id': upload_id})
+    if not session or session['user_id'] != request.current_user['_id']:
+        return None, (jsonify({'error': 'Upload not found'}), 404)
+    return session, None
+
+
+def _upload_status(session):
+    offset = committed_offset(session)
+    response = jsonify({
+        'upload_id': session['_id'],
+        'offset': offset,
+        'size': session['size'],
+        'ranges': merge_ranges(session.get('ranges', [])),
+        'chunk_size': Config.UPLOAD_CHUNK_MAX_MB * 1024 * 1024,
+        'expires_at': session['expires_at'].isoformat()
+    })
+    response.headers['Upload-Offset'] = str(offset)
+    response.headers['Upload-Length'] = str(session['size'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@videos_bp.route('/uploads', methods=['POST'])
+@token_required
+def create_upload():
+    """
+    Start a resumable upload.
+    Body: project_id, subpart_id, filename, size (bytes).
+    Then PATCH chunks to /uploads/<id> with an Upload-Offset header and
+    POST /uploads/<id>/finalize to create the video.
+    """
+    data = request.get_json(silent=True) or {}
+    project_id = data.get('project_id')
+    filename = data.get('filename') or ''
+
+    if not project_id:
+        return jsonify({'error': 'Project ID is required'}), 400
+
+    if not allowed_file(filename):
+        return jsonify({'error': f'File type not allowed. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size is required'}), 400
+    if size <= 0 or size > Config.UPLOAD_MAX_SIZE_GB * 1024 ** 3:
+        return jsonify({'error': f'size must be between 1 byte and {Config.UPLOAD_MAX_SIZE_GB} GB'}), 400
+
+    try:
+        project = current_app.db.projects.find_one(live({'_id': ObjectId(project_id)}), {'_id': 1})
+        subpart_id = ObjectId(data['subpart_id']) if data.get('subpart_id') else None
+    except Exception:
+        return jsonify({'error': 'Invalid project ID'}), 400
+
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+
+    purge_expired_sessions(current_app.db)
+    original_name = secure_filename(filename)
+    session = create_session(current_app.db, request.current_user['_id'], {
+        'project_id': project['_id'],
+        'subpart_id': subpart_id,
+        'original_name': original_name,
+        'ext': original_name.rsplit('.', 1)[1].lower(),
+        'size': size
+    })
+
+    response = _upload_status(session)
+    response.status_code = 201
+    response.headers['Location'] = f'/api/videos/uploads/{session["_id"]}'
+    return response
+
+
+@videos_bp.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+@token_required
+def get_upload(upload_id):
+    """Upload progress: resumable offset and received ranges."""
+    session, error = _upload_session(upload_id)
+    if error:
+        return error
+    return _upload_status(session)
+
+
+@videos_bp.route('/uploads/<upload_id>', methods=['PATCH'])
+@token_required
+def upload_chunk(upload_id):
+    """Write the request body at the Upload-Offset header's byte offset."""
+    session, error = _upload_session(upload_id)
+    if error:
+        return error
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+
+    length = request.content_length
+    if length is not None and length > Config.UPLOAD_CHUNK_MAX_MB * 1024 * 1024:
+        return jsonify({'error': f'Chunks are limited to {Config.UPLOAD_CHUNK_MAX_MB} MB'}), 413
+
+    try:
+        session = write_chunk(current_app.db, session, offset, request.stream, length)
+    except UploadError as e:
+        return jsonify({'error': str(e), 'offset': committed_offset(session)}), e.status
+
+    return _upload_status(session)
+
+
+@videos_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@token_required
+def finalize_upload(upload_id):
+    """
+    Create the video once every byte has arrived.
+    Form or JSON fields: duration, width, height, optional sha256 checksum;
+    multipart requests may include a thumbnail file.
+    """
+    session, error = _upload_session(upload_id)
+    if error:
+        return error
+
+    form = request.form if request.form or request.files else (request.get_json(silent=True) or {})
+    try:
+        filename, filepath, digest = finalize_session(current_app.db, session, form.get('checksum'))
+    except UploadError as e:
+        return jsonify({'error': str(e), 'offset': committed_offset(session)}), e.status
+
+    subpart_id = str(session['subpart_id']) if session.get('subpart_id') else None
+    return _create_video(
+        session['project_id'], subpart_id, filename, session['original_name'], filepath, form, digest
+    )
+
+
+@videos_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@token_required
+def cancel_upload(upload_id):
+    """Abort an upload and discard the received data."""
+    session, error = _upload_session(upload_id)
+    if error:
+        return error
+    delete_session(current_app.db, session['_id'])
+    return jsonify({'message': 'Upload cancelled'})
+
+
+def _build_video_stats(db, video, fieldset=None):
     """Build video dict with annotation statistics."""
+    fieldset = fieldset or Fieldset()
     vid = video['_id']
-    segments = list(db.video_segments.find({'video_id': vid}))
-    segments_count = len(segments)
-    segment_ids = [s['_id'] for s in segments]
+    segment_ids = []
+    if any(fieldset.wants(k) for k in ('segments_count', 'objects_count', 'captions_count')):
+        segment_ids = [s['_id'] for s in db.video_segments.find({'video_id': vid}, {'_id': 1})]
+    segments_count = len(segment_ids)
 
-    objects_count = db.object_regions.count_documents({'segment_id': {'$in': segment_ids}}) if segment_ids else 0
-    captions_count = db.captions.count_documents({'segment_id': {'$in': segment_ids}}) if segment_ids else 0
+    objects_count = db.object_regions.count_documents({'segment_id': {'$in': segment_ids}}) if segment_ids and fieldset.wants('objects_count') else 0
+    captions_count = db.captions.count_documents({'segment_id': {'$in': segment_ids}}) if segment_ids and fieldset.wants('captions_count') else 0
 
     thumb = video.get('thumbnail', '')
     # Resolve tag names
@@ -119,11 +330,11 @@ def _build_video_stats(db, video):
         except Exception:
             pass
     tags_data = []
-    if tag_ids:
-        tags = list(db.tags.find({'_id': {'$in': tag_ids}}))
+    if tag_ids and fieldset.wants('tags'):
+        tags = list(db.tags.find({'_id': {'$in': tag_ids}}, {'_id': 1}))
         tags_data = [str(t['_id']) for t in tags]
 
-    return {
+    return fieldset.apply({
         'id': str(vid),
         'filename': video['filename'],
         'original_name': video['original_name'],
@@ -132,9 +343,10 @@ def _build_video_stats(db, video):
         'width': video.get('width', 0),
         'height': video.get('height', 0),
         'status': video.get('status', 'uploaded'),
+        **serialize_media(video),
         'current_step': video.get('current_step', 1),
         'subpart_id': str(video['subpart_id']) if video.get('subpart_id') else None,
-        'url': f'/uploads/videos/{video["filename"]}',
+        **serialize_renditions(video),
         'thumbnail_url': f'/uploads/thumbnails/{thumb}' if thumb else '',
         'uploaded_by': str(video['uploaded_by']),
         'annotators': [str(a) for a in video.get('annotators', [])],
@@ -148,7 +360,7 @@ def _build_video_stats(db, video):
         'reviews': _format_reviews(video.get('reviews', [])),
         'reviewers': [str(r) for r in video.get('reviewers', [])],
         'created_at': video['created_at'].isoformat()
-    }
+    })
 
 
 def _format_reviews(reviews):
@@ -167,32 +379,45 @@ def _format_reviews(reviews):
 @videos_bp.route('/project/<project_id>', methods=['GET'])
 @token_required
 def get_project_videos(project_id):
+    fieldset = Fieldset.from_request()
     try:
-        videos = list(current_app.db.videos.find({'project_id': ObjectId(project_id)}))
+        videos = list(current_app.db.videos.find(
+            live({'project_id': ObjectId(project_id)}),
+            fieldset.projection(VIDEO_FIELDS, always=VIDEO_ALWAYS)
+        ))
     except Exception:
         return jsonify({'error': 'Invalid project ID'}), 400
 
-    result = [_build_video_stats(current_app.db, v) for v in videos]
+    result = [_build_video_stats(current_app.db, v, fieldset) for v in videos]
     return jsonify(result)
 
 
 @videos_bp.route('/subpart/<subpart_id>', methods=['GET'])
 @token_required
 def get_subpart_videos(subpart_id):
+    fieldset = Fieldset.from_request()
     try:
-        videos = list(current_app.db.videos.find({'subpart_id': ObjectId(subpart_id)}).sort('created_at', -1))
+        videos = list(current_app.db.videos.find(
+            live({'subpart_id': ObjectId(subpart_id)}),
+            fieldset.projection(VIDEO_FIELDS, always=VIDEO_ALWAYS)
+        ).sort('created_at', -1))
     except Exception:
         return jsonify({'error': 'Invalid subpart ID'}), 400
 
-    result = [_build_video_stats(current_app.db, v) for v in videos]
+    result = [_build_video_stats(current_app.db, v, fieldset) for v in videos]
     return jsonify(result)
 
 
 @videos_bp.route('/<video_id>', methods=['GET'])
 @token_required
+@conditional_get(lambda video_id: document_version('videos', video_id))
 def get_video(video_id):
+    fieldset = Fieldset.from_request()
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(
+            live({'_id': ObjectId(video_id)}),
+            fieldset.projection(VIDEO_FIELDS, always=VIDEO_ALWAYS)
+        )
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
@@ -200,14 +425,18 @@ def get_video(video_id):
         return jsonify({'error': 'Video not found'}), 404
 
     # Get segments
-    segments = list(current_app.db.video_segments.find(
-        {'video_id': ObjectId(video_id)}
-    ).sort('order', 1))
+    segments = []
+    segment_fieldset = fieldset.sub('segments')
+    if fieldset.wants('segments'):
+        segments = list(current_app.db.video_segments.find(
+            {'video_id': ObjectId(video_id)},
+            {'name': 1, 'start_time': 1, 'end_time': 1, 'order': 1, 'created_at': 1}
+        ).sort('order', 1))
 
     segments_data = []
     for seg in segments:
-        regions_count = current_app.db.object_regions.count_documents({'segment_id': seg['_id']})
-        captions_count = current_app.db.captions.count_documents({'segment_id': seg['_id']})
+        regions_count = current_app.db.object_regions.count_documents({'segment_id': seg['_id']}) if segment_fieldset.wants('regions_count') else 0
+        captions_count = current_app.db.captions.count_documents({'segment_id': seg['_id']}) if segment_fieldset.wants('captions_count') else 0
         segments_data.append({
             'id': str(seg['_id']),
             'name': seg.get('name', ''),
@@ -220,7 +449,7 @@ def get_video(video_id):
         })
 
     # Resolve annotator details
-    annotator_ids = video.get('annotators', [])
+    annotator_ids = video.get('annotators', []) if fieldset.wants('annotator_details') else []
     annotator_details = []
     for uid in annotator_ids:
         try:
@@ -238,7 +467,11 @@ def get_video(video_id):
     # Resolve subpart reviewers (multiple)
     subpart_reviewers = []
     reviewer_details_list = []
-    if video.get('subpart_id'):
+    wants_reviewers = any(fieldset.wants(k) for k in (
+        'subpart_reviewers', 'reviewer_details_list', 'reviewer_id', 'reviewer_details'
+    ))
+    resolve_reviewer_users = fieldset.wants('reviewer_details_list') or fieldset.wants('reviewer_details')
+    if video.get('subpart_id') and wants_reviewers:
         subpart = current_app.db.subparts.find_one({'_id': video['subpart_id']})
         if subpart:
             # Support both single reviewer and multiple reviewers
@@ -248,6 +481,8 @@ def get_video(video_id):
             
             for rev_id in reviewers_list:
                 subpart_reviewers.append(str(rev_id))
+                if not resolve_reviewer_users:
+                    continue
                 rev_user = current_app.db.users.find_one({'_id': rev_id}, {'password_hash': 0})
                 if rev_user:
                     reviewer_details_list.append({
@@ -259,8 +494,12 @@ def get_video(video_id):
 
     # Format individual reviews with user details
     reviews_with_details = []
-    for r in video.get('reviews', []):
-        rev_user = current_app.db.users.find_one({'_id': r['reviewer_id']}, {'password_hash': 0})
+    reviews = video.get('reviews', []) if fieldset.wants('reviews') else []
+    resolve_review_users = fieldset.sub('reviews').wants('reviewer_details')
+    for r in reviews:
+        rev_user = None
+        if resolve_review_users:
+            rev_user = current_app.db.users.find_one({'_id': r['reviewer_id']}, {'password_hash': 0})
         reviews_with_details.append({
             'reviewer_id': str(r['reviewer_id']),
             'action': r['action'],
@@ -274,7 +513,7 @@ def get_video(video_id):
             } if rev_user else None
         })
 
-    return jsonify({
+    return jsonify(fieldset.apply({
         'id': str(video['_id']),
         'project_id': str(video['project_id']),
         'filename': video['filename'],
@@ -284,9 +523,10 @@ def get_video(video_id):
         'width': video.get('width', 0),
         'height': video.get('height', 0),
         'status': video.get('status', 'uploaded'),
+        **serialize_media(video),
         'current_step': video.get('current_step', 1),
         'subpart_id': str(video['subpart_id']) if video.get('subpart_id') else None,
-        'url': f'/uploads/videos/{video["filename"]}',
+        **serialize_renditions(video),
         'thumbnail_url': f'/uploads/thumbnails/{video["thumbnail"]}' if video.get('thumbnail') else '',
         'uploaded_by': str(video['uploaded_by']),
         'annotators': [str(a) for a in video.get('annotators', [])],
@@ -303,7 +543,7 @@ def get_video(video_id):
         'reviewer_details': reviewer_details_list[0] if reviewer_details_list else None,
         'segments': segments_data,
         'created_at': video['created_at'].isoformat()
-    })
+    }))
 
 
 @videos_bp.route('/<video_id>', methods=['PUT'])
@@ -312,7 +552,7 @@ def update_video(video_id):
     data = request.get_json()
 
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
@@ -360,6 +600,7 @@ def update_video(video_id):
         {'_id': ObjectId(video_id)},
         {'$set': update_fields}
     )
+    bump_video_version(current_app.db, ObjectId(video_id))
 
     return jsonify({'message': 'Video updated successfully'})
 
@@ -368,29 +609,165 @@ def update_video(video_id):
 @token_required
 def delete_video(video_id):
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
     if not video:
         return jsonify({'error': 'Video not found'}), 404
 
-    # Delete file
+    # Hidden now; its annotations and files are removed in the background
+    soft_delete_video(current_app.db, video)
+    queue_purge()
+
+    return jsonify({'message': 'Video deleted successfully'})
+
+
+@videos_bp.route('/<video_id>/ingest', methods=['POST'])
+@token_required
+def reingest_video(video_id):
+    """Re-run the ingest stage (probe, keyframe index, thumbnails).
+
+    ``?force=1`` restarts a video stuck in ``processing`` (e.g. after the
+    server stopped mid-ingest).
+    """
     try:
-        filepath = os.path.join(Config.UPLOAD_FOLDER, 'videos', video['filename'])
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
-        pass
+        return jsonify({'error': 'Invalid video ID'}), 400
 
-    # Delete related data
-    segment_ids = [s['_id'] for s in current_app.db.video_segments.find({'video_id': ObjectId(video_id)})]
-    current_app.db.captions.delete_many({'segment_id': {'$in': segment_ids}})
-    current_app.db.object_regions.delete_many({'segment_id': {'$in': segment_ids}})
-    current_app.db.video_segments.delete_many({'video_id': ObjectId(video_id)})
-    current_app.db.videos.delete_one({'_id': ObjectId(video_id)})
+    if not video:
+        return jsonify({'error': 'Video not found'}), 404
 
-    return jsonify({'message': 'Video deleted successfully'})
+    force = request.args.get('force', '').lower() in ('1', 'true')
+    if video.get('status') == 'processing' and not force:
+        return jsonify({'error': 'Video is already being processed'}), 409
+
+    start_ingest(current_app.db, video, on_ready=renditions_after_ingest())
+    return jsonify({'id': video_id, 'status': 'processing'}), 202
+
+
+@videos_bp.route('/<video_id>/renditions', methods=['POST'])
+@token_required
+def create_renditions(video_id):
+    """Queue a job encoding playback renditions (``proxy`` and/or all-intra ``edit``)."""
+    try:
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}), {'status': 1})
+    except Exception:
+        return jsonify({'error': 'Invalid video ID'}), 400
+
+    if not video:
+        return jsonify({'error': 'Video not found'}), 404
+
+    if video.get('status') != 'ready':
+        return jsonify({'error': 'Video has not been ingested yet'}), 409
+
+    names = (request.get_json(silent=True) or {}).get('renditions')
+    if names is not None:
+        if not isinstance(names, list) or not names or any(n not in RENDITIONS for n in names):
+            return jsonify({'error': f'renditions must be a list of {", ".join(RENDITIONS)}'}), 400
+        names = [n for n in RENDITIONS if n in names]
+
+    job, created = queue_renditions(video_id, names)
+    return jsonify(serialize_job(job)), 202 if created else 200
+
+
+# ============ FRAMES ============
+
+def _frame_request(video_id):
+    """``(video, width, format, error response)`` for the frame endpoints."""
+    try:
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}), {'filename': 1, 'fps': 1, 'duration': 1})
+    except Exception:
+        return None, None, None, (jsonify({'error': 'Invalid video ID'}), 400)
+
+    if not video:
+        return None, None, None, (jsonify({'error': 'Video not found'}), 404)
+
+    width = request.args.get('width')
+    if width is not None:
+        width = int(width) if width.isdigit() else None
+        if width not in FRAME_WIDTHS:
+            return None, None, None, (jsonify({
+                'error': f'width must be one of {", ".join(map(str, FRAME_WIDTHS))}'
+            }), 400)
+    fmt = request.args.get('format', 'jpeg')
+    if fmt not in FRAME_FORMATS:
+        return None, None, None, (jsonify({'error': f'format must be {" or ".join(FRAME_FORMATS)}'}), 400)
+    return video, width, fmt, None
+
+
+def _parse_time(value):
+    try:
+        t = float(value)
+    except (TypeError, ValueError):
+        return None
+    return t if math.isfinite(t) and t >= 0 else None
+
+
+@videos_bp.route('/<video_id>/frame', methods=['GET'])
+@token_required
+def get_video_frame(video_id):
+    """One decoded frame as an image: ``t`` (seconds), optional ``width`` and ``format``."""
+    video, width, fmt, error = _frame_request(video_id)
+    if error:
+        return error
+
+    t = _parse_time(request.args.get('t'))
+    if t is None:
+        return jsonify({'error': 't must be a time in seconds'}), 400
+
+    [(name, data)] = video_frames(current_app.db, video, [t], width, fmt)
+    if data is None:
+        return jsonify({'error': 'No frame at that time'}), 404
+
+    response = current_app.response_class(data, mimetype=FRAME_FORMATS[fmt]['mimetype'])
+    # The name identifies the image (video file, frame, size, format)
+    response.set_etag(name)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
+
+@videos_bp.route('/<video_id>/frames', methods=['GET'])
+@token_required
+def get_video_frames(video_id):
+    """Decode a batch of frames and return their ``/uploads/frames/`` URLs.
+
+    Times come from ``t`` (comma-separated and/or repeated) or from
+    ``segment_id``, which samples the segment the way captioning does
+    (``count`` frames, default 8).
+    """
+    video, width, fmt, error = _frame_request(video_id)
+    if error:
+        return error
+
+    segment_id = request.args.get('segment_id')
+    if segment_id:
+        try:
+            segment = current_app.db.video_segments.find_one(
+                {'_id': ObjectId(segment_id), 'video_id': video['_id']}, {'start_time': 1, 'end_time': 1}
+            )
+        except Exception:
+            return jsonify({'error': 'Invalid segment ID'}), 400
+        if not segment:
+            return jsonify({'error': 'Segment not found'}), 404
+        count = request.args.get('count', FRAMES_PER_SEGMENT, type=int)
+        if not 1 <= count <= MAX_BATCH_FRAMES:
+            return jsonify({'error': f'count must be between 1 and {MAX_BATCH_FRAMES}'}), 400
+        times = segment_frame_times(segment['start_time'], segment['end_time'], count)
+    else:
+        raw = [v for value in request.args.getlist('t') for v in value.split(',') if v.strip()]
+        times = [_parse_time(v) for v in raw]
+        if not times or None in times:
+            return jsonify({'error': 't must list times in seconds'}), 400
+        if len(times) > MAX_BATCH_FRAMES:
+            return jsonify({'error': f'At most {MAX_BATCH_FRAMES} frames per request'}), 400
+
+    frames = video_frames(current_app.db, video, times, width, fmt)
+    return jsonify({'frames': [
+        {'t': round(t, 3), 'url': f'/uploads/frames/{name}' if data is not None else None}
+        for t, (name, data) in zip(times, frames)
+    ]})
 
 
 # ============ REVIEW ENDPOINTS ============
@@ -400,7 +777,7 @@ def delete_video(video_id):
 def submit_for_review(video_id):
     """Annotator submits a video for cross-check review."""
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
@@ -418,6 +795,7 @@ def submit_for_review(video_id):
             'updated_at': datetime.now(timezone.utc)
         }}
     )
+    bump_video_version(current_app.db, ObjectId(video_id))
 
     return jsonify({'message': 'Video submitted for review', 'review_status': 'pending_review'})
 
@@ -435,7 +813,7 @@ def review_video(video_id):
         return jsonify({'error': 'Invalid action. Must be approve or reject'}), 400
 
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
@@ -486,6 +864,7 @@ def review_video(video_id):
             'updated_at': now
         }}
     )
+    bump_video_version(current_app.db, ObjectId(video_id))
 
     return jsonify({
         'message': f'Your review recorded: {action}',
@@ -534,7 +913,7 @@ def _calculate_consensus_status(reviews, required_reviewers):
 def revoke_approval(video_id):
     """Revoke approval status (admin/reviewer can cancel approval)."""
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
@@ -555,6 +934,7 @@ def revoke_approval(video_id):
             'updated_at': datetime.now(timezone.utc)
         }}
     )
+    bump_video_version(current_app.db, ObjectId(video_id))
 
     return jsonify({
         'message': 'Approval revoked',
@@ -567,7 +947,7 @@ def revoke_approval(video_id):
 def withdraw_review(video_id):
     """Reviewer withdraws their own review."""
     try:
-        video = current_app.db.videos.find_one({'_id': ObjectId(video_id)})
+        video = current_app.db.videos.find_one(live({'_id': ObjectId(video_id)}))
     except Exception:
         return jsonify({'error': 'Invalid video ID'}), 400
 
@@ -599,6 +979,7 @@ def withdraw_review(video_id):
             'updated_at': datetime.now(timezone.utc)
         }}
     )
+    bump_video_version(current_app.db, ObjectId(video_id))
 
     return jsonify({
         'message': 'Your review has been withdrawn',
@@ -614,7 +995,7 @@ def get_qc_stats():
     db = current_app.db
     
     # Get all videos with their status
-    videos = list(db.videos.find({}, {
+    videos = list(db.videos.find(live(), {
         'project_id': 1, 'subpart_id': 1, 'original_name': 1,
         'review_status': 1, 'reviews': 1, 'status': 1, 'created_at': 1
     }))
@@ -0,0 +1,102 @@
+"""Benchmark the KB suggestion index (utils/kb_vectors.py).
+
+Builds a synthetic knowledge base of bilingual nodes, then measures the
+full build, query latency for caption-length texts and the cost of
+incremental upserts/removes.
+
+    cd backend && python scripts/bench_kb_suggest.py --nodes 50000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from bson import ObjectId  # noqa: E402
+from utils.kb_vectors import KBVectorIndex  # noqa: E402
+
+WORDS_EN = (
+    'temple gate dragon lantern festival incense drum boat river market stele turtle '
+    'pagoda roof tile pillar carving scholar emperor dynasty bronze bell silk costume '
+    'dance procession offering altar rice field buffalo village bamboo water puppet '
+    'lion mask fan hat conical ao dai flower peach blossom kumquat firecracker'
+).split()
+WORDS_VI = (
+    'đền cổng rồng đèn lồng lễ hội hương trống thuyền sông chợ bia rùa chùa mái ngói '
+    'cột chạm khắc nho sĩ vua triều đại đồng chuông lụa trang phục múa rước lễ vật '
+    'bàn thờ lúa ruộng trâu làng tre múa rối nước sư tử mặt nạ quạt nón lá hoa đào quất pháo'
+).split()
+
+
+def make_nodes(count, rng):
+    now = datetime.now(timezone.utc)
+    types = ['object', 'concept', 'action', 'ritual', 'festival']
+    nodes = []
+    for i in range(count):
+        en = rng.choice(WORDS_EN, 3)
+        vi = rng.choice(WORDS_VI, 3)
+        nodes.append({
+            '_id': ObjectId(),
+            'name': ' '.join(en) + f' {i}',
+            'name_vi': ' '.join(vi),
+            'type': types[i % len(types)],
+            'description': ' '.join(rng.choice(WORDS_EN, 20)),
+            'description_vi': ' '.join(rng.choice(WORDS_VI, 20)),
+            'visual_cues': ' '.join(rng.choice(WORDS_EN, 8)),
+            'tags': list(rng.choice(WORDS_EN, 2)),
+            'updated_at': now,
+        })
+    return nodes
+
+
+def percentile(samples, q):
+    return float(np.percentile(np.array(samples) * 1000, q))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--dim', type=int, default=None, help='vector size (default Config.KB_SUGGEST_DIM)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    nodes = make_nodes(args.nodes, rng)
+
+    index = KBVectorIndex(args.dim)
+    start = time.perf_counter()
+    index.build(nodes)
+    build = time.perf_counter() - start
+    print(f'{args.nodes} nodes, dim {index.dim}: build {build:.2f}s, '
+          f'matrix {index.matrix[:index.size].nbytes / 1e6:.1f} MB')
+
+    captions = [
+        ' '.join(rng.choice(WORDS_EN, 25)) + ' ' + ' '.join(rng.choice(WORDS_VI, 25))
+        for _ in range(args.queries)
+    ]
+    for label, node_type in (('all types', None), ('type=ritual', 'ritual')):
+        timings = []
+        for text in captions:
+            start = time.perf_counter()
+            index.query(text, 10, node_type)
+            timings.append(time.perf_counter() - start)
+        print(f'query top-10 ({label}): p50 {percentile(timings, 50):.2f} ms, '
+              f'p95 {percentile(timings, 95):.2f} ms')
+
+    updates = make_nodes(1000, rng)
+    start = time.perf_counter()
+    for node in updates:
+        index.upsert(node)
+    upsert = (time.perf_counter() - start) / len(updates)
+    start = time.perf_counter()
+    for node in updates:
+        index.remove(node['_id'])
+    remove = (time.perf_counter() - start) / len(updates)
+    print(f'incremental: upsert {upsert * 1000:.3f} ms/node, remove {remove * 1000:.3f} ms/node')
+
+
+if __name__ == '__main__':
+    main()
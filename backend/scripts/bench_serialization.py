@@ -0,0 +1,121 @@
+"""Benchmark JSON encoding and response compression on an export payload.
+
+Builds a synthetic ``video_annotation_v1`` project export (inline PNG masks,
+bilingual captions, ObjectId/datetime values) with the real exporter
+builders and compares Flask's default JSON provider against
+``FastJSONProvider``, then each compression codec.
+
+    cd backend && python scripts/bench_serialization.py --videos 20
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from bson import ObjectId  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from PIL import Image  # noqa: E402
+from utils.compression import available_encodings  # noqa: E402
+from utils.exporter import _build_region, _build_segment, _build_video  # noqa: E402
+from utils.json_provider import FastJSONProvider  # noqa: E402
+
+
+def _mask_data_url(rng, width, height):
+    mask = np.zeros((height, width), np.uint8)
+    x, y = rng.integers(0, width // 2), rng.integers(0, height // 2)
+    mask[y:y + height // 3, x:x + width // 3] = 255
+    buffer = io.BytesIO()
+    Image.fromarray(mask).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def build_payload(videos, segments, regions, width, height):
+    rng = np.random.default_rng(0)
+    now = datetime.now(timezone.utc)
+    caption_text = 'A person in a red jacket walks along the river bank near the old bridge. ' * 3
+    video_list = []
+    for _ in range(videos):
+        segs = []
+        for s in range(segments):
+            regs = []
+            for _ in range(regions):
+                region = {
+                    '_id': ObjectId(), 'label': 'person', 'color': '#ff0000',
+                    'category_name': 'human', 'frame_time': s + 0.5,
+                    'segmented_mask': _mask_data_url(rng, width, height)
+                }
+                caption = {
+                    'visual_caption': caption_text, 'knowledge_caption': caption_text,
+                    'combined_caption': caption_text, 'visual_caption_vi': caption_text,
+                    'knowledge_caption_vi': caption_text, 'combined_caption_vi': caption_text
+                }
+                regs.append(_build_region(region, caption, 'inline'))
+            seg = {'_id': ObjectId(), 'name': f'Segment {s}', 'start_time': s, 'end_time': s + 1}
+            segs.append(_build_segment(seg, regs, [{'contextual_caption': caption_text}]))
+        video = {
+            '_id': ObjectId(), 'original_name': 'clip.mp4', 'duration': float(segments),
+            'width': width, 'height': height, 'fps': 25
+        }
+        data = _build_video(video, segs)
+        # Values the registry converts (routes may now return them as-is)
+        data['created_at'] = now
+        data['project_id'] = ObjectId()
+        video_list.append(data)
+    return {'dataset_info': {'exported_at': now}, 'videos': video_list}
+
+
+def _time(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=20)
+    parser.add_argument('--segments', type=int, default=10)
+    parser.add_argument('--regions', type=int, default=3)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=360)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask('bench')
+    payload = build_payload(args.videos, args.segments, args.regions, args.width, args.height)
+
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+
+    def default_dumps():
+        # What routes did before: Flask's provider with hand-converted values
+        return default_provider.dumps(
+            payload, default=lambda v: str(v) if isinstance(v, ObjectId) else v.isoformat(),
+            separators=(',', ':')
+        ).encode('utf-8')
+
+    print(f'payload: {args.videos} videos x {args.segments} segments x {args.regions} regions')
+    t_default, body = _time(default_dumps, args.repeat)
+    t_fast, fast_body = _time(lambda: fast_provider.dumps_bytes(payload), args.repeat)
+    print(f'{"encoder":<12}{"ms":>10}{"bytes":>14}')
+    print(f'{"stdlib":<12}{t_default * 1000:>10.1f}{len(body):>14,}')
+    print(f'{"fast":<12}{t_fast * 1000:>10.1f}{len(fast_body):>14,}   x{t_default / t_fast:.1f}')
+
+    print(f'\n{"encoding":<12}{"ms":>10}{"bytes":>14}{"ratio":>8}')
+    for name, fn, level in available_encodings():
+        t, compressed = _time(lambda: fn(fast_body, level), args.repeat)
+        print(f'{name:<12}{t * 1000:>10.1f}{len(compressed):>14,}{len(fast_body) / len(compressed):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Load test: concurrent video playback against API latency.
+
+Simulates ``--players`` browsers playing a video from ``/uploads/``: each
+opens a ``Range: bytes=N-`` request at a random offset, reads it at the
+playback bitrate and "seeks" every few seconds, like a <video> element.
+Meanwhile an API client calls ``GET /api/auth/profile`` in a loop. API
+latency is measured alone, then under playback load. With the app serving
+the bytes, slow readers hold workers and API latency climbs; with
+``UPLOADS_OFFLOAD=nginx`` it should stay flat.
+
+    cd backend && python scripts/loadtest_uploads.py \\
+        --base-url http://localhost:4200 --video /uploads/videos/<name>.mp4 \\
+        --username admin --password ... --players 50
+"""
+import argparse
+import random
+import threading
+import time
+
+import requests
+
+
+def percentile(samples, q):
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def login(base_url, username, password):
+    response = requests.post(f'{base_url}/api/auth/login', json={'username': username, 'password': password})
+    response.raise_for_status()
+    return response.json()['token']
+
+
+def measure_api(base_url, token, seconds):
+    """API latencies (ms) and error count over ``seconds``."""
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            response = session.get(f'{base_url}/api/auth/profile', timeout=30)
+            if response.status_code != 200:
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.05)
+    return latencies, errors
+
+
+class Player(threading.Thread):
+    def __init__(self, url, size, bitrate, seek_every, stop):
+        super().__init__(daemon=True)
+        self.url, self.size = url, size
+        self.bytes_per_second = bitrate / 8
+        self.seek_every = seek_every
+        self.stop = stop
+        self.received = 0
+        self.errors = 0
+        self.first_byte = []
+
+    def run(self):
+        session = requests.Session()
+        while not self.stop.is_set():
+            offset = random.randrange(0, max(1, self.size - 1))
+            start = time.perf_counter()
+            try:
+                with session.get(self.url, headers={'Range': f'bytes={offset}-'}, stream=True, timeout=30) as response:
+                    if response.status_code != 206:
+                        self.errors += 1
+                        continue
+                    read, began = 0, time.monotonic()
+                    for chunk in response.iter_content(64 * 1024):
+                        if not read:
+                            self.first_byte.append((time.perf_counter() - start) * 1000)
+                        read += len(chunk)
+                        self.received += len(chunk)
+                        elapsed = time.monotonic() - began
+                        if self.stop.is_set() or elapsed >= self.seek_every:
+                            break
+                        # Read no faster than playback
+                        ahead = read / self.bytes_per_second - elapsed
+                        if ahead > 0:
+                            time.sleep(ahead)
+            except requests.RequestException:
+                self.errors += 1
+
+
+def report(label, latencies, errors):
+    print(f'{label}: {len(latencies)} requests, {errors} errors, '
+          f'p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, '
+          f'p99 {percentile(latencies, 99):.1f} ms, max {max(latencies, default=float("nan")):.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:4200')
+    parser.add_argument('--video', required=True, help='path of a video, e.g. /uploads/videos/<name>.mp4')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--bitrate', type=float, default=8e6, help='playback bits per second per player')
+    parser.add_argument('--seek-every', type=float, default=5.0, help='seconds between seeks')
+    parser.add_argument('--seconds', type=float, default=30.0, help='length of each phase')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    token = login(base_url, args.username, args.password)
+    video_url = base_url + args.video
+    head = requests.head(video_url)
+    head.raise_for_status()
+    size = int(head.headers['Content-Length'])
+    print(f'{args.video}: {size / 1e6:.1f} MB, Accept-Ranges: {head.headers.get("Accept-Ranges")}, '
+          f'Cache-Control: {head.headers.get("Cache-Control")}')
+
+    report('API alone', *measure_api(base_url, token, args.seconds))
+
+    stop = threading.Event()
+    players = [Player(video_url, size, args.bitrate, args.seek_every, stop) for _ in range(args.players)]
+    for player in players:
+        player.start()
+    time.sleep(min(5.0, args.seconds / 3))  # let playback ramp up
+    latencies, errors = measure_api(base_url, token, args.seconds)
+    stop.set()
+    for player in players:
+        player.join(timeout=5)
+
+    report(f'API with {args.players} players', latencies, errors)
+    first_byte = [t for p in players for t in p.first_byte]
+    received = sum(p.received for p in players)
+    print(f'playback: {received / 1e6:.1f} MB received, {sum(p.errors for p in players)} errors, '
+          f'time to first byte p50 {percentile(first_byte, 50):.1f} ms, p95 {percentile(first_byte, 95):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import copy
+
+from utils.dataset_shards import _build_sample, _completed_shard, write_shard
+
+VIDEO = {'id': 'v1', 'width': 640, 'height': 360}
+SOURCE = {'path': '/nonexistent/v1.mp4', 'fps': 25.0, 'keyframes': [0.0, 2.0]}
+
+
+def _segment(caption='a dog runs'):
+    return {
+        'id': 's1', 'name': 'Shot 1', 'start_time': 0.0, 'end_time': 2.0,
+        'segment_captions': [{'contextual_caption': caption}],
+        'regions': [{'label': 'dog', 'frame_time': 0.5, 'segmented_mask': ''}]
+    }
+
+
+def _samples(seg):
+    return [_build_sample(VIDEO, SOURCE, copy.deepcopy(seg))]
+
+
+def test_unchanged_shard_is_reused(tmp_path):
+    samples = _samples(_segment())
+    write_shard(str(tmp_path), 'shard-000000', samples)
+    info = _completed_shard(str(tmp_path), 'shard-000000', _samples(_segment()))
+    assert info and info['keys'] == ['v1_s1']
+
+
+def test_edited_caption_rewrites_shard(tmp_path):
+    write_shard(str(tmp_path), 'shard-000000', _samples(_segment()))
+    assert _completed_shard(str(tmp_path), 'shard-000000', _samples(_segment('a cat sits'))) is None
+
+
+def test_changed_times_or_mask_rewrite_shard(tmp_path):
+    write_shard(str(tmp_path), 'shard-000000', _samples(_segment()))
+    moved = dict(_segment(), end_time=3.0)
+    masked = _segment()
+    masked['regions'][0]['segmented_mask'] = '/uploads/masks/ab/' + 'ab' * 32 + '.png'
+    assert _completed_shard(str(tmp_path), 'shard-000000', _samples(moved)) is None
+    assert _completed_shard(str(tmp_path), 'shard-000000', _samples(masked)) is None
@@ -0,0 +1,22 @@
+from utils.kb_tree import compute_paths
+
+
+def test_paths_follow_parents():
+    paths = compute_paths({'a': None, 'b': 'a', 'c': 'b', 'd': 'a'})
+    assert paths == {'a': [], 'b': ['a'], 'c': ['a', 'b'], 'd': ['a']}
+
+
+def test_dangling_parent_makes_a_root():
+    paths = compute_paths({'b': 'missing', 'c': 'b'})
+    assert paths == {'b': [], 'c': ['b']}
+
+
+def test_cycle_is_cut_where_it_closes():
+    paths = compute_paths({'a': 'b', 'b': 'a', 'c': 'a'})
+    assert paths == {'a': ['b'], 'b': [], 'c': ['b', 'a']}
+    assert all(node not in path for node, path in paths.items())
+
+
+def test_cycle_reached_from_outside():
+    paths = compute_paths({'x': 'a', 'a': 'b', 'b': 'a'})
+    assert paths == {'x': ['b', 'a'], 'a': ['b'], 'b': []}
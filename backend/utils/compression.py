@@ -0,0 +1,94 @@
+"""Negotiated response compression (zstd, brotli, gzip).
+
+Buffered JSON/text responses of at least ``COMPRESS_MIN_SIZE`` bytes are
+compressed with the best encoding the client accepts. Streamed and file
+responses (``send_file``, exports) are left alone so Range requests and
+streaming keep working; nginx can compress those if wanted.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional codec
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional codec
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/vtt', 'image/svg+xml',
+}
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def available_encodings():
+    """(encoding, compress_fn, level) in server preference order."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append(('zstd', _zstd, 3))
+    if brotli is not None:
+        encodings.append(('br', _brotli, 4))
+    encodings.append(('gzip', _gzip, 6))
+    return encodings
+
+
+def choose_encoding(accept_encodings, encodings=None):
+    """Pick an encoding from the request's ``Accept-Encoding``, honouring q=0."""
+    best = None
+    best_quality = 0
+    for name, fn, level in encodings or available_encodings():
+        quality = accept_encodings[name]
+        if quality > best_quality:
+            best, best_quality = (name, fn, level), quality
+    return best
+
+
+def init_compression(app):
+    from flask import request
+
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    encodings = available_encodings()
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        choice = choose_encoding(request.accept_encodings, encodings)
+        if not choice:
+            return response
+
+        name, fn, level = choice
+        response.set_data(fn(data, level))
+        response.headers['Content-Encoding'] = name
+        # The compressed body is a different representation of the same resource
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,64 @@
+"""Conditional GET (ETag / If-None-Match) for read endpoints.
+
+ETags are derived from a cheap version lookup made before the view runs
+(``content_version``/``updated_at`` of the document, or a collection-wide
+stamp), never from hashing the built response. A matching
+``If-None-Match`` is answered with 304 without running the view at all.
+"""
+import hashlib
+from functools import wraps
+from bson import ObjectId
+from flask import Response, current_app, make_response, request
+
+
+def make_etag(version):
+    """Strong ETag for ``version`` on the current endpoint and query string.
+
+    The query string is included because ``fields``/``exclude`` and other
+    parameters change the body.
+    """
+    query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    raw = f'{request.endpoint}|{version}|{query}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def document_version(collection, doc_id):
+    """``content_version`` + ``updated_at`` of a document, or None if missing/invalid."""
+    try:
+        doc = current_app.db[collection].find_one(
+            {'_id': ObjectId(doc_id)}, {'content_version': 1, 'updated_at': 1}
+        )
+    except Exception:
+        return None
+    if not doc:
+        return None
+    updated_at = doc['updated_at'].isoformat() if doc.get('updated_at') else ''
+    return f'{doc.get("content_version", 0)}:{updated_at}'
+
+
+def conditional_get(version_of):
+    """Decorator: answer ``If-None-Match`` with 304 from ``version_of(**view_args)``.
+
+    ``version_of`` returning None skips the check, so the view still
+    produces its own 400/404 responses. Apply below ``token_required``.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            version = version_of(*args, **kwargs)
+            if version is None:
+                return f(*args, **kwargs)
+
+            etag = make_etag(version)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Let browsers keep the body but revalidate every time
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated
+    return decorator
@@ -0,0 +1,283 @@
+"""Training-ready dataset export: WebDataset-style tar shards.
+
+One sample per segment, keyed ``<video_id>_<segment_id>``::
+
+    <key>.json                 segment, captions and regions
+    <key>.frame0.jpg ...       the 8 frames the captioning flow uses
+    <key>.r0.mask.png ...      one mask per region (in ``regions`` order)
+
+Samples are grouped into shards of roughly ``DATASET_SHARD_MB`` (estimated
+from frame resolution and mask sizes) and written by a process pool, since
+frame decoding is CPU bound. Frames go through the frame cache, seeking
+from the ingest keyframe index, so frames already decoded for the editor
+or a previous export are reused. Each finished shard leaves a
+``shard-NNNNNN.json`` sidecar with its keys and a digest of its samples'
+content (metadata, captions, regions, frame times, mask refs, video file
+and fps); a rerun skips shards whose digest still matches, so an
+interrupted export resumes per shard.
+``index.json`` lists every shard once all are written.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tarfile
+from bisect import bisect_left, bisect_right
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from bson import ObjectId
+from flask import current_app
+from config import Config
+from utils.exporter import iter_video_exports
+from utils.frames import FRAMES_PER_SEGMENT, extract_segment_frames, segment_frame_times
+from utils.ingest import keyframe_index
+from utils.mask_store import MASK_URL_PREFIX, is_mask_url, mask_path, read_mask_bytes
+from utils.purge import live
+
+DATASET_FORMAT = 'video_annotation_webdataset_v1'
+
+# Rough JPEG size per pixel at -q:v 3, used only for shard balancing
+_JPEG_BYTES_PER_PIXEL = 0.25
+
+
+def dataset_dir(project_id):
+    return os.path.join(Config.EXPORT_FOLDER, f'dataset_{project_id}')
+
+
+def _shard_name(index):
+    return f'shard-{index:06d}'
+
+
+def _mask_size(value):
+    if is_mask_url(value):
+        try:
+            return os.path.getsize(mask_path(value[len(MASK_URL_PREFIX):]))
+        except OSError:
+            return 0
+    return len(value) * 3 // 4
+
+
+def _segment_keyframes(keyframes, start_time, end_time):
+    """Keyframes a segment's frames can be decoded from: the one before it and those inside."""
+    first = max(0, bisect_right(keyframes, start_time) - 1)
+    return keyframes[first:bisect_left(keyframes, end_time, first) + 1]
+
+
+def _build_sample(video, source, seg):
+    """Sample spec (plain data, picklable for the worker processes)."""
+    key = f'{video["id"]}_{seg["id"]}'
+    frame_times = segment_frame_times(seg['start_time'], seg['end_time'])
+    regions = []
+    masks = []
+    for i, region in enumerate(seg['regions']):
+        mask = region.pop('segmented_mask', '')
+        region['mask'] = f'r{i}.mask.png' if mask else ''
+        # Nearest sampled frame, so the mask can be paired with a frame
+        region['frame_index'] = min(
+            range(len(frame_times)), key=lambda j: abs(frame_times[j] - region['frame_time'])
+        )
+        regions.append(region)
+        masks.append(mask)
+
+    meta = {
+        'key': key,
+        'video_id': video['id'],
+        'segment_id': seg['id'],
+        'segment_name': seg['name'],
+        'start_time': seg['start_time'],
+        'end_time': seg['end_time'],
+        'frame_times': [round(t, 3) for t in frame_times],
+        'frames': [f'frame{i}.jpg' for i in range(FRAMES_PER_SEGMENT)],
+        'width': video['width'],
+        'height': video['height'],
+        'segment_captions': seg['segment_captions'],
+        'regions': regions
+    }
+    width = video['width'] or 1280
+    height = video['height'] or 720
+    size = int(FRAMES_PER_SEGMENT * width * height * _JPEG_BYTES_PER_PIXEL)
+    size += sum(_mask_size(m) for m in masks if m)
+    return {
+        'key': key,
+        'video_path': source['path'],
+        'fps': source['fps'],
+        'keyframes': _segment_keyframes(source['keyframes'], seg['start_time'], seg['end_time']),
+        'meta': meta,
+        'masks': masks,
+        'size': size
+    }
+
+
+def shard_digest(samples):
+    """Digest of everything a shard's content is built from."""
+    sha = hashlib.sha256()
+    for sample in samples:
+        sha.update(json.dumps({
+            'meta': sample['meta'],
+            'masks': sample['masks'],
+            'video': os.path.basename(sample['video_path']),
+            'fps': sample['fps']
+        }, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(datetime.now(timezone.utc).timestamp())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_shard(out_dir, name, samples):
+    """Worker: decode frames and write one shard plus its sidecar."""
+    path = os.path.join(out_dir, f'{name}.tar')
+    tmp_path = f'{path}.tmp'
+    written = []
+    with tarfile.open(tmp_path, 'w') as tar:
+        for sample in samples:
+            key = sample['key']
+            frames = []
+            if os.path.exists(sample['video_path']):
+                frames = extract_segment_frames(
+                    sample['video_path'], sample['meta']['start_time'], sample['meta']['end_time'],
+                    fps=sample['fps'], keyframes=sample['keyframes']
+                )
+            meta = dict(sample['meta'], frames=[f'frame{i}.jpg' for i in range(len(frames))])
+            _add_bytes(tar, f'{key}.json', json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+            for i, frame in enumerate(frames):
+                _add_bytes(tar, f'{key}.frame{i}.jpg', frame)
+            for i, mask in enumerate(sample['masks']):
+                if mask:
+                    _add_bytes(tar, f'{key}.r{i}.mask.png', read_mask_bytes(mask))
+            written.append(key)
+    os.replace(tmp_path, path)
+
+    info = {
+        'name': f'{name}.tar', 'samples': len(written), 'size': os.path.getsize(path),
+        'keys': written, 'digest': shard_digest(samples)
+    }
+    with open(os.path.join(out_dir, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return info
+
+
+def _completed_shard(out_dir, name, samples):
+    """Sidecar of an already written shard with the same samples and content, if any."""
+    try:
+        with open(os.path.join(out_dir, f'{name}.json'), encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if info.get('keys') != [s['key'] for s in samples] or info.get('digest') != shard_digest(samples):
+        return None
+    if not os.path.exists(os.path.join(out_dir, info['name'])):
+        return None
+    return info
+
+
+def _iter_shards(db, project):
+    """Yield lists of sample specs, each about ``DATASET_SHARD_MB`` big."""
+    target = Config.DATASET_SHARD_MB * 1024 * 1024
+    sources = {}
+
+    def videos():
+        for v in db.videos.find(live({'project_id': project['_id']})).sort('_id', 1):
+            sources[str(v['_id'])] = {
+                'path': os.path.join(Config.UPLOAD_FOLDER, 'videos', v.get('filename', '')),
+                'fps': v.get('fps'),
+                'keyframes': keyframe_index(db, v['_id'])
+            }
+            yield v
+
+    shard, shard_size = [], 0
+    for video in iter_video_exports(db, videos(), masks='url'):
+        for seg in video['segments']:
+            sample = _build_sample(video, sources[video['id']], seg)
+            if shard and shard_size + sample['size'] > target:
+                yield shard
+                shard, shard_size = [], 0
+            shard.append(sample)
+            shard_size += sample['size']
+        del sources[video['id']]
+    if shard:
+        yield shard
+
+
+def build_project_dataset(ctx, project_id):
+    """Job function: write (or resume) the sharded dataset for a project."""
+    db = current_app.db
+    project = db.projects.find_one(live({'_id': ObjectId(project_id)}))
+    if not project:
+        raise ValueError('Project not found')
+
+    out_dir = dataset_dir(project_id)
+    os.makedirs(out_dir, exist_ok=True)
+    total = db.video_segments.count_documents({
+        'video_id': {'$in': db.videos.distinct('_id', live({'project_id': project['_id']}))}
+    })
+    ctx.progress(0, total, 'Writing shards')
+
+    shards = {}
+    done = 0
+    skipped = 0
+    workers = Config.DATASET_WORKERS
+    # spawn: forking a threaded server process is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = set()
+
+        def collect(futures):
+            nonlocal done
+            for future in futures:
+                info = future.result()
+                shards[info['name']] = info
+                done += info['samples']
+            ctx.progress(done, total)
+
+        for index, samples in enumerate(_iter_shards(db, project)):
+            name = _shard_name(index)
+            info = _completed_shard(out_dir, name, samples)
+            if info:
+                shards[info['name']] = info
+                done += info['samples']
+                skipped += 1
+                continue
+            pending.add(pool.submit(write_shard, out_dir, name, samples))
+            # Keep only a few shards' specs in memory at a time
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        finished, _ = wait(pending)
+        collect(finished)
+
+    # Shards left over from an earlier, larger export
+    names = set(shards)
+    for filename in os.listdir(out_dir):
+        base = filename.rsplit('.', 1)[0]
+        if filename.startswith('shard-') and f'{base}.tar' not in names:
+            os.remove(os.path.join(out_dir, filename))
+
+    ordered = [
+        {k: v for k, v in shards[name].items() if k not in ('keys', 'digest')} for name in sorted(shards)
+    ]
+    index = {
+        'format': DATASET_FORMAT,
+        'project': {'id': str(project['_id']), 'name': project.get('name', '')},
+        'frames_per_sample': FRAMES_PER_SEGMENT,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'total_samples': done,
+        'shards': ordered
+    }
+    tmp_path = os.path.join(out_dir, 'index.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, 'index.json'))
+
+    ctx.progress(done, total, 'Dataset ready')
+    return {
+        'directory': os.path.basename(out_dir),
+        'shards': len(ordered),
+        'reused_shards': skipped,
+        'samples': done,
+        'size': sum(s['size'] for s in ordered)
+    }
@@ -0,0 +1,87 @@
+"""On-disk cache of export payloads keyed by content version.
+
+Files live in ``EXPORT_FOLDER/cache`` as
+``<kind>_<id>_<variant>_v<version>.<ext>``; writing a new version removes
+the older files for the same kind/id/variant. The version string doubles
+as a strong ETag, so unchanged exports are answered with 304 or served
+straight from disk without touching the annotation collections.
+"""
+import glob
+import os
+import uuid
+from flask import Response, request, send_file
+from config import Config
+
+CACHE_DIR = os.path.join(Config.EXPORT_FOLDER, 'cache')
+
+
+def remove_cached(kind, doc_id):
+    """Drop every cached export of one document (all variants and versions)."""
+    for path in glob.glob(os.path.join(CACHE_DIR, f'{kind}_{doc_id}_*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ExportCacheEntry:
+    def __init__(self, kind, doc_id, variant, version, ext='json'):
+        self.prefix = f'{kind}_{doc_id}_{variant}_v'
+        self.path = os.path.join(CACHE_DIR, f'{self.prefix}{version}.{ext}')
+        self.etag = f'{kind}-{doc_id}-{variant}-{version}'
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _commit(self, tmp_path):
+        os.replace(tmp_path, self.path)
+        for stale in glob.glob(os.path.join(CACHE_DIR, f'{self.prefix}*')):
+            if stale != self.path and not stale.endswith('.tmp'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def _tmp_path(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        return f'{self.path}.{uuid.uuid4().hex}.tmp'
+
+    def store(self, data):
+        tmp_path = self._tmp_path()
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        self._commit(tmp_path)
+
+    def tee(self, chunks):
+        """Yield ``chunks`` while writing them; cached only if fully consumed."""
+        tmp_path = self._tmp_path()
+        committed = False
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            self._commit(tmp_path)
+            committed = True
+        finally:
+            if not committed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def not_modified(self):
+        """304 response if the client already has this version, else None."""
+        if request.if_none_match.contains_weak(self.etag):
+            response = Response(status=304)
+            response.set_etag(self.etag)
+            return response
+        return None
+
+    def send(self, mimetype, download_name=None):
+        return send_file(
+            self.path,
+            mimetype=mimetype,
+            as_attachment=bool(download_name),
+            download_name=download_name,
+            etag=self.etag,
+            conditional=True,
+            max_age=0
+        )
@@ -0,0 +1,306 @@
+"""Background project exports written as compressed archives.
+
+Archive layout::
+
+    annotations.json            video_annotation_v1, masks as archive paths
+    masks/<sha256>.png          one file per distinct mask (or .rle.json)
+    thumbnails/<video_id>.jpg   video thumbnails
+
+With ``data_format='parquet'`` the archive instead holds the columnar
+dataset from ``utils.parquet_export`` (masks as RLE inside ``regions``).
+``archive='none'`` leaves that dataset as a plain directory, served file
+by file, so readers can memory-map it and read only the columns they need.
+
+Archives and dataset directories are deleted ``EXPORT_RETENTION_HOURS``
+after they were last written, and partial files once the job writing
+them is gone (``prune_exports``, run when an export job ends and at
+startup). A purged project's exports go with it.
+"""
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import time
+import zipfile
+from bson import ObjectId
+from flask import current_app
+from config import Config
+from utils.export_cache import remove_cached
+from utils.exporter import iter_project_records, json_chunks
+from utils.jobs import on_job_released
+from utils.mask_store import mask_rle, read_mask_bytes
+from utils.parquet_export import write_project_parquet
+from utils.purge import live
+
+EXPORT_JOB_TYPES = ('export_archive', 'export_dataset')
+ARCHIVE_FORMATS = ('zip', 'tar.zst', 'none')
+MASK_FORMATS = ('png', 'rle')
+DATA_FORMATS = ('json', 'parquet')
+
+
+class _ZipWriter:
+    def __init__(self, path):
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+
+    def add_file(self, arcname, path, compress=True):
+        self._zip.write(path, arcname, zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED)
+
+    def add_bytes(self, arcname, data, compress=True):
+        self._zip.writestr(arcname, data, zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED)
+
+    def close(self):
+        self._zip.close()
+
+
+class _TarZstWriter:
+    def __init__(self, path):
+        import zstandard
+
+        self._file = open(path, 'wb')
+        self._stream = zstandard.ZstdCompressor(level=Config.EXPORT_ZSTD_LEVEL).stream_writer(self._file)
+        self._tar = tarfile.open(fileobj=self._stream, mode='w|')
+
+    def add_file(self, arcname, path, compress=True):
+        self._tar.add(path, arcname)
+
+    def add_bytes(self, arcname, data, compress=True):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._tar.close()
+        self._stream.close()
+        self._file.close()
+
+
+def archive_path(filename):
+    return os.path.join(Config.EXPORT_FOLDER, filename)
+
+
+# project_<project id>_<job id>.<ext>, plus .tmp / .d while being written
+_ARCHIVE_RE = re.compile(r'^project_(?P<project>[0-9a-f]{24})_(?P<job>[0-9a-f]{24})\.')
+_DATASET_RE = re.compile(r'^dataset_(?P<project>[0-9a-f]{24})$')
+
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def prune_exports(db):
+    """Delete expired archives and datasets and leftovers of dead export jobs; returns the count."""
+    if not os.path.isdir(Config.EXPORT_FOLDER):
+        return 0
+    # Listed before the jobs are read: a file created since belongs to a job read as active
+    names = os.listdir(Config.EXPORT_FOLDER)
+    running_archives, running_datasets = set(), set()
+    for job in db.jobs.find({'active': True, 'type': {'$in': list(EXPORT_JOB_TYPES)}}, {'type': 1, 'key': 1}):
+        if job['type'] == 'export_archive':
+            running_archives.add(str(job['_id']))
+        else:
+            running_datasets.add(job['key'])
+
+    cutoff = time.time() - Config.EXPORT_RETENTION_HOURS * 3600
+    removed = 0
+    for name in names:
+        path = os.path.join(Config.EXPORT_FOLDER, name)
+        try:
+            expired = os.path.getmtime(path) < cutoff
+        except OSError:
+            continue
+        archive = _ARCHIVE_RE.match(name)
+        dataset = _DATASET_RE.match(name)
+        if archive:
+            if archive['job'] in running_archives:
+                continue
+            if not expired and not name.endswith(('.tmp', '.d')):
+                continue
+        elif not dataset or dataset['project'] in running_datasets or not expired:
+            continue
+        _remove_path(path)
+        removed += 1
+    return removed
+
+
+def remove_project_exports(project_id):
+    """Delete a project's archives, dataset and cached export."""
+    for path in glob.glob(os.path.join(Config.EXPORT_FOLDER, f'project_{project_id}_*')):
+        _remove_path(path)
+    _remove_path(os.path.join(Config.EXPORT_FOLDER, f'dataset_{project_id}'))
+    remove_cached('project', project_id)
+
+
+def _prune_released(outcome):
+    prune_exports(current_app.db)
+
+
+for _job_type in EXPORT_JOB_TYPES:
+    on_job_released(_job_type, _prune_released)
+
+
+def _build_parquet_archive(ctx, project, archive_format, total):
+    db = current_app.db
+    project_id = str(project['_id'])
+    if archive_format == 'none':
+        return _build_parquet_directory(ctx, project, total)
+
+    filename = f'project_{project_id}_{ctx.job_id}.parquet.{archive_format}'
+    final_path = archive_path(filename)
+    tmp_path = f'{final_path}.tmp'
+    staging_dir = f'{final_path}.d'
+
+    def progress(done):
+        ctx.progress(done, total)
+
+    try:
+        files = write_project_parquet(db, project, staging_dir, progress)
+        writer = _ZipWriter(tmp_path) if archive_format == 'zip' else _TarZstWriter(tmp_path)
+        try:
+            for path in files:
+                # Parquet pages are already zstd-compressed
+                writer.add_file(os.path.relpath(path, staging_dir), path, compress=False)
+        finally:
+            writer.close()
+        os.replace(tmp_path, final_path)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    ctx.progress(total, total, 'Archive ready')
+    return {
+        'filename': filename,
+        'size': os.path.getsize(final_path),
+        'videos': total,
+        'files': len(files)
+    }
+
+
+def _build_parquet_directory(ctx, project, total):
+    """Write the Parquet dataset uncompressed under EXPORT_FOLDER; files are served one by one."""
+    directory = f'project_{project["_id"]}_{ctx.job_id}.parquet'
+    final_dir = archive_path(directory)
+    staging_dir = f'{final_dir}.d'
+
+    def progress(done):
+        ctx.progress(done, total)
+
+    try:
+        files = write_project_parquet(current_app.db, project, staging_dir, progress)
+        names = [os.path.relpath(path, staging_dir).replace(os.sep, '/') for path in files]
+        size = sum(os.path.getsize(path) for path in files)
+        os.replace(staging_dir, final_dir)
+        os.utime(final_dir)  # retention counts from completion
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    ctx.progress(total, total, 'Dataset ready')
+    return {
+        'directory': directory,
+        'size': size,
+        'videos': total,
+        'files': names
+    }
+
+
+def build_project_archive(ctx, project_id, archive_format, mask_format, data_format='json'):
+    """Job function: write the project archive and return its metadata."""
+    db = current_app.db
+    project = db.projects.find_one(live({'_id': ObjectId(project_id)}))
+    if not project:
+        raise ValueError('Project not found')
+
+    total = db.videos.count_documents(live({'project_id': project['_id']}))
+    os.makedirs(Config.EXPORT_FOLDER, exist_ok=True)
+    if data_format == 'parquet':
+        ctx.progress(0, total, 'Writing parquet tables')
+        return _build_parquet_archive(ctx, project, archive_format, total)
+
+    ctx.progress(0, total, 'Exporting videos')
+
+    thumbnails = {
+        v['_id']: v['thumbnail']
+        for v in db.videos.find(live({'project_id': project['_id']}), {'thumbnail': 1})
+        if v.get('thumbnail')
+    }
+
+    filename = f'project_{project_id}_{ctx.job_id}.{archive_format}'
+    final_path = archive_path(filename)
+    tmp_path = f'{final_path}.tmp'
+    json_tmp_path = f'{final_path}.json.tmp'
+
+    writer = _ZipWriter(tmp_path) if archive_format == 'zip' else _TarZstWriter(tmp_path)
+    written_masks = set()
+    done = 0
+
+    def externalize_masks(video_data):
+        for seg in video_data['segments']:
+            for region in seg['regions']:
+                value = region.get('segmented_mask')
+                if not value:
+                    continue
+                data = read_mask_bytes(value)
+                digest = hashlib.sha256(data).hexdigest()
+                if mask_format == 'rle':
+                    arcname = f'masks/{digest}.rle.json'
+                    if digest not in written_masks:
+                        writer.add_bytes(arcname, json.dumps(mask_rle(data)).encode('utf-8'))
+                else:
+                    arcname = f'masks/{digest}.png'
+                    if digest not in written_masks:
+                        writer.add_bytes(arcname, data, compress=False)
+                written_masks.add(digest)
+                region['segmented_mask'] = arcname
+
+    def records():
+        nonlocal done
+        for kind, data in iter_project_records(db, project, masks='url'):
+            if kind == 'video':
+                externalize_masks(data)
+                thumb = thumbnails.get(ObjectId(data['id']))
+                thumb_path = os.path.join(Config.UPLOAD_FOLDER, 'thumbnails', thumb) if thumb else None
+                if thumb_path and os.path.exists(thumb_path):
+                    writer.add_file(f'thumbnails/{data["id"]}.jpg', thumb_path, compress=False)
+                    data['thumbnail'] = f'thumbnails/{data["id"]}.jpg'
+                done += 1
+                if done % 10 == 0 or done == total:
+                    ctx.progress(done, total)
+            yield kind, data
+
+    try:
+        # The annotation JSON is spooled to disk so memory stays flat
+        with open(json_tmp_path, 'w', encoding='utf-8') as f:
+            for chunk in json_chunks(records(), current_app.json.dumps):
+                f.write(chunk)
+        writer.add_file('annotations.json', json_tmp_path)
+        writer.close()
+        os.replace(tmp_path, final_path)
+    except Exception:
+        try:
+            writer.close()
+        except Exception:
+            pass
+        raise
+    finally:
+        if os.path.exists(json_tmp_path):
+            os.remove(json_tmp_path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    ctx.progress(done, total, 'Archive ready')
+    return {
+        'filename': filename,
+        'size': os.path.getsize(final_path),
+        'videos': done,
+        'masks': len(written_masks)
+    }
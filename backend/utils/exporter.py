@@ -0,0 +1,355 @@
+"""Batched builders for the ``video_annotation_v1`` export format.
+
+Videos are processed in batches: one query per collection per batch
+(segments, regions, captions) instead of one query per segment/region,
+so memory stays bounded by the batch size rather than the project size.
+"""
+import base64
+from datetime import datetime, timezone
+from config import Config
+from utils.mask_store import region_mask_data, region_mask_url
+from utils.purge import live
+
+EXPORT_FORMAT = 'video_annotation_v1'
+EXPORT_LANGUAGES = ['en', 'vi']
+
+# Region fields never needed in exports (legacy inline brush strokes)
+EXPORT_REGION_PROJECTION = {'brush_mask': 0, 'brush_mask_ref': 0}
+
+
+def batched(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _region_mask(region, masks):
+    if masks == 'url':
+        return region_mask_url(region)
+    if masks == 'none':
+        return ''
+    return region_mask_data(region)
+
+
+def _build_region(r, caption, masks):
+    return {
+        'id': str(r['_id']),
+        'label': r.get('label', ''),
+        'color': r.get('color', ''),
+        'category': r.get('category_name', ''),
+        'frame_time': r['frame_time'],
+        'segmented_mask': _region_mask(r, masks),
+        'captions': {
+            'en': {
+                'visual': caption.get('visual_caption', '') if caption else '',
+                'knowledge': caption.get('knowledge_caption', '') if caption else '',
+                'combined': caption.get('combined_caption', '') if caption else ''
+            },
+            'vi': {
+                'visual': caption.get('visual_caption_vi', '') if caption else '',
+                'knowledge': caption.get('knowledge_caption_vi', '') if caption else '',
+                'combined': caption.get('combined_caption_vi', '') if caption else ''
+            }
+        }
+    }
+
+
+def _build_segment_caption(c):
+    return {
+        'en': {
+            'contextual': c.get('contextual_caption', ''),
+            'knowledge': c.get('knowledge_caption', ''),
+            'combined': c.get('combined_caption', '')
+        },
+        'vi': {
+            'contextual': c.get('contextual_caption_vi', ''),
+            'knowledge': c.get('knowledge_caption_vi', ''),
+            'combined': c.get('combined_caption_vi', '')
+        }
+    }
+
+
+def _build_segment(seg, regions_data, segment_captions):
+    """Segment record; ``regions_data`` None leaves out the regions key."""
+    seg_data = {
+        'id': str(seg['_id']),
+        'name': seg.get('name', ''),
+        'start_time': seg['start_time'],
+        'end_time': seg['end_time'],
+        'duration': round(seg['end_time'] - seg['start_time'], 3),
+        'regions': regions_data,
+        'segment_captions': [_build_segment_caption(c) for c in segment_captions]
+    }
+    if regions_data is None:
+        del seg_data['regions']
+    return seg_data
+
+
+def _build_video(video, segments_data):
+    """Video record; ``segments_data`` None leaves out the segments key."""
+    video_data = {
+        'id': str(video['_id']),
+        'filename': video.get('original_name', ''),
+        'duration': video.get('duration', 0),
+        'width': video.get('width', 0),
+        'height': video.get('height', 0),
+        'fps': video.get('fps', 0),
+        'segments': segments_data
+    }
+    if segments_data is None:
+        del video_data['segments']
+    return video_data
+
+
+def _export_batch(db, videos, masks):
+    video_ids = [v['_id'] for v in videos]
+
+    segments_by_video = {}
+    for seg in db.video_segments.find({'video_id': {'$in': video_ids}}).sort('order', 1):
+        segments_by_video.setdefault(seg['video_id'], []).append(seg)
+    segment_ids = [s['_id'] for segs in segments_by_video.values() for s in segs]
+
+    regions_by_segment = {}
+    for r in db.object_regions.find({'segment_id': {'$in': segment_ids}}, EXPORT_REGION_PROJECTION):
+        regions_by_segment.setdefault(r['segment_id'], []).append(r)
+
+    region_captions = {}
+    segment_captions = {}
+    for c in db.captions.find({'segment_id': {'$in': segment_ids}}):
+        if c.get('region_id'):
+            # First caption wins, as with find_one()
+            region_captions.setdefault(c['region_id'], c)
+        else:
+            segment_captions.setdefault(c['segment_id'], []).append(c)
+
+    for video in videos:
+        segments_data = [
+            _build_segment(seg, [
+                _build_region(r, region_captions.get(r['_id']), masks)
+                for r in regions_by_segment.get(seg['_id'], [])
+            ], segment_captions.get(seg['_id'], []))
+            for seg in segments_by_video.get(video['_id'], [])
+        ]
+        yield _build_video(video, segments_data)
+
+
+def iter_video_exports(db, videos, masks='inline', batch_size=None):
+    """Yield export dicts for ``videos`` (any iterable, e.g. a cursor)."""
+    batch_size = batch_size or Config.EXPORT_BATCH_SIZE
+    for batch in batched(videos, batch_size):
+        yield from _export_batch(db, batch, masks)
+
+
+def video_totals(video_data):
+    """(segments, regions, captions) counted the way dataset_info reports them."""
+    segments = len(video_data['segments'])
+    regions = 0
+    captions = 0
+    for seg in video_data['segments']:
+        regions += len(seg['regions'])
+        captions += sum(1 for r in seg['regions'] if r.get('captions', {}).get('en', {}).get('visual'))
+        captions += len(seg.get('segment_captions') or [])
+    return segments, regions, captions
+
+
+def build_subparts(db, project_id):
+    """Subpart list with video ids, resolved with one aggregation."""
+    video_ids = {
+        group['_id']: [str(vid) for vid in group['video_ids']]
+        for group in db.videos.aggregate([
+            {'$match': live({'project_id': project_id})},
+            {'$group': {'_id': '$subpart_id', 'video_ids': {'$push': '$_id'}}}
+        ])
+    }
+    return [{
+        'id': str(sp['_id']),
+        'name': sp.get('name', ''),
+        'description': sp.get('description', ''),
+        'order': sp.get('order', 0),
+        'video_ids': video_ids.get(sp['_id'], [])
+    } for sp in db.subparts.find({'project_id': project_id}).sort('order', 1)]
+
+
+def project_info(project, subparts):
+    return {
+        'id': str(project['_id']),
+        'name': project.get('name', ''),
+        'description': project.get('description', ''),
+        'status': project.get('status', ''),
+        'subparts': subparts
+    }
+
+
+def encode_cursor(dt):
+    """Opaque export cursor for a point in time."""
+    return base64.urlsafe_b64encode(f'v1:{dt.isoformat()}'.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(); raises ValueError on a bad cursor."""
+    try:
+        version, iso = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split(':', 1)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if version != 'v1':
+        raise ValueError('Unsupported cursor version')
+    return parse_timestamp(iso)
+
+
+def parse_timestamp(value):
+    """ISO-8601 timestamp (a trailing Z is accepted) as an aware UTC datetime."""
+    dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def dataset_info(project, total_videos, total_segments, total_regions, total_captions=None, cursor=None):
+    info = {
+        'name': project.get('name', ''),
+        'description': project.get('description', ''),
+        'version': '1.0',
+        'format': EXPORT_FORMAT,
+        'export_date': datetime.utcnow().isoformat() + 'Z',
+        'total_videos': total_videos,
+        'total_segments': total_segments,
+        'total_regions': total_regions,
+    }
+    if total_captions is not None:
+        info['total_captions'] = total_captions
+    info['languages'] = EXPORT_LANGUAGES
+    if cursor:
+        # Pass back as ?cursor= to the delta export to get later changes
+        info['cursor'] = cursor
+    return info
+
+
+def iter_project_records(db, project, masks='inline'):
+    """Yield ('project', dict), then ('video', dict) per video, then
+    ('dataset_info', dict) with the totals once every video is built."""
+    cursor = encode_cursor(datetime.now(timezone.utc))
+    yield 'project', project_info(project, build_subparts(db, project['_id']))
+
+    totals = [0, 0, 0, 0]
+    videos = db.videos.find(live({'project_id': project['_id']})).batch_size(Config.EXPORT_BATCH_SIZE)
+    for video_data in iter_video_exports(db, videos, masks):
+        segments, regions, captions = video_totals(video_data)
+        totals[0] += 1
+        totals[1] += segments
+        totals[2] += regions
+        totals[3] += captions
+        yield 'video', video_data
+
+    yield 'dataset_info', dataset_info(project, *totals, cursor=cursor)
+
+
+def build_project_delta(db, project, since, masks='inline'):
+    """Changes to a project's annotations in (since, now].
+
+    Upserts are whole records in the video_annotation_v1 shape: videos
+    (metadata only), segments (with segment captions) and regions (with
+    captions). A changed or deleted caption re-emits its region/segment.
+    Deleted videos, segments and regions are listed as tombstones.
+    """
+    until = datetime.now(timezone.utc)
+    window = {'$gt': since, '$lte': until}
+    project_id = project['_id']
+    video_ids = [v['_id'] for v in db.videos.find(live({'project_id': project_id}), {'_id': 1})]
+
+    videos = list(db.videos.find(live({'project_id': project_id, 'updated_at': window})))
+    tombstones = list(db.tombstones.find({'project_id': project_id, 'deleted_at': window}).sort('deleted_at', 1))
+
+    touched_regions, touched_segments = set(), set()
+    caption_changes = db.captions.find(
+        {'video_id': {'$in': video_ids}, 'updated_at': window},
+        {'segment_id': 1, 'region_id': 1}
+    )
+    deleted_captions = [t for t in tombstones if t['collection'] == 'captions']
+    for c in list(caption_changes) + deleted_captions:
+        if c.get('region_id'):
+            touched_regions.add(c['region_id'])
+        elif c.get('segment_id'):
+            touched_segments.add(c['segment_id'])
+
+    regions = list(db.object_regions.find({'$or': [
+        {'video_id': {'$in': video_ids}, 'updated_at': window},
+        {'_id': {'$in': list(touched_regions)}}
+    ]}, EXPORT_REGION_PROJECTION))
+    segments = list(db.video_segments.find({'$or': [
+        {'video_id': {'$in': video_ids}, 'updated_at': window},
+        {'_id': {'$in': list(touched_segments)}}
+    ]}).sort('order', 1))
+
+    region_captions, segment_captions = {}, {}
+    for c in db.captions.find({'$or': [
+        {'region_id': {'$in': [r['_id'] for r in regions]}},
+        {'segment_id': {'$in': [s['_id'] for s in segments]}, 'region_id': None}
+    ]}):
+        if c.get('region_id'):
+            region_captions.setdefault(c['region_id'], c)
+        else:
+            segment_captions.setdefault(c['segment_id'], []).append(c)
+
+    deleted_types = {'videos': 'video', 'video_segments': 'segment', 'object_regions': 'region'}
+    changes = {
+        'videos': [_build_video(v, None) for v in videos],
+        'segments': [],
+        'regions': [],
+        'deleted': [{
+            'type': deleted_types[t['collection']],
+            'id': str(t['doc_id']),
+            'video_id': str(t['video_id']) if t.get('video_id') else None,
+            'segment_id': str(t['segment_id']) if t.get('segment_id') else None,
+            'deleted_at': t['deleted_at'].isoformat()
+        } for t in tombstones if t['collection'] in deleted_types]
+    }
+    for seg in segments:
+        seg_data = _build_segment(seg, None, segment_captions.get(seg['_id'], []))
+        seg_data['video_id'] = str(seg['video_id'])
+        seg_data['order'] = seg.get('order', 0)
+        changes['segments'].append(seg_data)
+    for r in regions:
+        region_data = _build_region(r, region_captions.get(r['_id']), masks)
+        region_data['segment_id'] = str(r['segment_id'])
+        region_data['video_id'] = str(r['video_id'])
+        changes['regions'].append(region_data)
+
+    info = dataset_info(
+        project, len(changes['videos']), len(changes['segments']), len(changes['regions']),
+        cursor=encode_cursor(until)
+    )
+    info['export_type'] = 'delta'
+    info['since'] = since.isoformat()
+    return {
+        'dataset_info': info,
+        'project': project_info(project, build_subparts(db, project_id)),
+        'changes': changes
+    }
+
+
+def jsonl_chunks(records, dumps):
+    """One JSON object per line: {"type": <kind>, <kind>: {...}}."""
+    for kind, data in records:
+        yield dumps({'type': kind, kind: data}) + '\n'
+
+
+def json_chunks(records, dumps):
+    """The regular export document, written one video at a time.
+
+    dataset_info comes last because its totals are only known at the end.
+    """
+    first_video = True
+    for kind, data in records:
+        if kind == 'project':
+            yield '{"project":' + dumps(data) + ',"videos":['
+        elif kind == 'video':
+            yield ('' if first_video else ',') + dumps(data)
+            first_video = False
+        else:
+            yield '],"' + kind + '":' + dumps(data) + '}'
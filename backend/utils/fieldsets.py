@@ -0,0 +1,107 @@
+"""Sparse fieldsets for read endpoints (``?fields=`` / ``?exclude=``).
+
+Both parameters take comma-separated response keys; dotted names select
+nested keys, e.g. ``?fields=id,frame_time,caption.visual_caption`` or
+``?exclude=segmented_mask,caption``. A Fieldset answers two questions:
+which Mongo fields need to be read (``projection``) and which expensive
+parts of a response need to be built at all (``wants``).
+"""
+from flask import request
+
+
+def _parse(value):
+    """Turn 'a,b.c,b.d' into {'a': {}, 'b': {'c': {}, 'd': {}}}.
+
+    An empty dict means "the whole key".
+    """
+    tree = {}
+    for item in (value or '').split(','):
+        parts = [p for p in item.strip().split('.') if p]
+        if not parts:
+            continue
+        node = tree
+        for i, part in enumerate(parts):
+            if part in node and node[part] == {} and i < len(parts) - 1:
+                break  # whole key already selected
+            if i == len(parts) - 1:
+                node[part] = {}
+            else:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class Fieldset:
+    def __init__(self, fields=None, exclude=None):
+        # ``fields`` None means "everything"
+        self.fields = fields or None
+        self.exclude = exclude or {}
+
+    @classmethod
+    def from_request(cls):
+        return cls(_parse(request.args.get('fields')), _parse(request.args.get('exclude')))
+
+    @property
+    def is_full(self):
+        return self.fields is None and not self.exclude
+
+    def wants(self, key):
+        if self.exclude.get(key) == {}:
+            return False
+        return self.fields is None or key in self.fields
+
+    def sub(self, key):
+        """Fieldset for a nested key."""
+        fields = self.fields.get(key) if self.fields else None
+        return Fieldset(fields or None, self.exclude.get(key) or {})
+
+    def apply(self, data):
+        """Drop unwanted keys from a serialized dict (recursively)."""
+        if self.is_full or not isinstance(data, dict):
+            return data
+        result = {}
+        for key, value in data.items():
+            if not self.wants(key):
+                continue
+            sub = self.sub(key)
+            if not sub.is_full:
+                if isinstance(value, list):
+                    value = [sub.apply(v) for v in value]
+                else:
+                    value = sub.apply(value)
+            result[key] = value
+        return result
+
+    def projection(self, field_map=None, always=('_id',)):
+        """Mongo projection for the wanted response keys.
+
+        ``field_map`` maps a response key to the document fields it is built
+        from (an empty tuple for keys computed from other collections); keys
+        not in the map are read from the document field of the same name.
+        ``always`` lists cheap fields the serializer reads unconditionally.
+        Returns None when the whole document is needed.
+        """
+        field_map = field_map or {}
+
+        def db_fields(key):
+            return field_map.get(key, (key,))
+
+        if self.fields is not None:
+            projection = {f: 1 for f in always}
+            for key in self.fields:
+                if self.wants(key):
+                    projection.update({f: 1 for f in db_fields(key)})
+            return projection
+
+        if self.exclude:
+            excluded = [k for k, v in self.exclude.items() if v == {}]
+            needed = set(always)
+            for key, fields in field_map.items():
+                if key not in excluded:
+                    needed.update(fields)
+            projection = {
+                f: 0 for key in excluded for f in db_fields(key)
+                if f not in needed
+            }
+            return projection or None
+
+        return None
@@ -0,0 +1,214 @@
+"""Decoded frame cache behind ``GET /api/videos/<id>/frame(s)``.
+
+Frames are addressed by index (``round(t * fps)``), so every timestamp
+inside one frame maps to the same entry. A lookup tries, in order:
+
+1. an in-process LRU of encoded images, bounded by ``FRAME_CACHE_MB``
+2. ``uploads/frames/<stem>_f<index>_<width>.<ext>`` on disk
+3. ffmpeg: misses are grouped by the keyframe before them (the ingest
+   ``video_keyframes`` index) and each group is decoded in one run that
+   seeks straight to that keyframe and stops after the last wanted frame
+
+Frame files are named after the video file, which is never rewritten, so
+a name always holds the same image and is served as immutable.
+"""
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from config import Config
+
+FRAME_DIR = os.path.join(Config.UPLOAD_FOLDER, 'frames')
+FRAME_WIDTHS = (160, 320, 640, 1280)
+MAX_BATCH_FRAMES = 64
+FRAME_FORMATS = {
+    'jpeg': {'ext': 'jpg', 'mimetype': 'image/jpeg', 'args': ['-q:v', '3']},
+    'webp': {'ext': 'webp', 'mimetype': 'image/webp', 'args': ['-c:v', 'libwebp', '-quality', '80']},
+}
+
+# Keyframe times in the index are rounded to the millisecond
+_KEYFRAME_SLACK = 0.001
+
+
+class _FrameLRU:
+    """Encoded frames by file name, bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            data = self.items.get(name)
+            if data is not None:
+                self.items.move_to_end(name)
+            return data
+
+    def put(self, name, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.items.pop(name, None)
+            if old is not None:
+                self.size -= len(old)
+            self.items[name] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard_prefix(self, prefix):
+        with self.lock:
+            for name in [n for n in self.items if n.startswith(prefix)]:
+                self.size -= len(self.items.pop(name))
+
+
+_memory = _FrameLRU(Config.FRAME_CACHE_MB * 1024 * 1024)
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def frame_index(t, fps):
+    """Cache index of the frame shown at ``t``: its number, or milliseconds without ``fps``."""
+    return max(0, round(t * fps) if fps else round(t * 1000))
+
+
+def frame_time(index, fps):
+    return index / fps if fps else index / 1000
+
+
+def frame_name(stem, index, width=None, fmt='jpeg', fps=None):
+    unit = 'f' if fps else 't'
+    return f'{stem}_{unit}{index:07d}_{width or "full"}.{FRAME_FORMATS[fmt]["ext"]}'
+
+
+def _read(name):
+    try:
+        with open(os.path.join(FRAME_DIR, name), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _decode_groups(indexes, fps, keyframes):
+    """``[(keyframe, [(index, frame number counted from the keyframe)])]``."""
+    groups = {}
+    for i in sorted(indexes):
+        k = bisect_right(keyframes, frame_time(i, fps) + _KEYFRAME_SLACK)
+        keyframe = keyframes[k - 1] if k else 0.0
+        groups.setdefault(keyframe, []).append(i)
+    return [
+        (keyframe, [(i, max(0, i - round(keyframe * fps))) for i in members])
+        for keyframe, members in groups.items()
+    ]
+
+
+def _decode(path, seek_args, filters, wanted, fmt, names):
+    """Run ffmpeg for ``wanted`` frames into ``FRAME_DIR``; returns ``{name: bytes}`` produced."""
+    spec = FRAME_FORMATS[fmt]
+    os.makedirs(FRAME_DIR, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='.decode-', dir=FRAME_DIR)
+    try:
+        result = subprocess.run([
+            Config.FFMPEG_BIN, '-v', 'error', '-nostdin', *seek_args, '-i', path, '-an', '-sn',
+            *(['-vf', ','.join(filters)] if filters else []), '-fps_mode', 'passthrough',
+            '-frames:v', str(len(wanted)), *spec['args'], '-start_number', '0',
+            os.path.join(work_dir, f'%03d.{spec["ext"]}')
+        ], capture_output=True, timeout=120)
+        frames = {}
+        if result.returncode != 0:
+            return frames
+        for k, index in enumerate(wanted):
+            produced = os.path.join(work_dir, f'{k:03d}.{spec["ext"]}')
+            if not os.path.exists(produced):
+                break  # past the last frame
+            with open(produced, 'rb') as f:
+                frames[names[index]] = f.read()
+            os.replace(produced, os.path.join(FRAME_DIR, names[index]))
+        return frames
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _decode_missing(path, indexes, fps, keyframes, width, fmt, names):
+    scale = [f"scale='min(iw\\,{width})':-2"] if width else []
+    if not fps or not keyframes:
+        # No seek index: one accurate seek per frame
+        frames = {}
+        for i in indexes:
+            seek_args = ['-ss', f'{frame_time(i, fps):.3f}']
+            frames.update(_decode(path, seek_args, scale, [i], fmt, names))
+        return frames
+
+    frames = {}
+    for keyframe, wanted in _decode_groups(indexes, fps, keyframes):
+        # Land on the keyframe itself and number frames from it
+        seek_args = ['-noaccurate_seek', '-ss', f'{keyframe + _KEYFRAME_SLACK:.3f}']
+        select = "select='" + '+'.join(f'eq(n\\,{n})' for _, n in wanted) + "'"
+        frames.update(_decode(path, seek_args, [select, *scale], [i for i, _ in wanted], fmt, names))
+    return frames
+
+
+def get_frames(path, times, fps=None, keyframes=None, width=None, fmt='jpeg'):
+    """Encoded frames of the video file ``path`` at ``times`` (seconds).
+
+    Returns ``[(name, bytes)]`` in the order of ``times``; ``bytes`` is
+    None for times past the last decodable frame.
+    """
+    stem = _stem(path)
+    indexes = [frame_index(t, fps) for t in times]
+    names = {i: frame_name(stem, i, width, fmt, fps) for i in indexes}
+    found = {}
+    for i, name in names.items():
+        data = _memory.get(name)
+        if data is None:
+            data = _read(name)
+            if data is not None:
+                _memory.put(name, data)
+        if data is not None:
+            found[name] = data
+
+    missing = [i for i, name in names.items() if name not in found]
+    if missing:
+        for name, data in _decode_missing(path, missing, fps, keyframes, width, fmt, names).items():
+            _memory.put(name, data)
+            found[name] = data
+    return [(names[i], found.get(names[i])) for i in indexes]
+
+
+def remove_frame_files(filename):
+    """Drop the cached frames of a video file."""
+    stem = _stem(filename)
+    _memory.discard_prefix(f'{stem}_')
+    if not os.path.isdir(FRAME_DIR):
+        return
+    for name in os.listdir(FRAME_DIR):
+        if name.startswith(f'{stem}_'):
+            try:
+                os.remove(os.path.join(FRAME_DIR, name))
+            except OSError:
+                pass
+
+
+def video_frames(db, video, times, width=None, fmt='jpeg'):
+    """``get_frames`` for a video document, seeking from its keyframe index.
+
+    Times past the end give the last frame rather than decoding to the end
+    of the file to find nothing.
+    """
+    from utils.ingest import keyframe_index, video_file_path
+    fps, duration = video.get('fps'), video.get('duration')
+    if fps and duration:
+        last = (math.ceil(duration * fps) - 1) / fps
+        times = [min(t, last) for t in times]
+    return get_frames(
+        video_file_path(video), times, video.get('fps'), keyframe_index(db, video['_id']), width, fmt
+    )
@@ -0,0 +1,68 @@
+"""Frame sampling and extraction shared by captioning and dataset exports."""
+import subprocess
+from config import Config
+from utils.frame_cache import get_frames
+
+FRAMES_PER_SEGMENT = 8
+
+
+def segment_frame_times(start_time, end_time, count=FRAMES_PER_SEGMENT):
+    """Evenly spaced timestamps covering the segment, both ends included.
+
+    Mirrors the editor's ``captureSegmentFrames`` so exported frames match
+    the ones sent to the DAM server.
+    """
+    duration = end_time - start_time
+    if duration <= 0 or count < 2:
+        return [start_time] * count
+    return [start_time + duration * i / (count - 1) for i in range(count)]
+
+
+def pad_or_trim_frames(frames: list, target: int = FRAMES_PER_SEGMENT) -> list:
+    """
+    Ensure exactly `target` frames by duplicating the last frame or trimming.
+    This handles segments with < 8 or > 8 provided frames.
+    """
+    if len(frames) == 0:
+        return []
+    if len(frames) >= target:
+        # Evenly sample target frames
+        step = len(frames) / target
+        return [frames[int(i * step)] for i in range(target)]
+    # Pad by repeating last frame
+    while len(frames) < target:
+        frames.append(frames[-1])
+    return frames
+
+
+def extract_frame(video_path, timestamp, quality=3):
+    """Decode one frame at ``timestamp`` seconds as JPEG bytes (b'' if none)."""
+    result = subprocess.run([
+        Config.FFMPEG_BIN, '-v', 'error', '-nostdin',
+        '-ss', f'{max(timestamp, 0):.3f}', '-i', video_path,
+        '-frames:v', '1', '-q:v', str(quality),
+        '-f', 'image2pipe', '-vcodec', 'mjpeg', 'pipe:1'
+    ], capture_output=True, timeout=60)
+    if result.returncode != 0:
+        return b''
+    return result.stdout
+
+
+def extract_segment_frames(video_path, start_time, end_time, count=FRAMES_PER_SEGMENT,
+                           fps=None, keyframes=None):
+    """``count`` JPEG frames for a segment, through the frame cache.
+
+    Timestamps past the last decodable frame (e.g. ``end_time`` equal to the
+    video duration) are filled with the previous frame, as
+    ``pad_or_trim_frames`` does for short frame lists.
+    """
+    frames = []
+    for _, data in get_frames(video_path, segment_frame_times(start_time, end_time, count), fps, keyframes):
+        if data:
+            frames.append(data)
+        elif frames:
+            frames.append(frames[-1])
+    if frames and len(frames) < count:
+        # Leading timestamps failed; pad from the first good frame
+        frames = [frames[0]] * (count - len(frames)) + frames
+    return frames
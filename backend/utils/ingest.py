@@ -0,0 +1,416 @@
+"""Server-side ingest of uploaded videos.
+
+Every upload is ingested in the background and its ``status`` moves
+``uploaded → processing → ready`` (or ``failed``, with ``ingest_error``).
+The work runs in a process pool of ``Config.INGEST_WORKERS`` processes,
+so several videos are ingested at once:
+
+* ``ffprobe`` container/stream metadata (fps, duration, codec, size),
+  which replaces the duration/width/height sent by the browser
+* keyframe timestamps read from the packet index (no decoding), stored
+  in ``video_keyframes`` as the seek index for frame extraction
+* JPEG thumbnails at ``THUMBNAIL_WIDTHS`` from one decoded frame
+* timeline sprite sheets: a tile every ``SPRITE_INTERVAL`` seconds in
+  ``SPRITE_COLUMNS`` x ``SPRITE_ROWS`` JPEG grids, with a WebVTT and a
+  JSON index, so the editor can show scrub previews without seeking
+"""
+import io
+import json
+import math
+import multiprocessing
+import os
+import subprocess
+import uuid
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from config import Config
+from utils.frames import extract_frame
+from utils.versions import bump_video_version, bump_video_versions
+from utils.video_blobs import shared_video_ids
+
+THUMBNAIL_WIDTHS = (160, 320, 640)
+DEFAULT_THUMBNAIL_WIDTH = 320
+# Video fields that describe the file, so every video of a blob has the same values
+SHARED_FIELDS = (
+    'fps', 'duration', 'width', 'height', 'codec', 'pix_fmt', 'bit_rate', 'container', 'frame_count',
+    'thumbnails', 'sprites', 'keyframe_count', 'ingested_at', 'renditions'
+)
+THUMBNAIL_DIR = os.path.join(Config.UPLOAD_FOLDER, 'thumbnails')
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_MAX_TILES = 1200  # long videos get a wider interval instead of more sheets
+
+_pool = None
+
+
+class IngestError(RuntimeError):
+    pass
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: forking a threaded server process is not safe
+        _pool = ProcessPoolExecutor(
+            max_workers=Config.INGEST_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _pool
+
+
+def ensure_ingest_indexes(db):
+    db.video_keyframes.create_index('video_id', unique=True)
+
+
+# ==================== WORKER SIDE ====================
+
+def _rate(value):
+    """'30000/1001' -> 29.97..."""
+    try:
+        num, _, den = (value or '').partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _ffprobe(args, timeout):
+    try:
+        result = subprocess.run(
+            [Config.FFPROBE_BIN, '-v', 'error', *args],
+            capture_output=True, timeout=timeout
+        )
+    except FileNotFoundError:
+        raise IngestError(f'{Config.FFPROBE_BIN} not found')
+    if result.returncode != 0:
+        raise IngestError(result.stderr.decode('utf-8', 'replace').strip() or 'ffprobe failed')
+    return result.stdout.decode('utf-8', 'replace')
+
+
+def probe_video(path):
+    """Metadata of the first video stream."""
+    info = json.loads(_ffprobe(
+        ['-print_format', 'json', '-show_format', '-show_streams', '-select_streams', 'v:0', path],
+        timeout=120
+    ))
+    streams = info.get('streams') or []
+    if not streams:
+        raise IngestError('No video stream')
+    stream, fmt = streams[0], info.get('format', {})
+
+    fps = _rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate'))
+    duration = float(stream.get('duration') or fmt.get('duration') or 0)
+    width, height = int(stream.get('width') or 0), int(stream.get('height') or 0)
+    rotation = stream.get('tags', {}).get('rotate') or next(
+        (d.get('rotation') for d in stream.get('side_data_list', []) if 'rotation' in d), 0
+    )
+    if abs(int(float(rotation))) in (90, 270):
+        # Displayed size, as the browser reports it
+        width, height = height, width
+    return {
+        'fps': round(fps, 3),
+        'duration': round(duration, 3),
+        'width': width,
+        'height': height,
+        'codec': stream.get('codec_name', ''),
+        'pix_fmt': stream.get('pix_fmt', ''),
+        'bit_rate': int(fmt.get('bit_rate') or stream.get('bit_rate') or 0),
+        'container': fmt.get('format_name', ''),
+        'frame_count': int(stream.get('nb_frames') or 0) or round(fps * duration),
+    }
+
+
+def keyframe_times(path):
+    """Sorted presentation times (seconds) of the keyframes."""
+    output = _ffprobe(
+        ['-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path],
+        timeout=600
+    )
+    times = set()
+    for line in output.splitlines():
+        pts, _, flags = line.partition(',')
+        if 'K' in flags and pts not in ('', 'N/A'):
+            times.add(round(float(pts), 3))
+    return sorted(times)
+
+
+def make_thumbnails(path, duration, stem, out_dir=THUMBNAIL_DIR):
+    """``{width: filename}`` JPEG thumbnails from the frame at min(1s, 25%)."""
+    from PIL import Image
+
+    data = extract_frame(path, min(1.0, duration * 0.25))
+    if not data:
+        return {}
+    os.makedirs(out_dir, exist_ok=True)
+    frame = Image.open(io.BytesIO(data)).convert('RGB')
+    thumbnails = {}
+    for width in THUMBNAIL_WIDTHS:
+        image = frame
+        if frame.width > width:
+            image = frame.resize((width, max(1, round(frame.height * width / frame.width))), Image.LANCZOS)
+        name = f'{stem}_{width}.jpg'
+        image.save(os.path.join(out_dir, name), 'JPEG', quality=82, optimize=True)
+        thumbnails[str(width)] = name
+    return thumbnails
+
+
+def _vtt_time(seconds):
+    ms = round(seconds * 1000)
+    return f'{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}'
+
+
+def sprite_vtt(sprites):
+    """WebVTT thumbnail track (``sheet.jpg#xywh=x,y,w,h`` cues) for a sprite index."""
+    tw, th, columns = sprites['tile_width'], sprites['tile_height'], sprites['columns']
+    per_sheet = columns * sprites['rows']
+    lines = ['WEBVTT', '']
+    for i in range(sprites['count']):
+        start = i * sprites['interval']
+        end = min(start + sprites['interval'], sprites['duration'])
+        cell = i % per_sheet
+        lines += [
+            f'{_vtt_time(start)} --> {_vtt_time(end)}',
+            f"{sprites['sheets'][i // per_sheet]}#xywh={cell % columns * tw},{cell // columns * th},{tw},{th}",
+            ''
+        ]
+    return '\n'.join(lines)
+
+
+def make_sprites(path, meta, keyframes, stem, out_dir=THUMBNAIL_DIR):
+    """Sprite sheets plus ``.vtt``/``.json`` indexes; returns the index (``{}`` on failure).
+
+    One ffmpeg pass: ``fps`` picks a frame per interval, ``tile`` packs
+    them. When no keyframe gap exceeds the interval only keyframes are
+    decoded, so tiles are exact to within one GOP at a fraction of the cost.
+    """
+    duration, width, height = meta['duration'], meta['width'], meta['height']
+    if duration <= 0 or not width or not height:
+        return {}
+    interval = max(Config.SPRITE_INTERVAL, duration / SPRITE_MAX_TILES)
+    count = max(1, math.ceil(duration / interval))
+    tile_height = max(2, round(SPRITE_TILE_WIDTH * height / width / 2) * 2)
+    gaps = [b - a for a, b in zip(keyframes, keyframes[1:] + [duration])]
+    keyframes_only = bool(keyframes) and keyframes[0] <= interval and max(gaps) <= interval
+
+    # A new name per run: thumbnails are served as immutable
+    prefix = f'{stem}_sprite_{uuid.uuid4().hex[:8]}'
+    os.makedirs(out_dir, exist_ok=True)
+    result = subprocess.run([
+        Config.FFMPEG_BIN, '-v', 'error', '-nostdin',
+        *(['-skip_frame', 'nokey'] if keyframes_only else []), '-i', path,
+        '-an', '-vf', f'fps=1/{interval:.6f},scale={SPRITE_TILE_WIDTH}:{tile_height},'
+                      f'tile={SPRITE_COLUMNS}x{SPRITE_ROWS}',
+        '-q:v', '5', '-start_number', '0', os.path.join(out_dir, f'{prefix}_%03d.jpg')
+    ], capture_output=True, timeout=max(600, duration * 2))
+    # fps may emit a tile more or less than computed: trust the files written
+    sheets = sorted(name for name in os.listdir(out_dir) if name.startswith(f'{prefix}_'))
+    if result.returncode != 0 or not sheets:
+        _remove_thumbnail_files(sheets, out_dir)
+        return {}
+    count = min(count, len(sheets) * SPRITE_COLUMNS * SPRITE_ROWS)
+
+    sprites = {
+        'interval': round(interval, 3),
+        'duration': duration,
+        'count': count,
+        'tile_width': SPRITE_TILE_WIDTH,
+        'tile_height': tile_height,
+        'columns': SPRITE_COLUMNS,
+        'rows': SPRITE_ROWS,
+        'sheets': sheets,
+    }
+    with open(os.path.join(out_dir, f'{prefix}.json'), 'w', encoding='utf-8') as f:
+        json.dump(sprites, f)
+    with open(os.path.join(out_dir, f'{prefix}.vtt'), 'w', encoding='utf-8') as f:
+        f.write(sprite_vtt(sprites))
+    return {**sprites, 'index': f'{prefix}.json', 'vtt': f'{prefix}.vtt'}
+
+
+def sprite_files(sprites):
+    """Every file written for a sprite index."""
+    if not sprites:
+        return []
+    return [*sprites.get('sheets', []), sprites.get('index'), sprites.get('vtt')]
+
+
+def ingest_file(path, stem):
+    """Probe, index and thumbnail one video file (runs in a worker process)."""
+    meta = probe_video(path)
+    keyframes = keyframe_times(path)
+    return {
+        'meta': meta,
+        'keyframes': keyframes,
+        'thumbnails': make_thumbnails(path, meta['duration'], stem),
+        'sprites': make_sprites(path, meta, keyframes, stem),
+    }
+
+
+# ==================== API SIDE ====================
+
+def video_file_path(video):
+    return os.path.join(Config.UPLOAD_FOLDER, 'videos', video['filename'])
+
+
+def _store_keyframes(db, video_ids, keyframes):
+    now = datetime.now(timezone.utc)
+    for video_id in video_ids:
+        db.video_keyframes.replace_one(
+            {'video_id': video_id},
+            {'video_id': video_id, 'times': keyframes, 'updated_at': now},
+            upsert=True
+        )
+
+
+def store_ingest_result(db, video, result):
+    """Write an ``ingest_file`` result to the video and the keyframe index.
+
+    Videos sharing the file (``video_blobs``) get the same result.
+    """
+    now = datetime.now(timezone.utc)
+    keyframes = result['keyframes']
+    video_ids = shared_video_ids(db, video)
+    _store_keyframes(db, video_ids, keyframes)
+    fields = {
+        **result['meta'],
+        'thumbnails': result['thumbnails'],
+        'sprites': result['sprites'],
+        'keyframe_count': len(keyframes),
+        'status': 'ready',
+        'ingested_at': now,
+        'updated_at': now
+    }
+    if not video.get('thumbnail') and result['thumbnails']:
+        fields['thumbnail'] = result['thumbnails'].get(str(DEFAULT_THUMBNAIL_WIDTH))
+    previous = db.videos.find_one_and_update(
+        {'_id': video['_id']}, {'$set': fields, '$unset': {'ingest_error': ''}}, projection={'sprites': 1}
+    )
+    others = [i for i in video_ids if i != video['_id']]
+    if others:
+        shared = {k: v for k, v in fields.items() if k != 'thumbnail'}
+        db.videos.update_many({'_id': {'$in': others}}, {'$set': shared, '$unset': {'ingest_error': ''}})
+    bump_video_versions(db, video_ids)
+    # Re-ingest: sprites got new names, drop the old ones
+    if previous:
+        _remove_thumbnail_files(sprite_files(previous.get('sprites')))
+
+
+def copy_ingest_result(db, source, video):
+    """Give ``video`` the ingest result (and renditions) of ``source``, a video of the same file."""
+    index = db.video_keyframes.find_one({'video_id': source['_id']}, {'times': 1})
+    if index:
+        _store_keyframes(db, [video['_id']], index['times'])
+    fields = {k: source[k] for k in SHARED_FIELDS if k in source}
+    fields.update(status='ready', updated_at=datetime.now(timezone.utc))
+    if not video.get('thumbnail') and source.get('thumbnails'):
+        fields['thumbnail'] = source['thumbnails'].get(str(DEFAULT_THUMBNAIL_WIDTH))
+    db.videos.update_one({'_id': video['_id']}, {'$set': fields})
+    bump_video_version(db, video['_id'])
+
+
+def _remove_thumbnail_files(names, out_dir=THUMBNAIL_DIR):
+    for name in names:
+        try:
+            os.remove(os.path.join(out_dir, name))
+        except OSError:
+            pass
+
+
+def _mark_failed(db, video, error):
+    # Duplicates waiting on this ingest fail with it
+    db.videos.update_many({
+        '$or': [{'_id': video['_id']}, {'_id': {'$in': shared_video_ids(db, video)}, 'status': 'processing'}]
+    }, {'$set': {
+        'status': 'failed',
+        'ingest_error': str(error) or error.__class__.__name__,
+        'updated_at': datetime.now(timezone.utc)
+    }})
+
+
+def start_ingest(db, video, on_ready=None):
+    """Mark ``video`` as processing and ingest it in the process pool; returns the future.
+
+    ``on_ready(video_id)`` is called once the result is stored.
+    """
+    global _pool
+    db.videos.update_one({'_id': video['_id']}, {'$set': {
+        'status': 'processing', 'updated_at': datetime.now(timezone.utc)
+    }})
+    stem = os.path.splitext(video['filename'])[0]
+    try:
+        future = _get_pool().submit(ingest_file, video_file_path(video), stem)
+    except BrokenProcessPool:
+        # A worker died (OOM, killed): start a fresh pool
+        _pool = None
+        future = _get_pool().submit(ingest_file, video_file_path(video), stem)
+
+    def done(f):
+        try:
+            store_ingest_result(db, video, f.result())
+        except Exception as e:
+            _mark_failed(db, video, e)
+            return
+        if on_ready:
+            on_ready(video['_id'])
+
+    future.add_done_callback(done)
+    return future
+
+
+def remove_derived_files(video):
+    """Delete the generated thumbnails, sprites, renditions and cached frames of a video's file."""
+    from utils.frame_cache import remove_frame_files
+    from utils.renditions import remove_rendition_files
+    _remove_thumbnail_files([
+        *(video.get('thumbnails') or {}).values(), *sprite_files(video.get('sprites'))
+    ])
+    remove_rendition_files(video)
+    if video.get('filename'):
+        remove_frame_files(video['filename'])
+
+
+def keyframe_index(db, video_id):
+    """Sorted keyframe times of a video ([] before ingest)."""
+    index = db.video_keyframes.find_one({'video_id': video_id}, {'times': 1})
+    return (index.get('times') if index else None) or []
+
+
+def nearest_keyframe(db, video_id, timestamp):
+    """Latest keyframe time at or before ``timestamp`` (None without an index)."""
+    times = keyframe_index(db, video_id)
+    if not times:
+        return None
+    i = bisect_right(times, timestamp)
+    return times[i - 1] if i else times[0]
+
+
+def serialize_media(video):
+    """Ingest fields of a video for API responses."""
+    return {
+        'fps': video.get('fps', 0),
+        'codec': video.get('codec', ''),
+        'thumbnails': {
+            width: f'/uploads/thumbnails/{name}'
+            for width, name in (video.get('thumbnails') or {}).items()
+        },
+        'sprites': serialize_sprites(video.get('sprites')),
+        'ingest_error': video.get('ingest_error'),
+    }
+
+
+def serialize_sprites(sprites):
+    """Sprite index with sheet/index URLs (None before ingest)."""
+    if not sprites:
+        return None
+    return {
+        'interval': sprites['interval'],
+        'count': sprites['count'],
+        'tile_width': sprites['tile_width'],
+        'tile_height': sprites['tile_height'],
+        'columns': sprites['columns'],
+        'rows': sprites['rows'],
+        'sheets': [f'/uploads/thumbnails/{name}' for name in sprites['sheets']],
+        'vtt_url': f"/uploads/thumbnails/{sprites['vtt']}",
+        'index_url': f"/uploads/thumbnails/{sprites['index']}",
+    }
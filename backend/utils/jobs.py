@@ -0,0 +1,252 @@
+"""Minimal background job runner backed by the ``jobs`` collection.
+
+Jobs run on a thread pool inside the API process. Each job document keeps
+its status (queued → running → done | failed), progress and result so
+clients can poll ``GET /api/jobs/<id>``. A job is identified by
+``(type, key)``; while one is queued or running, enqueueing the same pair
+returns the existing job instead of starting a duplicate.
+
+Each process renews ``heartbeat_at`` on the jobs it has queued or is
+running. A job whose heartbeat is older than ``JOB_LEASE_SECONDS`` was
+left behind by a process that stopped: it is marked failed and no longer
+blocks its (type, key).
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from flask import current_app, has_request_context, request
+from pymongo.errors import DuplicateKeyError
+from config import Config
+
+_executor = None
+# Ids of the jobs queued or running in this process
+_owned = set()
+_owned_lock = threading.Lock()
+_ticker = None
+_release_hooks = {}
+
+
+def on_job_released(job_type, hook):
+    """Call ``hook(outcome)`` (in an app context) whenever a ``job_type`` job stops being active.
+
+    ``outcome`` is 'done', 'failed' or 'abandoned'. Work submitted while a
+    job was finishing is collapsed into it; the hook can queue a follow-up
+    job for it.
+    """
+    _release_hooks.setdefault(job_type, []).append(hook)
+
+
+def _released(job_type, outcome):
+    for hook in _release_hooks.get(job_type, ()):
+        try:
+            hook(outcome)
+        except Exception:
+            traceback.print_exc()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='job')
+    return _executor
+
+
+def ensure_job_indexes(db):
+    # Only one active job per (type, key); finished jobs drop the 'active' flag
+    db.jobs.create_index(
+        [('type', 1), ('key', 1)],
+        unique=True,
+        partialFilterExpression={'active': True},
+        name='active_job_unique'
+    )
+    db.jobs.create_index([('type', 1), ('created_at', -1)])
+    db.jobs.create_index('heartbeat_at', partialFilterExpression={'active': True})
+
+
+def _lease_expired(job, now=None):
+    heartbeat = job.get('heartbeat_at') or job['created_at']
+    if heartbeat.tzinfo is None:
+        heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+    return heartbeat < (now or datetime.now(timezone.utc)) - timedelta(seconds=Config.JOB_LEASE_SECONDS)
+
+
+def _abandon(db, job):
+    """Fail an active job whose lease ran out; False if it was renewed or finished meanwhile."""
+    now = datetime.now(timezone.utc)
+    return db.jobs.update_one(
+        {'_id': job['_id'], 'active': True, 'heartbeat_at': job.get('heartbeat_at')},
+        {
+            '$set': {
+                'status': 'failed',
+                'error': 'Abandoned: the server stopped while the job was queued or running',
+                'finished_at': now,
+                'updated_at': now
+            },
+            '$unset': {'active': ''}
+        }
+    ).modified_count == 1
+
+
+def _tick(app):
+    """Renew this process's leases and fail jobs abandoned by stopped processes."""
+    db = app.db
+    now = datetime.now(timezone.utc)
+    with _owned_lock:
+        owned = list(_owned)
+    if owned:
+        db.jobs.update_many({'_id': {'$in': owned}, 'active': True}, {'$set': {'heartbeat_at': now}})
+    stale = now - timedelta(seconds=Config.JOB_LEASE_SECONDS)
+    for job in db.jobs.find({'active': True, '_id': {'$nin': owned}, '$or': [
+        {'heartbeat_at': {'$lt': stale}},
+        {'heartbeat_at': {'$exists': False}, 'created_at': {'$lt': stale}}  # queued before leases
+    ]}):
+        if _abandon(db, job):
+            _released(job['type'], 'abandoned')
+
+
+def start_job_runner(app):
+    """Start the thread keeping job leases; once per process."""
+    global _ticker
+    if _ticker is not None:
+        return
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    _tick(app)
+            except Exception:
+                traceback.print_exc()
+            time.sleep(Config.JOB_LEASE_SECONDS / 4)
+
+    _ticker = threading.Thread(target=run, name='job-lease', daemon=True)
+    _ticker.start()
+
+
+class JobContext:
+    """Handle passed to job functions for reporting progress."""
+
+    def __init__(self, db, job_id):
+        self.db = db
+        self.job_id = job_id
+
+    def progress(self, done, total=None, message=None):
+        fields = {'progress': done, 'updated_at': datetime.now(timezone.utc)}
+        if total is not None:
+            fields['total'] = total
+        if message is not None:
+            fields['message'] = message
+        self.db.jobs.update_one({'_id': self.job_id}, {'$set': fields})
+
+
+def enqueue_job(job_type, key, fn, *args, params=None):
+    """Start ``fn(ctx, *args)`` in the background.
+
+    Returns ``(job, created)``; ``created`` is False when an active job for
+    the same (type, key) already exists.
+    """
+    db = current_app.db
+    now = datetime.now(timezone.utc)
+    job = {
+        'type': job_type,
+        'key': key,
+        'params': params or {},
+        'status': 'queued',
+        'active': True,
+        'progress': 0,
+        'total': None,
+        'message': '',
+        'result': None,
+        'error': None,
+        'created_by': _current_user_id(),
+        'created_at': now,
+        'updated_at': now,
+        'heartbeat_at': now
+    }
+    while True:
+        try:
+            job['_id'] = db.jobs.insert_one(job).inserted_id
+            break
+        except DuplicateKeyError:
+            job.pop('_id', None)
+            existing = db.jobs.find_one({'type': job_type, 'key': key, 'active': True})
+            if existing and not (_lease_expired(existing) and _abandon(db, existing)):
+                return existing, False
+            # Finished or abandoned meanwhile: take its place
+
+    with _owned_lock:
+        _owned.add(job['_id'])
+    app = current_app._get_current_object()
+    _get_executor().submit(_run_job, app, job['_id'], job_type, fn, args)
+    return job, True
+
+
+def _current_user_id():
+    if has_request_context() and getattr(request, 'current_user', None):
+        return request.current_user['_id']
+    return None
+
+
+def _run_job(app, job_id, job_type, fn, args):
+    with app.app_context():
+        db = app.db
+        db.jobs.update_one({'_id': job_id}, {'$set': {
+            'status': 'running',
+            'started_at': datetime.now(timezone.utc),
+            'updated_at': datetime.now(timezone.utc)
+        }})
+        outcome = 'failed'
+        try:
+            result = fn(JobContext(db, job_id), *args)
+            db.jobs.update_one({'_id': job_id}, {
+                '$set': {
+                    'status': 'done',
+                    'result': result,
+                    'finished_at': datetime.now(timezone.utc),
+                    'updated_at': datetime.now(timezone.utc)
+                },
+                '$unset': {'active': ''}
+            })
+            outcome = 'done'
+        except Exception as e:
+            traceback.print_exc()
+            db.jobs.update_one({'_id': job_id}, {
+                '$set': {
+                    'status': 'failed',
+                    'error': str(e),
+                    'finished_at': datetime.now(timezone.utc),
+                    'updated_at': datetime.now(timezone.utc)
+                },
+                '$unset': {'active': ''}
+            })
+        finally:
+            with _owned_lock:
+                _owned.discard(job_id)
+        _released(job_type, outcome)
+
+
+def get_job(job_id):
+    try:
+        return current_app.db.jobs.find_one({'_id': ObjectId(job_id)})
+    except Exception:
+        return None
+
+
+def serialize_job(job):
+    return {
+        'id': str(job['_id']),
+        'type': job['type'],
+        'key': job.get('key'),
+        'params': job.get('params', {}),
+        'status': job['status'],
+        'progress': job.get('progress', 0),
+        'total': job.get('total'),
+        'message': job.get('message', ''),
+        'result': job.get('result'),
+        'error': job.get('error'),
+        'created_at': job['created_at'].isoformat(),
+        'updated_at': job['updated_at'].isoformat()
+    }
@@ -0,0 +1,91 @@
+"""Fast JSON provider with a central serializer registry.
+
+Routes may return ``ObjectId``, ``datetime`` and ``bytes`` values directly;
+they are converted by the functions registered here instead of each route
+calling ``str()`` / ``.isoformat()`` by hand. Encoding uses orjson when it
+is installed and falls back to the standard library otherwise, producing
+the same output (sorted keys, ISO timestamps).
+"""
+import base64
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+_SERIALIZERS = {}
+
+
+def register_serializer(cls, fn):
+    """Serialize instances of ``cls`` (and subclasses) with ``fn(value)``."""
+    _SERIALIZERS[cls] = fn
+
+
+register_serializer(ObjectId, str)
+register_serializer(datetime, lambda v: v.isoformat())
+register_serializer(date, lambda v: v.isoformat())
+register_serializer(bytes, lambda v: base64.b64encode(v).decode('ascii'))
+register_serializer(Decimal, float)
+register_serializer(uuid.UUID, str)
+register_serializer(set, list)
+
+
+def serialize_default(value):
+    """``default`` hook shared by both encoders."""
+    fn = _SERIALIZERS.get(type(value))
+    if fn is None:
+        for cls, candidate in _SERIALIZERS.items():
+            if isinstance(value, cls):
+                fn = candidate
+                break
+    if fn is None:
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+    return fn(value)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using orjson plus the serializer registry."""
+
+    def _orjson_options(self, indent):
+        # Datetimes go through the registry so both encoders agree
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        """Encode to UTF-8 bytes (what responses and files need)."""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=serialize_default, option=self._orjson_options(indent))
+            except TypeError:
+                pass  # e.g. integers beyond 64 bits; the stdlib handles them
+        return json.dumps(
+            obj, default=serialize_default, sort_keys=self.sort_keys, ensure_ascii=False,
+            indent=2 if indent else None, separators=None if indent else (',', ':')
+        ).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', serialize_default)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,378 @@
+"""Bulk import/export of the knowledge base in the KB JSON document format.
+
+The document (see To-do-plan.md) groups entries by section, keyed by id::
+
+    {"knowledge_base_version": "1.0",
+     "objects": {"van_mieu_gate": {"canonical_name_en": ..., "canonical_name_vi": ...,
+                                   "object_type": ..., "historical_info": {...},
+                                   "related_entities": {"part_of": "van_mieu_complex", ...}}},
+     "people": {...}, "concepts": {...}}
+
+The same entries can be sent as NDJSON, one ``{"section", "key", ...entry}``
+per line. Names, descriptions, aliases and ``visual_cues`` map onto node
+fields; every other key is kept verbatim in the node's ``attributes``.
+``related_entities.part_of`` becomes the parent, every other reference
+there becomes a related node when it names a known ``kb_id``.
+
+An import reads the existing tree once, validates and resolves all
+references in memory, and writes nodes, paths and children lists with
+batched bulk writes. Nothing is written when validation fails.
+"""
+import json
+import re
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from utils.kb_tree import compute_paths
+
+FORMAT_VERSION = '1.0'
+
+# Document section <-> node type
+SECTION_TYPES = {
+    'objects': 'object',
+    'concepts': 'concept',
+    'actions': 'action',
+    'rituals': 'ritual',
+    'festivals': 'festival',
+    'people': 'person',
+    'events': 'event',
+}
+TYPE_SECTIONS = {t: s for s, t in SECTION_TYPES.items()}
+DEFAULT_SECTION = 'concepts'
+
+IMPORT_MODES = ('merge', 'copy')
+
+# Entry keys stored as node fields rather than attributes
+_NAME_EN = ('canonical_name_en', 'name_en', 'name')
+_NAME_VI = ('canonical_name_vi', 'name_vi')
+_FIELD_KEYS = set(_NAME_EN + _NAME_VI) | {
+    'key', 'section', 'type', 'description', 'description_en', 'description_vi',
+    'visual_cues', 'visual_cues_vi', 'tags', 'aliases', 'related_entities',
+}
+
+
+class KBImportError(ValueError):
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid entries')
+        self.errors = errors
+
+
+def generate_kb_id(name):
+    """Generate a kb_id from a name or document key"""
+    # Convert to lowercase, replace spaces with underscores, remove special chars
+    kb_id = re.sub(r'[^a-z0-9_]', '', name.lower().replace(' ', '_'))
+    return kb_id
+
+
+def _first(entry, keys):
+    for key in keys:
+        if entry.get(key):
+            return entry[key]
+    return ''
+
+
+def _references(value):
+    """Flatten a related_entities value into reference strings."""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, str)]
+    return []
+
+
+# ==================== PARSING ====================
+
+def parse_document(doc):
+    """``[(section, key, entry)]`` from a KB JSON document."""
+    if not isinstance(doc, dict):
+        raise KBImportError([{'key': None, 'error': 'Document must be a JSON object'}])
+    entries = []
+    for section, items in doc.items():
+        if not isinstance(items, dict) or section in ('knowledge_base_version', 'last_updated'):
+            continue
+        for key, entry in items.items():
+            entries.append((section, key, entry))
+    return entries
+
+
+def parse_ndjson(lines):
+    """``[(section, key, entry)]`` from NDJSON lines (bytes or str)."""
+    entries = []
+    errors = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            errors.append({'key': None, 'line': number, 'error': f'Invalid JSON: {e}'})
+            continue
+        if not isinstance(entry, dict):
+            errors.append({'key': None, 'line': number, 'error': 'Entry must be an object'})
+            continue
+        entries.append((entry.get('section', DEFAULT_SECTION), entry.get('key'), entry))
+    if errors:
+        raise KBImportError(errors)
+    return entries
+
+
+# ==================== IMPORT ====================
+
+def _node_fields(section, key, entry):
+    name = _first(entry, _NAME_EN) or _first(entry, _NAME_VI) or key
+    aliases = entry.get('aliases') or []
+    return {
+        'name': name,
+        'name_vi': _first(entry, _NAME_VI),
+        'type': entry.get('type') or SECTION_TYPES.get(section, SECTION_TYPES[DEFAULT_SECTION]),
+        'description': entry.get('description_en') or entry.get('description') or '',
+        'description_vi': entry.get('description_vi', ''),
+        'visual_cues': entry.get('visual_cues', ''),
+        'visual_cues_vi': entry.get('visual_cues_vi', ''),
+        'tags': entry.get('tags') or [a for a in aliases if isinstance(a, str)],
+        'attributes': {
+            k: v for k, v in entry.items()
+            if k not in _FIELD_KEYS or k in ('aliases', 'related_entities')
+        },
+    }
+
+
+def _validate(entries):
+    errors = []
+    seen = set()
+    for section, key, entry in entries:
+        if not isinstance(entry, dict):
+            errors.append({'key': key, 'error': 'Entry must be an object'})
+            continue
+        if not key or not isinstance(key, str) or not generate_kb_id(key):
+            errors.append({'key': key, 'error': 'Missing or invalid key'})
+            continue
+        kb_id = generate_kb_id(key)
+        if kb_id in seen:
+            errors.append({'key': key, 'error': f'Duplicate key (kb_id {kb_id})'})
+        seen.add(kb_id)
+        related = entry.get('related_entities', {})
+        if not isinstance(related, dict):
+            errors.append({'key': key, 'error': 'related_entities must be an object'})
+        elif related.get('part_of') is not None and not isinstance(related['part_of'], str):
+            errors.append({'key': key, 'error': 'related_entities.part_of must be a string'})
+        for field in ('tags', 'aliases'):
+            if field in entry and not isinstance(entry[field], list):
+                errors.append({'key': key, 'error': f'{field} must be a list'})
+    if errors:
+        raise KBImportError(errors)
+
+
+def _unique_kb_id(kb_id, taken):
+    candidate = kb_id
+    n = 2
+    while candidate in taken:
+        candidate = f'{kb_id}_{n}'
+        n += 1
+    taken.add(candidate)
+    return candidate
+
+
+def import_entries(db, entries, mode='merge', batch_size=1000):
+    """Create or update KB nodes from parsed entries.
+
+    ``merge`` updates nodes whose ``kb_id`` already exists; ``copy`` always
+    creates nodes, suffixing taken ``kb_id``s (``_2``, ``_3``...). Returns
+    ``{'created', 'updated', 'unresolved', 'node_ids'}`` (``node_ids``: the
+    created and updated nodes); raises KBImportError.
+    """
+    if mode not in IMPORT_MODES:
+        raise KBImportError([{'key': None, 'error': f'Unknown mode: {mode}'}])
+    _validate(entries)
+
+    existing = {
+        n['_id']: n for n in db.knowledge_base.find(
+            {}, {'kb_id': 1, 'parent_id': 1, 'ancestor_ids': 1, 'children_ids': 1}
+        )
+    }
+    by_kb_id = {n['kb_id']: n['_id'] for n in existing.values()}
+    taken = set(by_kb_id)
+
+    # Assign ids: reference key -> _id of the imported node
+    imported = {}
+    kb_ids = {}
+    for section, key, entry in entries:
+        base = generate_kb_id(key)
+        if mode == 'merge' and base in by_kb_id:
+            imported[base] = by_kb_id[base]
+            kb_ids[base] = base
+        else:
+            imported[base] = ObjectId()
+            kb_ids[base] = _unique_kb_id(base, taken)
+
+    def resolve(ref):
+        ref_id = generate_kb_id(ref)
+        return imported.get(ref_id) or by_kb_id.get(ref_id)
+
+    now = datetime.now(timezone.utc)
+    parents = {node_id: n.get('parent_id') for node_id, n in existing.items()}
+    nodes = {}
+    unresolved = []
+    for section, key, entry in entries:
+        base = generate_kb_id(key)
+        node_id = imported[base]
+        fields = _node_fields(section, key, entry)
+        fields['kb_id'] = kb_ids[base]
+        related = entry.get('related_entities') or {}
+
+        parent_ref = related.get('part_of')
+        parent_id = resolve(parent_ref) if parent_ref else None
+        if parent_ref and not parent_id:
+            unresolved.append({'key': key, 'ref': parent_ref, 'field': 'part_of'})
+        fields['parent_id'] = parent_id if parent_id != node_id else None
+
+        related_ids = []
+        for field, value in related.items():
+            if field == 'part_of':
+                continue
+            for ref in _references(value):
+                ref_id = resolve(ref)
+                if ref_id and ref_id != node_id and ref_id not in related_ids:
+                    related_ids.append(ref_id)
+                elif not ref_id:
+                    unresolved.append({'key': key, 'ref': ref, 'field': field})
+        fields['related_kb_ids'] = related_ids
+        fields['updated_at'] = now
+
+        parents[node_id] = fields['parent_id']
+        nodes[node_id] = fields
+
+    # Reject part_of chains that loop back onto themselves
+    cycles = []
+    for node_id, fields in nodes.items():
+        seen = {node_id}
+        current = parents.get(node_id)
+        while current:
+            if current in seen:
+                cycles.append({'key': fields['kb_id'], 'error': 'part_of forms a cycle'})
+                break
+            seen.add(current)
+            current = parents.get(current)
+    if cycles:
+        raise KBImportError(cycles)
+
+    paths = compute_paths(parents)
+    children = {}
+    for node_id, parent_id in parents.items():
+        if parent_id in parents:
+            children.setdefault(parent_id, []).append(node_id)
+
+    ops = []
+    created = updated = 0
+    for node_id, fields in nodes.items():
+        fields['ancestor_ids'] = paths.get(node_id, [])
+        old = existing.get(node_id)
+        # Keep the existing order of children, new ones go last
+        kept = [c for c in (old or {}).get('children_ids', []) if c in children.get(node_id, ())]
+        fields['children_ids'] = kept + [c for c in children.get(node_id, []) if c not in kept]
+        if old:
+            ops.append(UpdateOne({'_id': node_id}, {'$set': fields}))
+            updated += 1
+        else:
+            ops.append(InsertOne({'_id': node_id, **fields, 'created_at': now}))
+            created += 1
+
+    # Existing nodes whose path or children changed because of the import
+    for node_id, old in existing.items():
+        if node_id in nodes:
+            continue
+        update = {}
+        if old.get('ancestor_ids') != paths.get(node_id, []):
+            update['ancestor_ids'] = paths.get(node_id, [])
+        old_children = old.get('children_ids', [])
+        new_children = children.get(node_id, [])
+        if set(old_children) != set(new_children):
+            update['children_ids'] = (
+                [c for c in old_children if c in new_children] +
+                [c for c in new_children if c not in old_children]
+            )
+        if update:
+            ops.append(UpdateOne({'_id': node_id}, {'$set': update}))
+
+    for i in range(0, len(ops), batch_size):
+        db.knowledge_base.bulk_write(ops[i:i + batch_size], ordered=True)
+    return {'created': created, 'updated': updated, 'unresolved': unresolved, 'node_ids': list(nodes)}
+
+
+# ==================== EXPORT ====================
+
+def _entry(node, section, kb_ids):
+    """Document entry for a node (inverse of the import mapping)."""
+    attributes = dict(node.get('attributes') or {})
+    related = dict(attributes.pop('related_entities', None) or {})
+    aliases = attributes.pop('aliases', None)
+
+    if section == 'objects':
+        entry = {'canonical_name_vi': node.get('name_vi', ''), 'canonical_name_en': node['name']}
+    else:
+        entry = {'name_vi': node.get('name_vi', ''), 'name_en': node['name']}
+    if aliases:
+        entry['aliases'] = aliases
+    if node.get('type') != SECTION_TYPES.get(section):
+        entry['type'] = node.get('type', 'concept')
+    for field in ('description_vi', 'visual_cues', 'visual_cues_vi'):
+        if node.get(field):
+            entry[field] = node[field]
+    if node.get('description'):
+        entry['description_en'] = node['description']
+    if node.get('tags') and node['tags'] != aliases:
+        entry['tags'] = node['tags']
+    entry.update(attributes)
+
+    # part_of follows the current tree; relations added since import go to "related"
+    related.pop('part_of', None)
+    if node.get('parent_id') in kb_ids:
+        related = {'part_of': kb_ids[node['parent_id']], **related}
+    mentioned = {generate_kb_id(r) for value in related.values() for r in _references(value)}
+    extra = [kb_ids[r] for r in node.get('related_kb_ids', []) if r in kb_ids and kb_ids[r] not in mentioned]
+    if extra:
+        related['related'] = _references(related.get('related')) + extra
+    if related:
+        entry['related_entities'] = related
+    return entry
+
+
+def _iter_sections(db):
+    """Yield ``(section, node)`` grouped by section, sorted by kb_id."""
+    for section, node_type in SECTION_TYPES.items():
+        query = {'type': node_type}
+        if section == DEFAULT_SECTION:
+            # Types without a section of their own are exported as concepts
+            query = {'type': {'$nin': [t for t in SECTION_TYPES.values() if t != node_type]}}
+        for node in db.knowledge_base.find(query).sort('kb_id', 1):
+            yield section, node
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def export_document(db):
+    """Yield the whole KB as a JSON document, one entry at a time."""
+    kb_ids = {n['_id']: n['kb_id'] for n in db.knowledge_base.find({}, {'kb_id': 1})}
+    yield '{\n'
+    yield f'  "knowledge_base_version": {_dumps(FORMAT_VERSION)},\n'
+    yield f'  "last_updated": {_dumps(datetime.now(timezone.utc).date().isoformat())}'
+    current = None
+    for section, node in _iter_sections(db):
+        if section != current:
+            yield '\n  }' if current else ''
+            yield f',\n  {_dumps(section)}: {{\n'
+            current = section
+        else:
+            yield ',\n'
+        yield f'    {_dumps(node["kb_id"])}: {_dumps(_entry(node, section, kb_ids))}'
+    yield '\n  }\n}\n' if current else '\n}\n'
+
+
+def export_ndjson(db):
+    """Yield the whole KB as NDJSON, one entry per line."""
+    kb_ids = {n['_id']: n['kb_id'] for n in db.knowledge_base.find({}, {'kb_id': 1})}
+    for section, node in _iter_sections(db):
+        yield _dumps({'section': section, 'key': node['kb_id'], **_entry(node, section, kb_ids)}) + '\n'
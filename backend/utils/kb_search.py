@@ -0,0 +1,154 @@
+"""In-process search index over knowledge-base nodes.
+
+Text is folded (lowercase, Vietnamese diacritics removed, ``đ`` -> ``d``)
+so "le hoi" matches "Lễ hội". The index keeps a sorted token list for
+exact/prefix lookups with ``bisect`` and a trigram map for infix matches
+on names, ids and tags. It is rebuilt lazily when the KB version changes.
+
+Every query token must match. A node's score sums, per query token, the
+best of: exact token (x3), token prefix (x2) or substring (x1), multiplied
+by the field weight (names 3, kb_id/tags 2, descriptions 1).
+"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from utils.versions import kb_version
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# Combining diacritical marks left by NFD (tones, breve, circumflex, horn)
+_MARKS_RE = re.compile('[\u0300-\u036f]')
+
+# Field -> weight; infix (trigram) matching only covers the short fields
+FIELD_WEIGHTS = {
+    'name': 3, 'name_vi': 3, 'kb_id': 2, 'tags': 2,
+    'description': 1, 'description_vi': 1,
+}
+INFIX_FIELDS = ('name', 'name_vi', 'kb_id', 'tags')
+
+_EXACT, _PREFIX, _INFIX = 3, 2, 1
+
+
+def fold(text):
+    """Lowercase and strip diacritics (Vietnamese-aware)."""
+    text = (text or '').lower()
+    if text.isascii():
+        return text
+    return _MARKS_RE.sub('', unicodedata.normalize('NFD', text.replace('đ', 'd')))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _field_text(node, field):
+    value = node.get(field, '')
+    if isinstance(value, list):
+        return ' '.join(str(v) for v in value)
+    return value or ''
+
+
+class KBSearchIndex:
+    def __init__(self, nodes):
+        self.nodes = nodes
+        entries = []
+        self._infix_text = []
+        self._names = []
+        self._trigrams = {}
+        for idx, node in enumerate(nodes):
+            self._names.append((fold(node.get('name', '')), fold(node.get('name_vi', ''))))
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in set(tokenize(_field_text(node, field))):
+                    entries.append((token, idx, weight))
+            text = ' '.join(fold(_field_text(node, f)) for f in INFIX_FIELDS)
+            self._infix_text.append(text)
+            for gram in _trigrams(text):
+                self._trigrams.setdefault(gram, set()).add(idx)
+        entries.sort()
+        self._tokens = [e[0] for e in entries]
+        self._postings = [(e[1], e[2]) for e in entries]
+
+    def _match_token(self, token):
+        """{node index: score} for one folded query token."""
+        scores = {}
+        lo = bisect.bisect_left(self._tokens, token)
+        hi = bisect.bisect_left(self._tokens, token + '\uffff')
+        for i in range(lo, hi):
+            idx, weight = self._postings[i]
+            score = weight * (_EXACT if self._tokens[i] == token else _PREFIX)
+            if score > scores.get(idx, 0):
+                scores[idx] = score
+
+        if len(token) >= 3:
+            grams = _trigrams(token)
+            candidates = None
+            for gram in grams:
+                postings = self._trigrams.get(gram, set())
+                candidates = set(postings) if candidates is None else candidates & postings
+                if not candidates:
+                    break
+            for idx in (candidates or set()).difference(scores):
+                if token in self._infix_text[idx]:
+                    scores[idx] = _INFIX
+        return scores
+
+    def search(self, query, node_type=None, offset=0, limit=None):
+        """(ranked page of matching nodes, total matches)."""
+        tokens = tokenize(query)
+        if not tokens:
+            return [], 0
+        totals = None
+        for token in tokens:
+            scores = self._match_token(token)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {idx: totals[idx] + s for idx, s in scores.items() if idx in totals}
+            if not totals:
+                return [], 0
+
+        folded_query = ' '.join(tokens)
+        ranked = []
+        for idx, score in totals.items():
+            if node_type and self.nodes[idx].get('type', 'concept') != node_type:
+                continue
+            name, name_vi = self._names[idx]
+            # Whole-name hits first, then score, then shorter names
+            exact = folded_query in (name, name_vi)
+            ranked.append((not exact, -score, len(name), name, idx))
+        total = len(ranked)
+        if limit:
+            # Only the requested page has to be ordered
+            ranked = heapq.nsmallest(offset + limit, ranked)[offset:]
+        else:
+            ranked = sorted(ranked)[offset:]
+        return [self.nodes[r[-1]] for r in ranked], total
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index(db):
+    """Index for the current KB version, rebuilt at most once per version."""
+    global _index
+    version = kb_version(db)
+    current = _index
+    if current and current[0] == version:
+        return current[1]
+    with _index_lock:
+        if _index and _index[0] == version:
+            return _index[1]
+        index = KBSearchIndex(list(db.knowledge_base.find({})))
+        _index = (version, index)
+        return index
+
+
+def search_kb(db, query, node_type=None, offset=0, limit=None):
+    """(page of nodes, total matches)."""
+    return get_search_index(db).search(query, node_type, offset, limit)
@@ -0,0 +1,236 @@
+"""Materialized ancestor paths for knowledge-base nodes.
+
+Every KB node stores ``ancestor_ids``: its ancestors' ``_id``s from the
+root down to its parent (``[]`` for roots), next to ``parent_id``. The
+whole ancestry of any set of nodes can then be fetched with one query
+instead of walking parent pointers one hop at a time, and a subtree is
+simply ``{'ancestor_ids': node_id}``.
+
+Subtree operations resolve the descendants with that one query and apply
+their writes as a single ordered ``bulk_write``, inside a transaction when
+the deployment supports them (replica sets and sharded clusters). On a
+standalone server the order is the safeguard. The subtree root's own
+document is the switch: a copy is inserted last, a delete removes it
+first and a move rewrites the descendants' paths before re-parenting it,
+so the tree built from ``parent_id`` never shows a half-moved subtree.
+"""
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import OperationFailure
+
+# Server error for transactions on a standalone mongod
+_ILLEGAL_OPERATION = 20
+
+
+def ensure_kb_indexes(db):
+    db.knowledge_base.create_index('ancestor_ids')
+
+
+def _atomic(db, write):
+    """Run ``write(session)`` in a transaction, or with ``session=None`` where
+    the deployment has none (standalone server, mongomock)."""
+    try:
+        session = db.client.start_session()
+    except NotImplementedError:
+        return write(None)
+    with session:
+        try:
+            return session.with_transaction(write)
+        except OperationFailure as exc:
+            # Raised by the first operation, before anything was written
+            if exc.code != _ILLEGAL_OPERATION:
+                raise
+    return write(None)
+
+
+def ancestor_path(db, parent_id, session=None):
+    """``ancestor_ids`` for a node placed under ``parent_id``."""
+    if not parent_id:
+        return []
+    parent = db.knowledge_base.find_one({'_id': parent_id}, {'ancestor_ids': 1}, session=session)
+    return (parent.get('ancestor_ids', []) if parent else []) + [parent_id]
+
+
+def descendant_ids(db, node_id, session=None):
+    return [d['_id'] for d in db.knowledge_base.find({'ancestor_ids': node_id}, {'_id': 1}, session=session)]
+
+
+def _path_ops(db, node_id, new_path, session):
+    """Updates giving every descendant of ``node_id`` a path under ``new_path``."""
+    ops = []
+    for desc in db.knowledge_base.find({'ancestor_ids': node_id}, {'ancestor_ids': 1}, session=session):
+        path = desc['ancestor_ids']
+        ops.append(UpdateOne(
+            {'_id': desc['_id']},
+            {'$set': {'ancestor_ids': new_path + path[path.index(node_id):]}}
+        ))
+    return ops
+
+
+def move_node(db, node, new_parent_id):
+    """Re-parent ``node`` and its subtree."""
+    node_id = node['_id']
+    old_parent_id = node.get('parent_id')
+
+    def write(session):
+        new_path = ancestor_path(db, new_parent_id, session)
+        ops = _path_ops(db, node_id, new_path, session)
+        ops.append(UpdateOne(
+            {'_id': node_id},
+            {'$set': {'parent_id': new_parent_id, 'ancestor_ids': new_path}}
+        ))
+        if old_parent_id:
+            ops.append(UpdateOne({'_id': old_parent_id}, {'$pull': {'children_ids': node_id}}))
+        if new_parent_id:
+            ops.append(UpdateOne({'_id': new_parent_id}, {'$push': {'children_ids': node_id}}))
+        db.knowledge_base.bulk_write(ops, ordered=True, session=session)
+
+    _atomic(db, write)
+
+
+def delete_subtree(db, node):
+    """Delete ``node`` and all its descendants; returns the deleted ``_id``s."""
+    node_id = node['_id']
+
+    def write(session):
+        ids = [node_id] + descendant_ids(db, node_id, session)
+        ops = [DeleteOne({'_id': node_id})]
+        if len(ids) > 1:
+            ops.append(DeleteMany({'ancestor_ids': node_id}))
+        if node.get('parent_id'):
+            ops.append(UpdateOne({'_id': node['parent_id']}, {'$pull': {'children_ids': node_id}}))
+        db.knowledge_base.bulk_write(ops, ordered=True, session=session)
+        _pull_related(db, ids, session)
+        return ids
+
+    return _atomic(db, write)
+
+
+def delete_node(db, node):
+    """Delete ``node`` only; its children move up to its parent."""
+    node_id = node['_id']
+    parent_id = node.get('parent_id')
+
+    def write(session):
+        children = [c['_id'] for c in db.knowledge_base.find({'parent_id': node_id}, {'_id': 1}, session=session)]
+        ops = [DeleteOne({'_id': node_id})]
+        if children:
+            ops.append(UpdateMany({'parent_id': node_id}, {'$set': {'parent_id': parent_id}}))
+            ops.append(UpdateMany({'ancestor_ids': node_id}, {'$pull': {'ancestor_ids': node_id}}))
+        if parent_id:
+            if children:
+                ops.append(UpdateOne({'_id': parent_id}, {'$push': {'children_ids': {'$each': children}}}))
+            ops.append(UpdateOne({'_id': parent_id}, {'$pull': {'children_ids': node_id}}))
+        db.knowledge_base.bulk_write(ops, ordered=True, session=session)
+        _pull_related(db, [node_id], session)
+
+    _atomic(db, write)
+
+
+def _pull_related(db, ids, session=None):
+    db.knowledge_base.update_many(
+        {'related_kb_ids': {'$in': ids}},
+        {'$pull': {'related_kb_ids': {'$in': ids}}},
+        session=session
+    )
+
+
+def _copy_kb_id(kb_id, taken):
+    candidate = f'{kb_id}_copy'
+    n = 2
+    while candidate in taken:
+        candidate = f'{kb_id}_copy_{n}'
+        n += 1
+    taken.add(candidate)
+    return candidate
+
+
+def copy_subtree(db, node, new_parent_id):
+    """Copy ``node`` and its descendants under ``new_parent_id``; returns the new root.
+
+    Copies get fresh ``_id``s and ``kb_id``s (``<kb_id>_copy[_n]``); links
+    between nodes of the subtree (parent, children, related) point to the
+    copies, links leaving it are kept as they are.
+    """
+    def write(session):
+        nodes = [node] + list(db.knowledge_base.find({'ancestor_ids': node['_id']}, session=session))
+        new_ids = {n['_id']: ObjectId() for n in nodes}
+        taken = set(db.knowledge_base.distinct(
+            'kb_id', {'kb_id': {'$regex': r'_copy(_\d+)?$'}}, session=session
+        ))
+        new_path = ancestor_path(db, new_parent_id, session)
+        now = datetime.now(timezone.utc)
+
+        copies = []
+        for n in nodes:
+            copy = dict(n)
+            copy['_id'] = new_ids[n['_id']]
+            copy['kb_id'] = _copy_kb_id(n['kb_id'], taken)
+            if n is node:
+                copy['parent_id'] = new_parent_id
+                copy['ancestor_ids'] = new_path
+            else:
+                path = n['ancestor_ids']
+                copy['parent_id'] = new_ids[n['parent_id']]
+                copy['ancestor_ids'] = new_path + [new_ids[a] for a in path[path.index(node['_id']):]]
+            copy['children_ids'] = [new_ids[c] for c in n.get('children_ids', []) if c in new_ids]
+            copy['related_kb_ids'] = [new_ids.get(r, r) for r in n.get('related_kb_ids', [])]
+            copy['created_at'] = now
+            copy['updated_at'] = now
+            copies.append(copy)
+
+        # Descendants first: the subtree only becomes reachable once its root exists
+        ops = [InsertOne(c) for c in copies[1:]] + [InsertOne(copies[0])]
+        if new_parent_id:
+            ops.append(UpdateOne({'_id': new_parent_id}, {'$push': {'children_ids': copies[0]['_id']}}))
+        db.knowledge_base.bulk_write(ops, ordered=True, session=session)
+        return copies[0]
+
+    return _atomic(db, write)
+
+
+def compute_paths(parents):
+    """``{node_id: ancestor_ids}`` from a ``{node_id: parent_id}`` map.
+
+    Dangling parents end a path (the node is treated as a root) and
+    cycles are cut where they close.
+    """
+    paths = {}
+
+    def path_of(node_id):
+        chain = []
+        seen = {node_id}
+        current = parents.get(node_id)
+        # Walk up until a known path, a root, a dangling parent or a cycle
+        while current in parents and current not in paths and current not in seen:
+            seen.add(current)
+            chain.append(current)
+            current = parents.get(current)
+        base = paths[current] + [current] if current in paths else []
+        for ancestor in reversed(chain):
+            paths[ancestor] = base
+            base = base + [ancestor]
+        paths[node_id] = base
+
+    for node_id in parents:
+        if node_id not in paths:
+            path_of(node_id)
+    return paths
+
+
+def rebuild_kb_paths(db, batch_size=500):
+    """Recompute every node's ``ancestor_ids`` from ``parent_id``; returns nodes updated."""
+    parents = {n['_id']: n.get('parent_id') for n in db.knowledge_base.find({}, {'parent_id': 1})}
+    paths = compute_paths(parents)
+
+    updated = 0
+    ops = []
+    for node_id in parents:
+        ops.append(UpdateOne({'_id': node_id}, {'$set': {'ancestor_ids': paths[node_id]}}))
+        if len(ops) >= batch_size:
+            updated += db.knowledge_base.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db.knowledge_base.bulk_write(ops, ordered=False).modified_count
+    return updated
@@ -0,0 +1,226 @@
+"""Vector index over knowledge-base nodes for caption-based suggestions.
+
+Each node is embedded with TF-IDF over folded (diacritic-free) words and
+word bigrams from its names, descriptions, visual cues and tags in both
+languages, hashed into ``Config.KB_SUGGEST_DIM`` signed buckets and
+L2-normalized. The vectors are rows of one contiguous float32 matrix, so
+a query is a single matrix-vector product plus ``argpartition``.
+
+The index follows the KB version: when it changes, only the nodes listed
+in the KB change log since the indexed version (``kb_changes_since``) are
+fetched; they are re-embedded, or dropped if they are gone (swap-remove
+keeps the matrix dense). Vectors keep the IDF they were embedded with;
+after ``REBUILD_RATIO`` of the nodes changed, or when the log cannot
+account for every change, the whole index is rebuilt.
+"""
+import math
+import threading
+import zlib
+from collections import Counter
+import numpy as np
+from config import Config
+from utils.kb_search import tokenize
+from utils.versions import kb_changes_since, kb_version
+
+FIELD_WEIGHTS = {
+    'name': 2.0, 'name_vi': 2.0,
+    'description': 1.0, 'description_vi': 1.0,
+    'visual_cues': 1.0, 'visual_cues_vi': 1.0,
+    'tags': 1.0,
+}
+REBUILD_RATIO = 0.2
+_FIELDS = dict.fromkeys(FIELD_WEIGHTS, 1) | {'type': 1}
+
+
+def _terms(text):
+    tokens = tokenize(text)
+    return tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+
+def node_terms(node):
+    """{term: weighted count} for a KB node."""
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        value = node.get(field) or ''
+        if isinstance(value, list):
+            value = ' '.join(str(v) for v in value)
+        for term in _terms(value):
+            counts[term] += weight
+    return counts
+
+
+def _bucket(term, dim):
+    h = zlib.crc32(term.encode('utf-8'))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+
+class KBVectorIndex:
+    def __init__(self, dim=None):
+        self.dim = dim or Config.KB_SUGGEST_DIM
+        self.matrix = np.zeros((0, self.dim), np.float32)
+        self.size = 0
+        self.ids = []           # row -> node _id
+        self.rows = {}          # node _id -> row
+        self.terms = {}         # node _id -> set of terms (for document frequencies)
+        self.types = np.zeros(0, np.int32)
+        self.type_codes = {}
+        self.df = Counter()
+        self.changes = 0
+
+    def _idf(self, term):
+        return math.log((1 + len(self.terms)) / (1 + self.df.get(term, 0))) + 1.0
+
+    def _vector(self, counts, known_only=False):
+        vec = np.zeros(self.dim, np.float32)
+        for term, count in counts.items():
+            if known_only and self.df.get(term, 0) <= 0:
+                continue
+            index, sign = _bucket(term, self.dim)
+            vec[index] += sign * (1.0 + math.log(count)) * self._idf(term)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _reserve(self, rows):
+        if rows <= len(self.matrix):
+            return
+        capacity = max(rows, 2 * len(self.matrix), 1024)
+        matrix = np.zeros((capacity, self.dim), np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        types = np.zeros(capacity, np.int32)
+        types[:self.size] = self.types[:self.size]
+        self.matrix, self.types = matrix, types
+
+    def _type_code(self, node_type):
+        return self.type_codes.setdefault(node_type or 'concept', len(self.type_codes))
+
+    def build(self, nodes):
+        """Embed ``nodes`` into an empty index."""
+        nodes = list(nodes)
+        node_counts = [node_terms(n) for n in nodes]
+        # Document frequencies first, so every vector gets the final IDF
+        for node, counts in zip(nodes, node_counts):
+            self.terms[node['_id']] = set(counts)
+            self.df.update(counts.keys())
+        vocab = {}
+        for term in self.df:
+            index, sign = _bucket(term, self.dim)
+            vocab[term] = (index, sign * self._idf(term))
+
+        # Scatter every (row, bucket, weight) into the matrix at once
+        self._reserve(len(nodes))
+        cells, weights = [], []
+        for row, (node, counts) in enumerate(zip(nodes, node_counts)):
+            for term, count in counts.items():
+                index, weight = vocab[term]
+                cells.append(row * self.dim + index)
+                weights.append((1.0 + math.log(count)) * weight)
+            self.types[row] = self._type_code(node.get('type'))
+            self.rows[node['_id']] = row
+            self.ids.append(node['_id'])
+        self.size = len(nodes)
+        if not nodes:
+            return
+        dense = np.bincount(cells, weights, minlength=self.size * self.dim).reshape(self.size, self.dim)
+        norms = np.linalg.norm(dense, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix[:self.size] = dense / norms
+
+    def upsert(self, node):
+        node_id = node['_id']
+        counts = node_terms(node)
+        if node_id in self.terms:
+            self.df.subtract(self.terms[node_id])
+        self.terms[node_id] = set(counts)
+        self.df.update(counts.keys())
+
+        row = self.rows.get(node_id)
+        if row is None:
+            self._reserve(self.size + 1)
+            row = self.size
+            self.size += 1
+            self.ids.append(node_id)
+            self.rows[node_id] = row
+        self.matrix[row] = self._vector(counts)
+        self.types[row] = self._type_code(node.get('type'))
+        self.changes += 1
+
+    def remove(self, node_id):
+        row = self.rows.pop(node_id, None)
+        if row is None:
+            return
+        self.df.subtract(self.terms.pop(node_id))
+        last = self.size - 1
+        if row != last:
+            # Move the last row into the hole
+            moved = self.ids[last]
+            self.matrix[row] = self.matrix[last]
+            self.types[row] = self.types[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.ids.pop()
+        self.size -= 1
+        self.changes += 1
+
+    def needs_rebuild(self):
+        return self.changes > REBUILD_RATIO * max(self.size, 1000)
+
+    def query(self, text, k=10, node_type=None, min_score=0.05):
+        """[(node _id, score)] best matches for ``text``, highest first."""
+        if not self.size:
+            return []
+        query = self._vector(Counter(_terms(text)), known_only=True)
+        if not query.any():
+            return []
+        scores = self.matrix[:self.size] @ query
+        if node_type:
+            code = self.type_codes.get(node_type)
+            if code is None:
+                return []
+            scores[self.types[:self.size] != code] = -1.0
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+_index = None
+_version = None
+_index_lock = threading.Lock()
+
+
+def sync_vector_index(db):
+    """Bring the index up to date with the current KB version."""
+    global _index, _version
+    version = kb_version(db)
+    if _index is not None and _version == version:
+        return _index
+    with _index_lock:
+        if _index is not None and _version == version:
+            return _index
+        node_ids = None
+        if _index is not None and not _index.needs_rebuild():
+            version, node_ids = kb_changes_since(db, _version)
+        if node_ids is None:
+            index = KBVectorIndex()
+            index.build(db.knowledge_base.find({}, _FIELDS))
+        else:
+            index = _index
+            node_ids = list(node_ids)
+            for start in range(0, len(node_ids), 1000):
+                batch = node_ids[start:start + 1000]
+                found = set()
+                for node in db.knowledge_base.find({'_id': {'$in': batch}}, _FIELDS):
+                    found.add(node['_id'])
+                    index.upsert(node)
+                for node_id in batch:
+                    if node_id not in found:
+                        index.remove(node_id)
+        _index, _version = index, version
+        return index
+
+
+def suggest_kb_nodes(db, text, k=10, node_type=None):
+    """[(node _id, score)] for caption ``text``."""
+    index = sync_vector_index(db)
+    with _index_lock:
+        return index.query(text, k, node_type)
@@ -0,0 +1,236 @@
+"""Content-addressed storage for region masks under uploads/masks.
+
+Masks arrive from the editor as base64 data URLs. Instead of keeping them
+inline in ``object_regions`` they are written once to
+``uploads/masks/<aa>/<sha256>.<ext>`` and the document only keeps the
+relative path (the "ref"). Identical masks share a single file, which is
+deleted once no region references it.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+from pymongo import UpdateOne
+from config import Config
+
+MASK_DIR = os.path.join(Config.UPLOAD_FOLDER, 'masks')
+MASK_URL_PREFIX = '/uploads/masks/'
+
+# Region fields that hold masks, mapped to the field that stores their ref
+MASK_FIELDS = {
+    'segmented_mask': 'segmented_mask_ref',
+    'brush_mask': 'brush_mask_ref',
+}
+
+# Mask images the editor produces; anything else is rejected
+_DATA_URL_RE = re.compile(r'^data:image/(?P<ext>png|jpe?g|webp);base64,', re.IGNORECASE)
+_REF_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+def _decode(value):
+    """Return (bytes, ext) for a data URL or bare base64 string.
+
+    Raises ValueError for other image types and malformed base64.
+    """
+    ext = 'png'
+    match = _DATA_URL_RE.match(value)
+    if match:
+        ext = match.group('ext').lower().replace('jpeg', 'jpg')
+        value = value[match.end():]
+    elif value.startswith('data:'):
+        raise ValueError('Masks must be PNG, JPEG or WebP images')
+    elif ',' in value:
+        value = value.split(',', 1)[1]
+    try:
+        return base64.b64decode(value, validate=True), ext
+    except binascii.Error:
+        raise ValueError('Mask is not valid base64') from None
+
+
+def is_mask_url(value):
+    return isinstance(value, str) and value.startswith(MASK_URL_PREFIX)
+
+
+def mask_path(ref):
+    """Absolute path of a stored mask; rejects anything that is not a ref."""
+    if not ref or not _REF_RE.match(ref):
+        raise ValueError(f'Invalid mask ref: {ref}')
+    return os.path.join(MASK_DIR, ref)
+
+
+def mask_url(ref):
+    return f'{MASK_URL_PREFIX}{ref}' if ref else ''
+
+
+def store_mask(value):
+    """Write a mask to the content-addressed store and return its ref.
+
+    Accepts a data URL, bare base64 or an already-stored mask URL (returned
+    unchanged). Empty values return ''; invalid ones raise ValueError.
+    """
+    if not value:
+        return ''
+    if is_mask_url(value):
+        ref = value[len(MASK_URL_PREFIX):]
+        mask_path(ref)  # validate
+        return ref
+
+    data, ext = _decode(value)
+    digest = hashlib.sha256(data).hexdigest()
+    ref = f'{digest[:2]}/{digest}.{ext}'
+    path = os.path.join(MASK_DIR, ref)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    return ref
+
+
+def read_mask_bytes(value):
+    """Return raw image bytes for a mask URL, ref, data URL or base64 string."""
+    if is_mask_url(value):
+        value = value[len(MASK_URL_PREFIX):]
+    if _REF_RE.match(value or ''):
+        with open(mask_path(value), 'rb') as f:
+            return f.read()
+    return _decode(value)[0]
+
+
+def mask_data_url(ref):
+    """Inline a stored mask as a data URL (used by exports)."""
+    if not ref:
+        return ''
+    ext = ref.rsplit('.', 1)[-1]
+    mime = 'jpeg' if ext == 'jpg' else ext
+    with open(mask_path(ref), 'rb') as f:
+        return f'data:image/{mime};base64,{base64.b64encode(f.read()).decode("utf-8")}'
+
+
+def mask_rle(data):
+    """COCO-style uncompressed RLE of a mask image (foreground > 127).
+
+    Counts alternate background/foreground runs in column-major order,
+    starting with background.
+    """
+    import io
+    import numpy as np
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if image.mode in ('RGBA', 'LA'):
+        image = image.getchannel('A')
+    mask = np.asarray(image.convert('L')) > 127
+    height, width = mask.shape
+    flat = mask.flatten(order='F').astype(np.int8)
+    changes = np.flatnonzero(np.diff(flat)) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    if flat.size and flat[0]:
+        counts.insert(0, 0)
+    return {'size': [height, width], 'counts': counts}
+
+
+def region_mask_url(region, field='segmented_mask'):
+    """Lazy URL for a region mask, falling back to legacy inline data."""
+    ref = region.get(MASK_FIELDS[field])
+    if ref:
+        return mask_url(ref)
+    return region.get(field, '')
+
+
+def region_mask_data(region, field='segmented_mask'):
+    """Inline mask data for a region regardless of where it is stored."""
+    ref = region.get(MASK_FIELDS[field])
+    if ref:
+        return mask_data_url(ref)
+    return region.get(field, '')
+
+
+def externalize_fields(data):
+    """Build the $set/$unset parts that move masks in ``data`` to the store."""
+    to_set, to_unset = {}, {}
+    for field, ref_field in MASK_FIELDS.items():
+        if field in data:
+            to_set[ref_field] = store_mask(data[field])
+            to_unset[field] = ''
+    return to_set, to_unset
+
+
+def restore_masks(data):
+    """Store again the masks in ``data`` whose files vanished during the save.
+
+    A save stores its masks before writing the region; a cleanup in between
+    sees no reference and may delete a file the region now points at.
+    Called after the region write, when the reference is visible.
+    """
+    for field in MASK_FIELDS:
+        value = data.get(field)
+        if value and not is_mask_url(value):
+            store_mask(value)  # writes only a missing file
+
+
+def migrate_inline_masks(db, batch_size=500):
+    """Move inline masks out of ``object_regions`` in bulk.
+
+    Returns the number of regions rewritten.
+    """
+    query = {'$or': [
+        {field: {'$type': 'string', '$ne': ''}} for field in MASK_FIELDS
+    ]}
+    projection = {field: 1 for field in MASK_FIELDS}
+    migrated = 0
+    ops = []
+
+    for region in db.object_regions.find(query, projection).batch_size(batch_size):
+        try:
+            to_set, to_unset = externalize_fields(
+                {f: region[f] for f in MASK_FIELDS if isinstance(region.get(f), str)}
+            )
+        except ValueError:
+            continue  # unreadable legacy mask: left inline
+        ops.append(UpdateOne({'_id': region['_id']}, {'$set': to_set, '$unset': to_unset}))
+        if len(ops) >= batch_size:
+            migrated += db.object_regions.bulk_write(ops, ordered=False).modified_count
+            ops = []
+
+    if ops:
+        migrated += db.object_regions.bulk_write(ops, ordered=False).modified_count
+    return migrated
+
+
+def ensure_mask_indexes(db):
+    # Reference lookups before a shared mask file is deleted
+    for ref_field in MASK_FIELDS.values():
+        db.object_regions.create_index(ref_field, sparse=True)
+
+
+def region_mask_refs(db, query):
+    """Mask refs of the regions matching ``query``; collect them before deleting the regions."""
+    ref_fields = list(MASK_FIELDS.values())
+    return [
+        region.get(f)
+        for region in db.object_regions.find(query, {f: 1 for f in ref_fields})
+        for f in ref_fields
+    ]
+
+
+def remove_unreferenced_masks(db, refs):
+    """Delete the stored masks in ``refs`` that no region uses any more."""
+    removed = 0
+    for ref in set(r for r in refs if r):
+        in_use = db.object_regions.find_one(
+            {'$or': [{ref_field: ref} for ref_field in MASK_FIELDS.values()]}, {'_id': 1}
+        )
+        if in_use:
+            continue
+        try:
+            os.remove(mask_path(ref))
+            removed += 1
+        except (OSError, ValueError):
+            pass
+    return removed
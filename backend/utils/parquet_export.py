@@ -0,0 +1,212 @@
+"""Columnar (Parquet) export for training pipelines.
+
+Writes four tables — videos, segments, regions, captions — partitioned
+hive-style as ``project_id=<id>/subpart_id=<id|none>/<table>.parquet``.
+Rows are produced from batched cursors and flushed in row groups of
+``PARQUET_ROW_GROUP_SIZE`` rows, so memory does not grow with the project.
+Region masks are stored as COCO-style RLE: ``mask_rle`` holds the run
+counts as little-endian uint32 bytes, with ``mask_height``/``mask_width``.
+"""
+import os
+from config import Config
+from utils.exporter import EXPORT_REGION_PROJECTION, batched
+from utils.mask_store import mask_rle, read_mask_bytes, region_mask_url
+from utils.purge import live
+
+
+def _schemas():
+    import pyarrow as pa
+
+    return {
+        'videos': pa.schema([
+            ('video_id', pa.string()),
+            ('project_id', pa.string()),
+            ('subpart_id', pa.string()),
+            ('filename', pa.string()),
+            ('duration', pa.float64()),
+            ('width', pa.int32()),
+            ('height', pa.int32()),
+            ('fps', pa.float64()),
+        ]),
+        'segments': pa.schema([
+            ('segment_id', pa.string()),
+            ('video_id', pa.string()),
+            ('name', pa.string()),
+            ('order', pa.int32()),
+            ('start_time', pa.float64()),
+            ('end_time', pa.float64()),
+            ('duration', pa.float64()),
+        ]),
+        'regions': pa.schema([
+            ('region_id', pa.string()),
+            ('segment_id', pa.string()),
+            ('video_id', pa.string()),
+            ('label', pa.string()),
+            ('color', pa.string()),
+            ('category', pa.string()),
+            ('frame_time', pa.float64()),
+            ('mask_height', pa.int32()),
+            ('mask_width', pa.int32()),
+            ('mask_rle', pa.binary()),
+        ]),
+        'captions': pa.schema([
+            ('caption_id', pa.string()),
+            ('video_id', pa.string()),
+            ('segment_id', pa.string()),
+            ('region_id', pa.string()),
+            ('level', pa.dictionary(pa.int8(), pa.string())),
+            ('visual_en', pa.string()),
+            ('contextual_en', pa.string()),
+            ('knowledge_en', pa.string()),
+            ('combined_en', pa.string()),
+            ('visual_vi', pa.string()),
+            ('contextual_vi', pa.string()),
+            ('knowledge_vi', pa.string()),
+            ('combined_vi', pa.string()),
+        ]),
+    }
+
+
+class _PartitionedWriter:
+    """Buffers rows per (partition, table) and flushes full row groups."""
+
+    def __init__(self, out_dir, project_id):
+        self.out_dir = out_dir
+        self.project_id = project_id
+        self.schemas = _schemas()
+        self.row_group_size = Config.PARQUET_ROW_GROUP_SIZE
+        self._writers = {}
+        self._buffers = {}
+        self.files = []
+
+    def add(self, subpart_id, table, row):
+        key = (subpart_id, table)
+        rows = self._buffers.setdefault(key, [])
+        rows.append(row)
+        if len(rows) >= self.row_group_size:
+            self._flush(key)
+
+    def _flush(self, key):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = self._buffers.get(key)
+        if not rows:
+            return
+        subpart_id, table = key
+        if key not in self._writers:
+            part_dir = os.path.join(
+                self.out_dir, f'project_id={self.project_id}', f'subpart_id={subpart_id or "none"}'
+            )
+            os.makedirs(part_dir, exist_ok=True)
+            path = os.path.join(part_dir, f'{table}.parquet')
+            self._writers[key] = pq.ParquetWriter(path, self.schemas[table], compression='zstd')
+            self.files.append(path)
+        self._writers[key].write_table(
+            pa.Table.from_pylist(rows, schema=self.schemas[table]),
+            row_group_size=self.row_group_size
+        )
+        self._buffers[key] = []
+
+    def close(self):
+        for key in list(self._buffers):
+            self._flush(key)
+        for writer in self._writers.values():
+            writer.close()
+
+
+def _caption_row(c, level):
+    return {
+        'caption_id': str(c['_id']),
+        'video_id': str(c['video_id']),
+        'segment_id': str(c['segment_id']),
+        'region_id': str(c['region_id']) if c.get('region_id') else None,
+        'level': level,
+        'visual_en': c.get('visual_caption', ''),
+        'contextual_en': c.get('contextual_caption', ''),
+        'knowledge_en': c.get('knowledge_caption', ''),
+        'combined_en': c.get('combined_caption', ''),
+        'visual_vi': c.get('visual_caption_vi', ''),
+        'contextual_vi': c.get('contextual_caption_vi', ''),
+        'knowledge_vi': c.get('knowledge_caption_vi', ''),
+        'combined_vi': c.get('combined_caption_vi', ''),
+    }
+
+
+def _region_row(r):
+    import numpy as np
+
+    height = width = None
+    rle = None
+    mask = region_mask_url(r)
+    if mask:
+        encoded = mask_rle(read_mask_bytes(mask))
+        height, width = encoded['size']
+        rle = np.asarray(encoded['counts'], dtype='<u4').tobytes()
+    return {
+        'region_id': str(r['_id']),
+        'segment_id': str(r['segment_id']),
+        'video_id': str(r['video_id']),
+        'label': r.get('label', ''),
+        'color': r.get('color', ''),
+        'category': r.get('category_name', ''),
+        'frame_time': float(r['frame_time']),
+        'mask_height': height,
+        'mask_width': width,
+        'mask_rle': rle,
+    }
+
+
+def write_project_parquet(db, project, out_dir, progress=None):
+    """Write the partitioned dataset under ``out_dir``; returns the file paths."""
+    writer = _PartitionedWriter(out_dir, str(project['_id']))
+    videos = db.videos.find(live({'project_id': project['_id']})).batch_size(Config.EXPORT_BATCH_SIZE)
+    done = 0
+
+    try:
+        for batch in batched(videos, Config.EXPORT_BATCH_SIZE):
+            subpart_of = {}
+            for v in batch:
+                subpart_id = str(v['subpart_id']) if v.get('subpart_id') else None
+                subpart_of[v['_id']] = subpart_id
+                writer.add(subpart_id, 'videos', {
+                    'video_id': str(v['_id']),
+                    'project_id': str(v['project_id']),
+                    'subpart_id': subpart_id,
+                    'filename': v.get('original_name', ''),
+                    'duration': float(v.get('duration', 0) or 0),
+                    'width': int(v.get('width', 0) or 0),
+                    'height': int(v.get('height', 0) or 0),
+                    'fps': float(v.get('fps', 0) or 0),
+                })
+
+            video_ids = list(subpart_of)
+            segment_ids = []
+            for seg in db.video_segments.find({'video_id': {'$in': video_ids}}).sort('order', 1):
+                segment_ids.append(seg['_id'])
+                writer.add(subpart_of[seg['video_id']], 'segments', {
+                    'segment_id': str(seg['_id']),
+                    'video_id': str(seg['video_id']),
+                    'name': seg.get('name', ''),
+                    'order': int(seg.get('order', 0)),
+                    'start_time': float(seg['start_time']),
+                    'end_time': float(seg['end_time']),
+                    'duration': round(seg['end_time'] - seg['start_time'], 3),
+                })
+
+            for r in db.object_regions.find(
+                {'segment_id': {'$in': segment_ids}}, EXPORT_REGION_PROJECTION
+            ):
+                writer.add(subpart_of[r['video_id']], 'regions', _region_row(r))
+
+            for c in db.captions.find({'segment_id': {'$in': segment_ids}}):
+                level = 'region' if c.get('region_id') else 'segment'
+                writer.add(subpart_of[c['video_id']], 'captions', _caption_row(c, level))
+
+            done += len(batch)
+            if progress:
+                progress(done)
+    finally:
+        writer.close()
+
+    return writer.files
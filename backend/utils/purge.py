@@ -0,0 +1,149 @@
+"""Soft deletes and the background purge of deleted projects and videos.
+
+Deleting a project or video only stamps ``deleted_at`` on it (and, for a
+project, on its videos). Reads filter with ``live()``, so they disappear
+at once and the request does no cascading work. The ``purge`` job then
+removes whatever is marked:
+
+* per video: segments with their regions and captions, in batches of
+  ``PURGE_BATCH_SIZE``; mask files no other region uses; then the video
+  document and its files (released through ``video_blobs``)
+* per project, once its videos are gone: subparts, export archives,
+  dataset and cached exports, then the project
+
+It sleeps ``PURGE_PAUSE_MS`` between batches, so even a large project is
+removed as a trickle of small writes that never stalls other requests.
+A running purge picks up deletes made while it runs; anything marked as it
+finishes, or left by a purge that died with its server, gets a new one.
+"""
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from config import Config
+from utils.export_cache import remove_cached
+from utils.jobs import enqueue_job, on_job_released
+from utils.mask_store import MASK_FIELDS, remove_unreferenced_masks
+from utils.tombstones import record_deletes
+from utils.versions import bump_project_version
+from utils.video_blobs import release_video_files
+
+DELETED = {'deleted_at': {'$exists': True}}
+
+
+def live(query=None):
+    """``query`` restricted to documents that are not soft-deleted."""
+    return {**(query or {}), 'deleted_at': None}
+
+
+def ensure_purge_indexes(db):
+    # Only soft-deleted documents are indexed; the purge job looks them up
+    for collection in (db.videos, db.projects):
+        collection.create_index('deleted_at', partialFilterExpression=DELETED)
+
+
+def soft_delete_video(db, video):
+    """Hide a video now; the purge job removes its data and files."""
+    now = datetime.now(timezone.utc)
+    # The video tombstone covers its segments, regions and captions
+    record_deletes(db, 'videos', {'_id': video['_id']}, video['project_id'])
+    db.videos.update_one({'_id': video['_id']}, {'$set': {'deleted_at': now, 'updated_at': now}})
+    bump_project_version(db, video['project_id'])
+
+
+def soft_delete_project(db, project):
+    """Hide a project and its videos now; the purge job removes the rest."""
+    now = datetime.now(timezone.utc)
+    db.videos.update_many(live({'project_id': project['_id']}), {'$set': {'deleted_at': now, 'updated_at': now}})
+    db.projects.update_one({'_id': project['_id']}, {'$set': {'deleted_at': now, 'updated_at': now}})
+
+
+def queue_purge():
+    """Start the purge job unless one is already queued or running."""
+    job, _ = enqueue_job('purge', 'deleted', _purge_job)
+    return job
+
+
+def _delete_batches(db, collection, query, pause, fields=(), on_batch=None):
+    """Delete matching documents ``PURGE_BATCH_SIZE`` at a time; returns the count."""
+    projection = {'_id': 1, **{f: 1 for f in fields}}
+    deleted = 0
+    while True:
+        docs = list(db[collection].find(query, projection).limit(Config.PURGE_BATCH_SIZE))
+        if not docs:
+            return deleted
+        db[collection].delete_many({'_id': {'$in': [d['_id'] for d in docs]}})
+        if on_batch:
+            on_batch(docs)
+        deleted += len(docs)
+        time.sleep(pause)
+
+
+def _purge_video(db, video_id, counts, pause):
+    ref_fields = tuple(MASK_FIELDS.values())
+    while True:
+        segment_ids = [s['_id'] for s in db.video_segments.find(
+            {'video_id': video_id}, {'_id': 1}
+        ).limit(Config.PURGE_BATCH_SIZE)]
+        if not segment_ids:
+            break
+        in_segments = {'segment_id': {'$in': segment_ids}}
+        counts['captions'] += _delete_batches(db, 'captions', in_segments, pause)
+        refs = []
+        counts['regions'] += _delete_batches(
+            db, 'object_regions', in_segments, pause, ref_fields,
+            lambda regions: refs.extend(r.get(f) for r in regions for f in ref_fields)
+        )
+        counts['masks'] += remove_unreferenced_masks(db, refs)
+        counts['segments'] += db.video_segments.delete_many({'_id': {'$in': segment_ids}}).deleted_count
+        time.sleep(pause)
+
+    release_video_files(db, [video_id])
+    remove_cached('video', video_id)
+    db.videos.delete_one({'_id': video_id})
+    counts['videos'] += 1
+
+
+def purge_deleted(db, progress=None):
+    """Remove soft-deleted videos and projects with their data and files; returns counts."""
+    pause = Config.PURGE_PAUSE_MS / 1000
+    counts = dict.fromkeys(('projects', 'videos', 'segments', 'regions', 'captions', 'masks'), 0)
+    while True:
+        video = db.videos.find_one(DELETED, {'_id': 1})
+        if video:
+            _purge_video(db, video['_id'], counts, pause)
+            if progress:
+                progress(counts['videos'], None, f'Purged {counts["videos"]} videos')
+            continue
+
+        project = db.projects.find_one(DELETED, {'_id': 1, 'deleted_at': 1})
+        if not project:
+            return counts
+        # Videos added while the delete was in flight go with the project
+        late = db.videos.update_many(
+            live({'project_id': project['_id']}), {'$set': {'deleted_at': project['deleted_at']}}
+        )
+        if late.modified_count:
+            continue
+        _delete_batches(db, 'subparts', {'project_id': project['_id']}, pause)
+        from utils.export_jobs import remove_project_exports
+        remove_project_exports(project['_id'])
+        db.projects.delete_one({'_id': project['_id']})
+        counts['projects'] += 1
+
+
+def _purge_job(ctx):
+    return purge_deleted(current_app.db, ctx.progress)
+
+
+def purge_pending(db):
+    """True if soft-deleted documents are waiting for the purge job."""
+    return bool(db.videos.find_one(DELETED, {'_id': 1}) or db.projects.find_one(DELETED, {'_id': 1}))
+
+
+def _purge_released(outcome):
+    # A failing purge waits for the next delete or restart rather than retrying in a loop
+    if outcome != 'failed' and purge_pending(current_app.db):
+        queue_purge()
+
+
+on_job_released('purge', _purge_released)
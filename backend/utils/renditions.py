@@ -0,0 +1,206 @@
+"""Playback renditions of uploaded videos.
+
+Source files are often long-GOP and may keep the ``moov`` atom at the end,
+so browsers seek slowly in them. After ingest a ``renditions`` job writes
+browser-friendly copies to ``UPLOAD_FOLDER/renditions``:
+
+* ``proxy``: H.264/AAC MP4 with ``+faststart``, at most ``PROXY_HEIGHT``
+  lines, a keyframe every second. Sources that are already small enough
+  H.264 are only remuxed.
+* ``edit``: all-intra H.264 (every frame a keyframe) at most
+  ``EDIT_PROXY_HEIGHT`` lines, for frame-accurate scrubbing. Built when
+  ``EDIT_PROXY`` is set or on request.
+
+They are recorded in the video's ``renditions`` field. The editor plays
+``editing_rendition()``; exports and DAM frame extraction keep reading the
+original file.
+"""
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from bson import ObjectId
+from flask import current_app
+from config import Config
+from utils.ingest import probe_video, video_file_path
+from utils.jobs import enqueue_job
+from utils.purge import live
+from utils.versions import bump_video_versions
+from utils.video_blobs import shared_video_ids
+
+RENDITION_DIR = os.path.join(Config.UPLOAD_FOLDER, 'renditions')
+RENDITIONS = ('proxy', 'edit')
+# Preferred rendition for playback in the editor, best first
+EDITING_ORDER = ('edit', 'proxy')
+
+
+def default_renditions():
+    return ['proxy', 'edit'] if Config.EDIT_PROXY else ['proxy']
+
+
+def _scale(height):
+    # Never upscale; -2 keeps the width even, as yuv420p requires
+    return f"scale=-2:'min({height},ih)'"
+
+
+def _ffmpeg_args(name, video):
+    """Encoder arguments for rendition ``name`` of ``video``."""
+    audio = ['-c:a', 'aac', '-b:a', '128k', '-ac', '2']
+    if name == 'edit':
+        return [
+            '-vf', _scale(Config.EDIT_PROXY_HEIGHT),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20',
+            '-g', '1', '-bf', '0', '-pix_fmt', 'yuv420p', *audio
+        ]
+    if (video.get('codec') == 'h264' and video.get('pix_fmt') == 'yuv420p'
+            and 0 < video.get('height', 0) <= Config.PROXY_HEIGHT):
+        # Already playable: only move the index to the front
+        return ['-c:v', 'copy', *audio]
+    fps = video.get('fps') or 30
+    return [
+        '-vf', _scale(Config.PROXY_HEIGHT),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+        '-g', str(max(1, round(fps))), '-pix_fmt', 'yuv420p', *audio
+    ]
+
+
+def transcode(src, dst, args, duration=0, on_progress=None):
+    """Run ffmpeg ``src`` -> ``dst`` (MP4, faststart), written atomically."""
+    tmp = f'{dst}.tmp'
+    command = [
+        Config.FFMPEG_BIN, '-v', 'error', '-nostdin', '-y', '-i', src,
+        '-map', '0:v:0', '-map', '0:a:0?', *args,
+        '-movflags', '+faststart', '-f', 'mp4',
+        '-progress', 'pipe:1', '-nostats', tmp
+    ]
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        last = 0.0
+        for line in process.stdout:
+            key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+            if key == 'out_time_us' and on_progress and value.isdigit():
+                now = time.monotonic()
+                if now - last >= 1:
+                    on_progress(min(int(value) / 1e6, duration or float('inf')))
+                    last = now
+        if process.wait() != 0:
+            stderr.seek(0)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise RuntimeError(stderr.read().decode('utf-8', 'replace').strip() or 'ffmpeg failed')
+    os.replace(tmp, dst)
+
+
+def encode_renditions(db, video, names, on_progress=None):
+    """Write renditions ``names`` of ``video`` and record each on the document.
+
+    ``on_progress(seconds_done, seconds_total, message)`` reports encoding progress.
+    """
+    src = video_file_path(video)
+    stem = os.path.splitext(video['filename'])[0]
+    duration = video.get('duration') or 0
+    total = round(duration * len(names))
+    report = on_progress or (lambda *args: None)
+    os.makedirs(RENDITION_DIR, exist_ok=True)
+
+    built = {}
+    for i, name in enumerate(names):
+        message = f'Encoding {name}'
+        report(round(duration * i), total, message)
+        # New name per encode: served as immutable, so a URL never changes content
+        filename = f'{stem}_{name}_{uuid.uuid4().hex[:8]}.mp4'
+        path = os.path.join(RENDITION_DIR, filename)
+        transcode(
+            src, path, _ffmpeg_args(name, video), duration,
+            lambda t, i=i, message=message: report(round(duration * i + t), total, message)
+        )
+        meta = probe_video(path)
+        built[name] = {
+            'filename': filename,
+            'width': meta['width'],
+            'height': meta['height'],
+            'codec': meta['codec'],
+            'bit_rate': meta['bit_rate'],
+            'file_size': os.path.getsize(path),
+            'all_intra': name == 'edit',
+            'created_at': datetime.now(timezone.utc),
+        }
+        update = {'$set': {f'renditions.{name}': built[name], 'updated_at': datetime.now(timezone.utc)}}
+        previous = db.videos.find_one_and_update({'_id': video['_id']}, update, projection={f'renditions.{name}': 1})
+        # Videos sharing the file play the same rendition
+        video_ids = shared_video_ids(db, video)
+        db.videos.update_many({'_id': {'$in': [i for i in video_ids if i != video['_id']]}}, update)
+        bump_video_versions(db, video_ids)
+        if previous:
+            # Projected to this rendition only: drop the file it replaced
+            remove_rendition_files(previous)
+    report(total, total, 'Done')
+    return built
+
+
+def build_renditions(ctx, video_id, names):
+    """Job function: encode the requested renditions of a video."""
+    db = current_app.db
+    video = db.videos.find_one(live({'_id': ObjectId(video_id)}))
+    if not video:
+        raise ValueError('Video not found')
+    built = encode_renditions(db, video, names, ctx.progress)
+    return {name: {k: v for k, v in r.items() if k != 'created_at'} for name, r in built.items()}
+
+
+def queue_renditions(video_id, names=None):
+    """Start a ``renditions`` job for ``video_id``; returns ``(job, created)``."""
+    names = names or default_renditions()
+    return enqueue_job(
+        'renditions', str(video_id), build_renditions, str(video_id), names,
+        params={'video_id': str(video_id), 'renditions': names}
+    )
+
+
+def renditions_after_ingest():
+    """``start_ingest`` callback that queues the default renditions once a video is ready."""
+    app = current_app._get_current_object()
+
+    def queue(video_id):
+        with app.app_context():
+            queue_renditions(video_id)
+    return queue
+
+
+def remove_rendition_files(video):
+    for rendition in (video.get('renditions') or {}).values():
+        try:
+            os.remove(os.path.join(RENDITION_DIR, rendition['filename']))
+        except OSError:
+            pass
+
+
+def editing_rendition(video):
+    """Name of the rendition the editor should play, or None for the original."""
+    renditions = video.get('renditions') or {}
+    return next((name for name in EDITING_ORDER if name in renditions), None)
+
+
+def serialize_renditions(video):
+    """Playback URLs of a video: ``url`` is the editing rendition, ``original_url`` the source."""
+    renditions = video.get('renditions') or {}
+    original = f'/uploads/videos/{video["filename"]}'
+    editing = editing_rendition(video)
+    return {
+        'url': f'/uploads/renditions/{renditions[editing]["filename"]}' if editing else original,
+        'original_url': original,
+        'rendition': editing or 'original',
+        'renditions': {
+            name: {
+                'url': f'/uploads/renditions/{r["filename"]}',
+                'width': r.get('width', 0),
+                'height': r.get('height', 0),
+                'all_intra': r.get('all_intra', False),
+            }
+            for name, r in renditions.items()
+        },
+    }
@@ -0,0 +1,58 @@
+"""Segment writes shared by the segment routes and background jobs."""
+from datetime import datetime, timezone
+from bson import ObjectId
+from utils.mask_store import region_mask_refs, remove_unreferenced_masks
+from utils.tombstones import record_deletes
+from utils.versions import bump_video_version
+
+
+def mark_video_modified(db, video_id):
+    """Bump the video's content version and reset its review if it was approved."""
+    video = bump_video_version(db, video_id)
+    if video and video.get('review_status') == 'approved':
+        db.videos.update_one(
+            {'_id': video_id},
+            {'$set': {
+                'review_status': 'not_submitted',
+                'reviews': [],
+                'review_comment': 'Auto-reset: Content modified after approval',
+                'updated_at': datetime.now(timezone.utc)
+            }}
+        )
+
+
+def write_segments_batch(db, video, segments_data, user_id, replace=False):
+    """Insert ``segments_data`` (name/start_time/end_time dicts) for ``video``.
+
+    With ``replace`` the video's existing segments, regions and captions are
+    deleted first. Returns the inserted segment documents.
+    """
+    video_id = video['_id']
+    if replace:
+        existing_segments = [s['_id'] for s in db.video_segments.find({'video_id': video_id}, {'_id': 1})]
+        record_deletes(db, 'captions', {'segment_id': {'$in': existing_segments}}, video['project_id'])
+        record_deletes(db, 'object_regions', {'segment_id': {'$in': existing_segments}}, video['project_id'])
+        record_deletes(db, 'video_segments', {'video_id': video_id}, video['project_id'])
+        mask_refs = region_mask_refs(db, {'segment_id': {'$in': existing_segments}})
+        db.captions.delete_many({'segment_id': {'$in': existing_segments}})
+        db.object_regions.delete_many({'segment_id': {'$in': existing_segments}})
+        db.video_segments.delete_many({'video_id': video_id})
+        remove_unreferenced_masks(db, mask_refs)
+
+    now = datetime.now(timezone.utc)
+    segments = [{
+        'video_id': ObjectId(video_id),
+        'name': seg_data.get('name', f'Segment {i + 1}'),
+        'start_time': float(seg_data['start_time']),
+        'end_time': float(seg_data['end_time']),
+        'order': i,
+        'created_by': user_id,
+        'created_at': now,
+        'updated_at': now
+    } for i, seg_data in enumerate(segments_data)]
+    if segments:
+        db.video_segments.insert_many(segments)
+
+    # Reset video approval if was approved
+    mark_video_modified(db, video_id)
+    return segments
@@ -0,0 +1,239 @@
+"""Shot-boundary detection for auto-split.
+
+ffmpeg decodes a ``ANALYSIS_WIDTH`` x ``ANALYSIS_HEIGHT`` RGB stream at the
+video's frame rate and the frames are scored in batches with numpy:
+
+* colour change: L1 distance between 512-bin joint RGB histograms,
+  built for a whole batch with a single ``bincount``
+* structure change: SSIM of the grey frames over 4x4 blocks
+
+A frame pair scores ``(2 * hist_distance + 1 - ssim) / 3``. Colour is
+weighted up because fast motion alone can wreck block SSIM while the
+histogram barely moves; a cut changes both. Pairs at or above the threshold are cut candidates, and of candidates closer than
+``min_shot`` seconds only the strongest is kept. Long videos are split
+into ``SHOT_CHUNK_SECONDS`` chunks analysed in parallel processes; the
+pair straddling two chunks is scored from the chunks' edge frames.
+"""
+import math
+import multiprocessing
+import os
+import subprocess
+import time
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bson import ObjectId
+from flask import current_app
+import numpy as np
+from config import Config
+from utils.ingest import probe_video, video_file_path
+from utils.purge import live
+from utils.renditions import RENDITION_DIR
+from utils.segments import write_segments_batch
+
+ANALYSIS_WIDTH = 64
+ANALYSIS_HEIGHT = 36
+BLOCK = 4
+BATCH_FRAMES = 512
+DEFAULT_THRESHOLD = 0.45
+DEFAULT_MIN_SHOT = 1.0
+
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+# ==================== WORKER SIDE ====================
+
+def frame_features(frames):
+    """Histograms ``(n, 512)`` and grey frames ``(n, h, w)`` of an RGB batch ``(n, h, w, 3)``."""
+    n = len(frames)
+    q = (frames >> 5).astype(np.int32)
+    bins = ((q[..., 0] << 6) | (q[..., 1] << 3) | q[..., 2]).reshape(n, -1)
+    bins += (np.arange(n, dtype=np.int32) * 512)[:, None]
+    hist = np.bincount(bins.ravel(), minlength=n * 512).reshape(n, 512).astype(np.float32)
+    hist /= bins.shape[1]
+    gray = frames.astype(np.float32) @ _LUMA
+    return hist, gray
+
+
+def _block_stats(gray):
+    n, h, w = gray.shape
+    blocks = gray.reshape(n, h // BLOCK, BLOCK, w // BLOCK, BLOCK)
+    return blocks, blocks.mean(axis=(2, 4), keepdims=True)
+
+
+def pair_scores(hist, gray):
+    """Scores of the ``n - 1`` consecutive pairs of a feature batch."""
+    hist_distance = 0.5 * np.abs(hist[1:] - hist[:-1]).sum(axis=1)
+
+    blocks, mu = _block_stats(gray)
+    a, b = blocks[:-1], blocks[1:]
+    mu_a, mu_b = mu[:-1], mu[1:]
+    var_a = ((a - mu_a) ** 2).mean(axis=(2, 4))
+    var_b = ((b - mu_b) ** 2).mean(axis=(2, 4))
+    cov = ((a - mu_a) * (b - mu_b)).mean(axis=(2, 4))
+    mu_a, mu_b = mu_a[:, :, 0, :, 0], mu_b[:, :, 0, :, 0]
+    ssim = ((2 * mu_a * mu_b + _SSIM_C1) * (2 * cov + _SSIM_C2)) / (
+        (mu_a ** 2 + mu_b ** 2 + _SSIM_C1) * (var_a + var_b + _SSIM_C2)
+    )
+    ssim = np.clip(ssim.mean(axis=(1, 2)), 0, 1)
+    return (2 * hist_distance + 1 - ssim) / 3
+
+
+def analyze_chunk(path, start, length, fps):
+    """Pair scores of one chunk (runs in a worker process).
+
+    Returns the scores (pair ``i`` ends at frame ``i + 1``), the frame
+    count and the features of the first and last frame for stitching.
+    """
+    frame_size = ANALYSIS_WIDTH * ANALYSIS_HEIGHT * 3
+    process = subprocess.Popen([
+        Config.FFMPEG_BIN, '-v', 'error', '-nostdin',
+        '-ss', f'{start:.3f}', '-t', f'{length:.3f}', '-i', path, '-an', '-sn',
+        '-vf', f'fps={fps},scale={ANALYSIS_WIDTH}:{ANALYSIS_HEIGHT}:flags=area',
+        '-pix_fmt', 'rgb24', '-f', 'rawvideo', 'pipe:1'
+    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    scores = []
+    first = last = None
+    frames = 0
+    while True:
+        data = process.stdout.read(frame_size * BATCH_FRAMES)
+        usable = len(data) - len(data) % frame_size
+        if not usable:
+            break
+        batch = np.frombuffer(data[:usable], dtype=np.uint8).reshape(
+            -1, ANALYSIS_HEIGHT, ANALYSIS_WIDTH, 3
+        )
+        hist, gray = frame_features(batch)
+        if last is not None:
+            # Carry the previous batch's last frame so no pair is skipped
+            hist, gray = np.concatenate([last[0], hist]), np.concatenate([last[1], gray])
+        elif len(batch):
+            first = (hist[:1].copy(), gray[:1].copy())
+        if len(hist) > 1:
+            scores.append(pair_scores(hist, gray))
+        last = (hist[-1:].copy(), gray[-1:].copy())
+        frames += len(batch)
+    process.stdout.close()
+    if process.wait() != 0 and not frames:
+        raise RuntimeError(f'ffmpeg could not decode {os.path.basename(path)} at {start:.1f}s')
+    return {
+        'start': start,
+        'frames': frames,
+        'scores': np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32),
+        'first': first,
+        'last': last,
+    }
+
+
+# ==================== JOB SIDE ====================
+
+def select_cuts(times, scores, threshold, min_shot, duration):
+    """Cut times: candidates >= threshold, strongest first, at least ``min_shot`` apart."""
+    candidates = np.flatnonzero(scores >= threshold)
+    accepted = []
+    for i in candidates[np.argsort(-scores[candidates], kind='stable')]:
+        t = float(times[i])
+        if t < min_shot or duration - t < min_shot:
+            continue
+        pos = bisect_left(accepted, t)
+        if pos > 0 and t - accepted[pos - 1] < min_shot:
+            continue
+        if pos < len(accepted) and accepted[pos] - t < min_shot:
+            continue
+        insort(accepted, t)
+    return accepted
+
+
+def shots_from_cuts(cuts, duration):
+    bounds = [0.0, *cuts, duration]
+    return [
+        {'name': f'Shot {i + 1}', 'start_time': round(a, 3), 'end_time': round(b, 3)}
+        for i, (a, b) in enumerate(zip(bounds, bounds[1:]))
+    ]
+
+
+def detect_shots(path, duration, fps, threshold=DEFAULT_THRESHOLD, min_shot=DEFAULT_MIN_SHOT,
+                 on_progress=None):
+    """Cut times of a video file, analysing chunks in parallel processes."""
+    chunk = Config.SHOT_CHUNK_SECONDS
+    starts = [i * chunk for i in range(max(1, math.ceil(duration / chunk)))]
+    results = []
+    # spawn: forking a threaded server process is not safe
+    with ProcessPoolExecutor(max_workers=Config.SHOT_DETECT_WORKERS,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(analyze_chunk, path, s, min(chunk, duration - s), fps) for s in starts]
+        for done, future in enumerate(as_completed(futures), 1):
+            results.append(future.result())
+            if on_progress:
+                on_progress(done, len(futures))
+    results.sort(key=lambda r: r['start'])
+
+    times, scores = [], []
+    previous = None
+    for result in results:
+        if previous is not None and previous['last'] is not None and result['first'] is not None:
+            edge = pair_scores(
+                np.concatenate([previous['last'][0], result['first'][0]]),
+                np.concatenate([previous['last'][1], result['first'][1]])
+            )
+            times.append(np.array([result['start']]))
+            scores.append(edge)
+        n = len(result['scores'])
+        times.append(result['start'] + np.arange(1, n + 1) / fps)
+        scores.append(result['scores'])
+        previous = result
+    times = np.concatenate(times) if times else np.zeros(0)
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    return select_cuts(times, scores, threshold, min_shot, duration), int(sum(r['frames'] for r in results))
+
+
+def analysis_source(video):
+    """Smallest faithful copy to decode: the playback proxy if there is one."""
+    proxy = (video.get('renditions') or {}).get('proxy')
+    if proxy:
+        path = os.path.join(RENDITION_DIR, proxy['filename'])
+        if os.path.exists(path):
+            return path
+    return video_file_path(video)
+
+
+def build_shot_segments(ctx, video_id, options, user_id=None):
+    """Job function: propose shot segments for a video, optionally writing them."""
+    db = current_app.db
+    video = db.videos.find_one(live({'_id': ObjectId(video_id)}))
+    if not video:
+        raise ValueError('Video not found')
+
+    path = analysis_source(video)
+    duration, fps = video.get('duration') or 0, video.get('fps') or 0
+    if not duration or not fps:
+        meta = probe_video(path)
+        duration, fps = meta['duration'], meta['fps']
+
+    started = time.monotonic()
+    ctx.progress(0, None, 'Analysing frames')
+    cuts, frames = detect_shots(
+        path, duration, fps, options['threshold'], options['min_shot'],
+        on_progress=lambda done, total: ctx.progress(done, total, 'Analysing frames')
+    )
+    elapsed = time.monotonic() - started
+    segments = shots_from_cuts(cuts, duration)
+
+    applied = False
+    if options.get('apply'):
+        # Deleted during the analysis: the purge may already have run for it
+        if not db.videos.find_one(live({'_id': video['_id']}), {'_id': 1}):
+            raise ValueError('Video not found')
+        write_segments_batch(db, video, segments, user_id, replace=options.get('replace', False))
+        applied = True
+
+    return {
+        'cuts': [round(t, 3) for t in cuts],
+        'segments': segments,
+        'applied': applied,
+        'frames': frames,
+        'seconds': round(elapsed, 2),
+        'speed': round(duration / elapsed, 1) if elapsed else None,
+    }
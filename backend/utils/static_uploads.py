@@ -0,0 +1,75 @@
+"""Serving files under ``UPLOAD_FOLDER`` (the ``/uploads/`` route).
+
+Flask serves them itself with ETag/Last-Modified, single-range ``Range``
+and ``If-Range`` support. With ``UPLOADS_OFFLOAD`` the app only checks the
+path and sets the headers, and the front server sends the bytes, so a long
+playback no longer occupies an app worker:
+
+* ``nginx``: ``X-Accel-Redirect`` to the internal ``UPLOADS_ACCEL_PREFIX``
+  location. Used only for requests that arrive through nginx, which sends
+  ``X-Sendfile-Type: X-Accel-Redirect`` (the Rack convention), so hitting
+  the backend port directly still works.
+* ``sendfile``: ``X-Sendfile`` with the absolute path (Apache, lighttpd).
+
+Every file in ``IMMUTABLE_DIRS`` has a unique name that is never reused
+for different content, so those are cacheable forever.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import abort, current_app, request
+from werkzeug.http import parse_range_header
+from werkzeug.security import safe_join
+from werkzeug.utils import send_from_directory
+from config import Config
+
+IMMUTABLE_DIRS = ('videos', 'renditions', 'thumbnails', 'masks', 'frames')
+PRIVATE_DIRS = ('incoming',)
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+
+def _drop_unusable_range():
+    """Ignore Range headers we cannot answer with a single part.
+
+    RFC 9110 lets a server ignore Range and send the full 200 response;
+    werkzeug would answer multi-range or malformed headers with 416.
+    """
+    value = request.environ.get('HTTP_RANGE')
+    if value is None:
+        return
+    parsed = parse_range_header(value)
+    if parsed is None or len(parsed.ranges) != 1:
+        del request.environ['HTTP_RANGE']
+
+
+def _accel_redirect(filename):
+    """Empty response telling nginx to serve ``filename`` itself (Range included)."""
+    mimetype, _ = mimetypes.guess_type(filename)
+    response = current_app.response_class(mimetype=mimetype or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = Config.UPLOADS_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+    return response
+
+
+def send_upload(filename):
+    """Response for ``/uploads/<filename>``."""
+    folder = filename.split('/', 1)[0]
+    if folder in PRIVATE_DIRS:
+        abort(404)
+    path = safe_join(Config.UPLOAD_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mode = Config.UPLOADS_OFFLOAD
+    if mode == 'nginx' and request.headers.get('X-Sendfile-Type') == 'X-Accel-Redirect':
+        response = _accel_redirect(filename)
+    else:
+        _drop_unusable_range()
+        response = send_from_directory(
+            Config.UPLOAD_FOLDER, filename, request.environ,
+            use_x_sendfile=mode == 'sendfile', response_class=current_app.response_class
+        )
+        response.headers['Accept-Ranges'] = 'bytes'
+
+    if folder in IMMUTABLE_DIRS:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    return response
@@ -0,0 +1,37 @@
+"""Tombstones for hard deletes, consumed by delta exports.
+
+Every delete of a video, segment, region or caption records
+``{collection, doc_id, project_id, video_id, deleted_at}`` in the
+``tombstones`` collection before the documents are removed.
+"""
+from datetime import datetime, timezone
+
+
+def ensure_tombstone_indexes(db):
+    db.tombstones.create_index([('project_id', 1), ('deleted_at', 1)])
+
+
+def project_id_for_video(db, video_id):
+    video = db.videos.find_one({'_id': video_id}, {'project_id': 1})
+    return video.get('project_id') if video else None
+
+
+def record_deletes(db, collection, query, project_id):
+    """Record tombstones for every document in ``collection`` matching ``query``.
+
+    Call this right before the matching ``delete_one``/``delete_many``.
+    """
+    now = datetime.now(timezone.utc)
+    fields = {'_id': 1, 'video_id': 1, 'segment_id': 1, 'region_id': 1}
+    tombstones = [{
+        'collection': collection,
+        'doc_id': doc['_id'],
+        'project_id': project_id,
+        'video_id': doc['_id'] if collection == 'videos' else doc.get('video_id'),
+        'segment_id': doc.get('segment_id'),
+        'region_id': doc.get('region_id'),
+        'deleted_at': now
+    } for doc in db[collection].find(query, fields)]
+    if tombstones:
+        db.tombstones.insert_many(tombstones)
+    return len(tombstones)
@@ -0,0 +1,209 @@
+"""Resumable chunked uploads (tus-like).
+
+A client creates a session with the final size, PATCHes chunks with their
+byte offset (in any order, several at once) and finalizes when every byte
+has arrived. Sessions live in ``upload_sessions``; the data goes straight
+from the request stream into ``UPLOAD_FOLDER/incoming/<id>.part``, which
+is preallocated to the final size.
+
+Each written byte range is ``$push``-ed to the session, so concurrent
+chunks never overwrite each other's bookkeeping; the resumable offset is
+the end of the contiguous prefix of the merged ranges. A SHA-256 of that
+prefix is kept in memory and fed with chunks as they stream in order;
+when an out-of-order chunk fills a gap (or after a restart) it catches up
+by reading the file back.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from config import Config
+
+INCOMING_DIR = os.path.join(Config.UPLOAD_FOLDER, 'incoming')
+BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def ensure_upload_indexes(db):
+    db.upload_sessions.create_index('expires_at')
+
+
+def part_path(session_id):
+    return os.path.join(INCOMING_DIR, f'{session_id}.part')
+
+
+def merge_ranges(ranges):
+    """Sorted, non-overlapping ``[start, end)`` ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def committed_offset(session):
+    """End of the contiguous prefix received so far."""
+    merged = merge_ranges(session.get('ranges', []))
+    return merged[0][1] if merged and merged[0][0] == 0 else 0
+
+
+def _expiry():
+    return datetime.now(timezone.utc) + timedelta(hours=Config.UPLOAD_SESSION_HOURS)
+
+
+# ==================== HASHING ====================
+
+class _PrefixHash:
+    def __init__(self):
+        self.sha = hashlib.sha256()
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def feed(self, position, data):
+        """Hash ``data`` if it continues the hashed prefix exactly."""
+        with self.lock:
+            if position == self.offset:
+                self.sha.update(data)
+                self.offset += len(data)
+
+    def catch_up(self, path, end):
+        """Hash the file from the current prefix up to ``end``."""
+        with self.lock:
+            if self.offset >= end:
+                return
+            with open(path, 'rb') as f:
+                f.seek(self.offset)
+                while self.offset < end:
+                    data = f.read(min(BLOCK_SIZE, end - self.offset))
+                    if not data:
+                        break
+                    self.sha.update(data)
+                    self.offset += len(data)
+
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def _prefix_hash(session_id):
+    with _hashes_lock:
+        return _hashes.setdefault(session_id, _PrefixHash())
+
+
+def _drop_hash(session_id):
+    with _hashes_lock:
+        _hashes.pop(session_id, None)
+
+
+# ==================== SESSIONS ====================
+
+def create_session(db, user_id, fields):
+    """Insert an upload session and preallocate its part file."""
+    now = datetime.now(timezone.utc)
+    session = {
+        '_id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'ranges': [],
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': _expiry(),
+        **fields
+    }
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    with open(part_path(session['_id']), 'wb') as f:
+        f.truncate(session['size'])
+    db.upload_sessions.insert_one(session)
+    return session
+
+
+def write_chunk(db, session, offset, stream, length=None):
+    """Stream a chunk to ``offset`` of the part file; returns the updated session.
+
+    Bytes that arrived before a dropped connection are kept and recorded.
+    """
+    size = session['size']
+    if offset < 0 or offset > size:
+        raise UploadError('Upload-Offset is outside the upload', 416)
+    if length is not None and offset + length > size:
+        raise UploadError('Chunk extends past the declared upload size', 416)
+
+    path = part_path(session['_id'])
+    prefix = _prefix_hash(session['_id'])
+    position = offset
+    try:
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            while position < size:
+                data = stream.read(min(BLOCK_SIZE, size - position))
+                if not data:
+                    break
+                f.write(data)
+                prefix.feed(position, data)
+                position += len(data)
+    finally:
+        if position > offset:
+            session = db.upload_sessions.find_one_and_update(
+                {'_id': session['_id']},
+                {
+                    '$push': {'ranges': [offset, position]},
+                    '$set': {'updated_at': datetime.now(timezone.utc), 'expires_at': _expiry()}
+                },
+                return_document=ReturnDocument.AFTER
+            ) or session
+    if length is not None and position - offset < length:
+        raise UploadError('Chunk ended early; resume from the reported offset', 400)
+
+    prefix.catch_up(path, committed_offset(session))
+    return session
+
+
+def finalize_session(db, session, checksum=None):
+    """Claim a complete session and move its file into uploads/videos.
+
+    Returns ``(filename, filepath, sha256)``.
+    """
+    if committed_offset(session) < session['size']:
+        raise UploadError('Upload is incomplete', 409)
+
+    path = part_path(session['_id'])
+    prefix = _prefix_hash(session['_id'])
+    prefix.catch_up(path, session['size'])
+    digest = prefix.sha.hexdigest()
+    if checksum and checksum.lower() != digest:
+        raise UploadError('Checksum mismatch', 422)
+
+    # Only one finalize call wins
+    if not db.upload_sessions.find_one_and_delete({'_id': session['_id']}):
+        raise UploadError('Upload not found', 404)
+    _drop_hash(session['_id'])
+
+    filename = f"{uuid.uuid4().hex}.{session['ext']}"
+    filepath = os.path.join(Config.UPLOAD_FOLDER, 'videos', filename)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    os.replace(path, filepath)
+    return filename, filepath, digest
+
+
+def delete_session(db, session_id):
+    db.upload_sessions.delete_one({'_id': session_id})
+    _drop_hash(session_id)
+    try:
+        os.remove(part_path(session_id))
+    except OSError:
+        pass
+
+
+def purge_expired_sessions(db):
+    """Remove sessions (and their part files) past ``expires_at``."""
+    expired = db.upload_sessions.find({'expires_at': {'$lt': datetime.now(timezone.utc)}}, {'_id': 1})
+    for session in expired:
+        delete_session(db, session['_id'])
@@ -0,0 +1,99 @@
+"""Content versions for videos and projects.
+
+``content_version`` is an integer on ``videos`` and ``projects`` (missing
+means 0) that is incremented by every write to the video's segments,
+regions or captions, or to the document itself. A video bump also bumps
+its project, so a project's version covers everything its export contains.
+Caches and ETags key on these versions instead of hashing payloads.
+
+The knowledge base, which is read as one tree, has a single counter in
+``counters`` (``_id: 'knowledge_base'``) bumped by every KB write. The
+same update appends the ids of the nodes the write touched to a short
+log (``changes``, one entry per version), so in-memory KB indexes can
+catch up on exactly those nodes.
+"""
+from pymongo import ReturnDocument
+
+
+def bump_project_version(db, project_id):
+    if project_id:
+        db.projects.update_one({'_id': project_id}, {'$inc': {'content_version': 1}})
+
+
+def bump_video_version(db, video_id):
+    """Bump a video and its project; returns the updated video (or None)."""
+    video = db.videos.find_one_and_update(
+        {'_id': video_id},
+        {'$inc': {'content_version': 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if video:
+        bump_project_version(db, video.get('project_id'))
+    return video
+
+
+def bump_video_versions(db, video_ids):
+    """Bump many videos and each of their projects once."""
+    if not video_ids:
+        return
+    db.videos.update_many({'_id': {'$in': video_ids}}, {'$inc': {'content_version': 1}})
+    project_ids = db.videos.distinct('project_id', {'_id': {'$in': video_ids}})
+    db.projects.update_many(
+        {'_id': {'$in': [pid for pid in project_ids if pid]}},
+        {'$inc': {'content_version': 1}}
+    )
+
+
+def video_version(video):
+    return video.get('content_version', 0)
+
+
+def project_version(project):
+    return project.get('content_version', 0)
+
+
+# KB versions kept in the change log, and node ids logged per version
+KB_CHANGE_LOG_SIZE = 100
+KB_CHANGE_MAX_IDS = 500
+
+
+def bump_kb_version(db, node_ids=None):
+    """Bump the KB version, logging the ids of the created, updated or deleted nodes.
+
+    ``None`` (or too many ids) logs an unknown change, which makes readers
+    of the log start over.
+    """
+    entry = list(node_ids) if node_ids is not None else None
+    if entry is not None and len(entry) > KB_CHANGE_MAX_IDS:
+        entry = None
+    db.counters.update_one(
+        {'_id': 'knowledge_base'},
+        {'$inc': {'version': 1},
+         '$push': {'changes': {'$each': [entry], '$slice': -KB_CHANGE_LOG_SIZE}}},
+        upsert=True
+    )
+
+
+def kb_version(db):
+    doc = db.counters.find_one({'_id': 'knowledge_base'}, {'version': 1})
+    return doc['version'] if doc else 0
+
+
+def kb_changes_since(db, version):
+    """``(current version, ids of the nodes changed since version)``.
+
+    The ids are None when the log does not reach back to ``version`` or a
+    change in between was not logged with its ids.
+    """
+    doc = db.counters.find_one({'_id': 'knowledge_base'}, {'version': 1, 'changes': 1}) or {}
+    current = doc.get('version', 0)
+    changes = doc.get('changes', [])
+    missed = current - version
+    if missed < 0 or missed > len(changes):
+        return current, None
+    node_ids = set()
+    for entry in changes[len(changes) - missed:]:
+        if entry is None:
+            return current, None
+        node_ids.update(entry)
+    return current, node_ids
@@ -0,0 +1,203 @@
+"""Shared storage of identical uploads (``video_blobs``).
+
+A blob is one file in ``uploads/videos``, keyed by the SHA-256 of its
+content. Videos uploaded with the same content point at one blob
+(``blob_id``) and share its filename, so everything derived from the file
+and named after its stem (ingest thumbnails and sprites, renditions,
+cached frames) is shared as well; ingest and rendition results are
+written to every video of the blob. ``refcount`` counts the videos using
+a blob, and the files are deleted with the last of them.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import Config
+
+VIDEO_DIR = os.path.join(Config.UPLOAD_FOLDER, 'videos')
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def ensure_blob_indexes(db):
+    db.videos.create_index('blob_id', sparse=True)
+
+
+def save_hashed(file, path):
+    """Save an uploaded file while hashing it; returns the SHA-256 hex digest."""
+    sha = hashlib.sha256()
+    with open(path, 'wb') as out:
+        while True:
+            chunk = file.stream.read(HASH_BLOCK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+            out.write(chunk)
+    return sha.hexdigest()
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def attach_blob(db, content_hash, filename):
+    """Reference the blob of ``content_hash``; returns ``(blob, reused)``.
+
+    A new blob takes ``filename``. If the content is already stored, the
+    duplicate file ``filename`` is deleted and the blob's file is used.
+    """
+    now = datetime.now(timezone.utc)
+    while True:
+        blob = db.video_blobs.find_one_and_update(
+            {'_id': content_hash},
+            {'$inc': {'refcount': 1}, '$set': {'updated_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob:
+            if blob['filename'] == filename:
+                return blob, False
+            if os.path.exists(os.path.join(VIDEO_DIR, blob['filename'])):
+                _remove_file(filename)
+                return blob, True
+            # The stored copy went missing: this upload replaces it
+            db.video_blobs.update_one({'_id': content_hash}, {'$set': {'filename': filename}})
+            db.videos.update_many({'blob_id': content_hash}, {'$set': {'filename': filename}})
+            return dict(blob, filename=filename), False
+        try:
+            blob = {
+                '_id': content_hash,
+                'filename': filename,
+                'file_size': os.path.getsize(os.path.join(VIDEO_DIR, filename)),
+                'refcount': 1,
+                'created_at': now,
+                'updated_at': now
+            }
+            db.video_blobs.insert_one(blob)
+            return blob, False
+        except DuplicateKeyError:
+            continue  # the same content was stored concurrently: reference it
+
+
+def shared_video_ids(db, video):
+    """Ids of the videos using ``video``'s file, ``video`` included."""
+    if not video.get('blob_id'):
+        return [video['_id']]
+    return [v['_id'] for v in db.videos.find({'blob_id': video['blob_id']}, {'_id': 1})]
+
+
+def start_video_ingest(db, video, on_ready=None):
+    """Ingest a new video unless a video of the same file already was or is being ingested.
+
+    A ready duplicate's result (metadata, keyframe index, thumbnails,
+    sprites, renditions) is copied; a duplicate still processing writes
+    its result to this video too when it finishes.
+    """
+    from utils.ingest import copy_ingest_result, start_ingest
+    if video.get('blob_id'):
+        duplicates = list(db.videos.find({
+            'blob_id': video['blob_id'], '_id': {'$ne': video['_id']},
+            'status': {'$in': ['ready', 'processing']}
+        }))
+        source = next((v for v in duplicates if v['status'] == 'ready'), None)
+        if source:
+            copy_ingest_result(db, source, video)
+            return 'ready'
+        if duplicates:
+            db.videos.update_one({'_id': video['_id']}, {'$set': {
+                'status': 'processing', 'updated_at': datetime.now(timezone.utc)
+            }})
+            return 'processing'
+    start_ingest(db, video, on_ready=on_ready)
+    return 'processing'
+
+
+def _release(db, video, deleting):
+    """Drop ``video``'s blob reference; True if its files are no longer used."""
+    blob_id = video.get('blob_id')
+    if not blob_id:
+        return True
+    blob = db.video_blobs.find_one_and_update(
+        {'_id': blob_id}, {'$inc': {'refcount': -1}}, return_document=ReturnDocument.AFTER
+    )
+    if blob is None:
+        # No blob record: unused once no other video points at the file
+        return not db.videos.count_documents({'blob_id': blob_id, '_id': {'$nin': deleting}}, limit=1)
+    if blob['refcount'] > 0:
+        return False
+    return db.video_blobs.delete_one({'_id': blob_id, 'refcount': {'$lte': 0}}).deleted_count == 1
+
+
+def _remove_file(filename):
+    try:
+        os.remove(os.path.join(VIDEO_DIR, filename))
+    except OSError:
+        pass
+
+
+def _remove_uploaded_thumbnail(video):
+    """Delete the thumbnail sent with the upload (not one generated by ingest, which may be shared)."""
+    name = video.get('thumbnail')
+    if name and name not in (video.get('thumbnails') or {}).values():
+        try:
+            os.remove(os.path.join(Config.UPLOAD_FOLDER, 'thumbnails', name))
+        except OSError:
+            pass
+
+
+def release_video_files(db, video_ids):
+    """Drop the keyframe indexes and files of videos being deleted.
+
+    The video file and its derived files are removed once no remaining
+    video shares them.
+    """
+    from utils.ingest import remove_derived_files
+    projection = {'filename': 1, 'blob_id': 1, 'thumbnail': 1, 'thumbnails': 1, 'sprites': 1, 'renditions': 1}
+    for video in db.videos.find({'_id': {'$in': video_ids}}, projection):
+        _remove_uploaded_thumbnail(video)
+        if not _release(db, video, video_ids):
+            continue
+        remove_derived_files(video)
+        if video.get('filename'):
+            _remove_file(video['filename'])
+    db.video_keyframes.delete_many({'video_id': {'$in': video_ids}})
+
+
+def dedupe_videos(db):
+    """Attach existing videos to blobs, merging copies of the same file.
+
+    Returns ``(videos attached, duplicate files removed)``.
+    """
+    from utils.ingest import copy_ingest_result, remove_derived_files
+    attached = merged = 0
+    for video in db.videos.find({'blob_id': {'$exists': False}}).sort('_id', 1):
+        path = os.path.join(VIDEO_DIR, video.get('filename', ''))
+        if not video.get('filename') or not os.path.isfile(path):
+            continue
+        content_hash = video.get('content_hash') or hash_file(path)
+        # Keep this copy's derived files in hand before it is repointed
+        previous = dict(video)
+        blob, reused = attach_blob(db, content_hash, video['filename'])
+        db.videos.update_one({'_id': video['_id']}, {'$set': {
+            'blob_id': content_hash, 'content_hash': content_hash, 'filename': blob['filename']
+        }})
+        attached += 1
+        if not reused:
+            continue
+        merged += 1
+        remove_derived_files(previous)
+        stale = {'thumbnails': '', 'sprites': '', 'renditions': ''}
+        if previous.get('thumbnail') in (previous.get('thumbnails') or {}).values():
+            stale['thumbnail'] = ''
+        # Without a ready duplicate to copy from, ingest-videos picks it up again
+        db.videos.update_one({'_id': video['_id']}, {'$unset': stale, '$set': {'status': 'uploaded'}})
+        video = db.videos.find_one({'_id': video['_id']})
+        source = db.videos.find_one({
+            'blob_id': content_hash, '_id': {'$ne': video['_id']}, 'status': 'ready'
+        })
+        if source:
+            copy_ingest_result(db, source, video)
+    return attached, merged
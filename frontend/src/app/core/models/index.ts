@@ -84,6 +84,11 @@ export interface VideoItem {
   current_step: number;
   subpart_id?: string;
   url: string;
+  original_url?: string;
+  rendition?: string;
+  renditions?: { [name: string]: VideoRendition };
+  fps?: number;
+  sprites?: VideoSprites | null;
   thumbnail_url?: string;
   tags?: string[];
   uploaded_by: string;
@@ -106,6 +111,25 @@ export interface VideoItem {
   created_at: string;
 }
 
+export interface VideoRendition {
+  url: string;
+  width: number;
+  height: number;
+  all_intra: boolean;
+}
+
+export interface VideoSprites {
+  interval: number;
+  count: number;
+  tile_width: number;
+  tile_height: number;
+  columns: number;
+  rows: number;
+  sheets: string[];
+  vtt_url: string;
+  index_url: string;
+}
+
 export interface VideoSegment {
   id: string;
   video_id?: string;
@@ -1,6 +1,6 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { Observable, from, mergeMap, retry, switchMap, tap, timer, toArray } from 'rxjs';
 import { VideoItem, VideoSegment, ObjectRegion, SegmentationResponse, Caption, Category } from '../models';
 
 @Injectable({ providedIn: 'root' })
@@ -9,6 +9,8 @@ export class VideoService {
   private readonly SEGMENTS_API = '/api/segments';
   private readonly ANNOTATIONS_API = '/api/annotations';
   private readonly CATEGORIES_API = '/api/categories';
+  private readonly UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+  private readonly UPLOAD_PARALLEL_CHUNKS = 3;
 
   constructor(private http: HttpClient) {}
 
@@ -23,6 +25,43 @@ export class VideoService {
     return this.http.post(`${this.API}/upload`, formData);
   }
 
+  /** Chunked, resumable upload: chunks go up in parallel and are retried on network errors. */
+  uploadVideoResumable(projectId: string, file: File, subpartId?: string, duration?: number, thumbnail?: Blob,
+                       onProgress?: (fraction: number) => void): Observable<any> {
+    const uploads = `${this.API}/uploads`;
+    const body = { project_id: projectId, subpart_id: subpartId, filename: file.name, size: file.size };
+    return this.http.post<{ upload_id: string; chunk_size: number }>(uploads, body).pipe(
+      switchMap((session) => {
+        const chunkSize = Math.min(session.chunk_size, this.UPLOAD_CHUNK_SIZE);
+        const offsets: number[] = [];
+        for (let offset = 0; offset < file.size; offset += chunkSize) offsets.push(offset);
+        let sent = 0;
+
+        return from(offsets).pipe(
+          mergeMap((offset) => {
+            const chunk = file.slice(offset, offset + chunkSize);
+            return this.http.patch(`${uploads}/${session.upload_id}`, chunk, {
+              headers: { 'Upload-Offset': offset.toString(), 'Content-Type': 'application/offset+octet-stream' }
+            }).pipe(
+              retry({ count: 3, delay: (_err, attempt) => timer(attempt * 1000) }),
+              tap(() => {
+                sent += chunk.size;
+                onProgress?.(sent / file.size);
+              })
+            );
+          }, this.UPLOAD_PARALLEL_CHUNKS),
+          toArray(),
+          switchMap(() => {
+            const formData = new FormData();
+            if (duration) formData.append('duration', duration.toString());
+            if (thumbnail) formData.append('thumbnail', thumbnail, 'thumb.jpg');
+            return this.http.post(`${uploads}/${session.upload_id}/finalize`, formData);
+          })
+        );
+      })
+    );
+  }
+
   getProjectVideos(projectId: string): Observable<VideoItem[]> {
     return this.http.get<VideoItem[]>(`${this.API}/project/${projectId}`);
   }
@@ -305,7 +305,10 @@ export class ProjectDetailComponent implements OnInit {
       this.uploadProgress = Math.round(((index) / files.length) * 100);
 
       this.generateThumbnail(file).then((thumbnail) => {
-        this.videoService.uploadVideo(this.project!.id, file, this.selectedSubpart!.id, undefined, thumbnail).subscribe({
+        const onProgress = (fraction: number) => {
+          this.uploadProgress = Math.round(((index + fraction) / files.length) * 100);
+        };
+        this.videoService.uploadVideoResumable(this.project!.id, file, this.selectedSubpart!.id, undefined, thumbnail, onProgress).subscribe({
           next: () => {
             uploadedCount++;
             this.uploadProgress = Math.round(((index + 1) / files.length) * 100);
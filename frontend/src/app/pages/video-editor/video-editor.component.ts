@@ -26,6 +26,12 @@ import { SettingsDialogComponent } from '../settings-dialog/settings-dialog.comp
 import { KnowledgeBaseSelectorComponent } from '../../core/components/knowledge-base-selector/knowledge-base-selector.component';
 import { VideoItem, VideoSegment, ObjectRegion, Caption, Category } from '../../core/models';
 
+interface ScrubPreview {
+  left: number;  // % of the hovered bar
+  time: number;
+  style: { [key: string]: string };
+}
+
 @Component({
   selector: 'app-video-editor',
   standalone: true,
@@ -51,6 +57,9 @@ export class VideoEditorComponent implements OnInit, AfterViewInit, OnDestroy {
   @ViewChild('segmentPreviewVideo') segmentPreviewVideoRef!: ElementRef<HTMLVideoElement>;
 
   segmentPreviewSrc = '';
+  // Sprite-sheet scrub previews (timeline and segment preview bar)
+  timelineHover: ScrubPreview | null = null;
+  segmentPreviewHover: ScrubPreview | null = null;
   segmentPreviewPlaying = false;
   segmentPreviewProgress = 0;
   segmentPreviewCurrentLabel = '0:00';
@@ -274,8 +283,9 @@ export class VideoEditorComponent implements OnInit, AfterViewInit, OnDestroy {
     this.duration = player.duration;
     this.generateTimeMarkers();
 
-    // Update video with correct duration
-    if (this.video && this.video.duration !== this.duration) {
+    // Update video with correct duration (ingested videos already have the probed
+    // values, and the player may be showing a lower-resolution rendition)
+    if (this.video && !this.video.fps && this.video.duration !== this.duration) {
       this.videoService.updateVideo(this.video.id, {
         duration: this.duration,
         width: player.videoWidth,
@@ -318,6 +328,36 @@ export class VideoEditorComponent implements OnInit, AfterViewInit, OnDestroy {
     this.videoPlayerRef.nativeElement.currentTime = pct * this.duration;
   }
 
+  onTimelineHover(event: MouseEvent): void {
+    const rect = this.timelineTrackRef.nativeElement.getBoundingClientRect();
+    const pct = Math.max(0, Math.min(1, (event.clientX - rect.left) / rect.width));
+    this.timelineHover = this.scrubPreview(pct, pct * this.duration, 64);
+  }
+
+  /**
+   * Tile of the ingest sprite sheets covering time `t`, scaled to `height` px,
+   * as CSS background properties. Null when the video has no sprites yet.
+   */
+  private scrubPreview(pct: number, t: number, height: number): ScrubPreview | null {
+    const sp = this.video?.sprites;
+    if (!sp || !sp.count) return null;
+    const i = Math.min(sp.count - 1, Math.max(0, Math.floor(t / sp.interval)));
+    const perSheet = sp.columns * sp.rows;
+    const cell = i % perSheet;
+    const scale = height / sp.tile_height;
+    return {
+      left: pct * 100,
+      time: t,
+      style: {
+        width: `${sp.tile_width * scale}px`,
+        height: `${height}px`,
+        'background-image': `url(${sp.sheets[Math.floor(i / perSheet)]})`,
+        'background-size': `${sp.columns * sp.tile_width * scale}px auto`,
+        'background-position': `-${(cell % sp.columns) * sp.tile_width * scale}px -${Math.floor(cell / sp.columns) * sp.tile_height * scale}px`
+      }
+    };
+  }
+
   generateTimeMarkers(): void {
     const count = Math.min(10, Math.floor(this.duration / 5));
     this.timeMarkers = [];
@@ -1244,6 +1284,14 @@ export class VideoEditorComponent implements OnInit, AfterViewInit, OnDestroy {
     vid.currentTime = seg.start_time + pct * (seg.end_time - seg.start_time);
   }
 
+  onSegmentPreviewHover(event: MouseEvent): void {
+    if (!this.selectedSegment) return;
+    const rect = (event.currentTarget as HTMLElement).getBoundingClientRect();
+    const pct = Math.max(0, Math.min(1, (event.clientX - rect.left) / rect.width));
+    const seg = this.selectedSegment;
+    this.segmentPreviewHover = this.scrubPreview(pct, seg.start_time + pct * (seg.end_time - seg.start_time), 90);
+  }
+
   private formatSegTime(seconds: number): string {
     const s = Math.max(0, Math.floor(seconds));
     const m = Math.floor(s / 60);